@@ -0,0 +1,24 @@
+from datetime import date
+
+from db_utils import record_user_activity
+
+# Учёт активности пользователей для аналитики администратора (DAU, новые пользователи).
+# Запись в БД — не чаще одного раза в день на пользователя: уже отмеченные за сегодня
+# пользователи хранятся в памяти и сбрасываются при смене даты.
+_seen_today = set()
+_seen_day = None
+
+
+# Outer-middleware диспетчера: отмечает пользователя, от которого пришёл апдейт
+async def track_activity(handler, event, data):
+    global _seen_day
+    user = data.get("event_from_user")
+    if user is not None and not user.is_bot:
+        today = date.today().isoformat()
+        if today != _seen_day:
+            _seen_today.clear()
+            _seen_day = today
+        if user.id not in _seen_today:
+            record_user_activity(user.id, today)
+            _seen_today.add(user.id)
+    return await handler(event, data)
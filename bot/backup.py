@@ -0,0 +1,167 @@
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from config import DATABASE_NAME, BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP
+from migrations import get_schema_version
+
+# Резервные копии БД без остановки бота.
+# Копия снимается online backup API SQLite небольшими порциями страниц (BACKUP_PAGES_PER_STEP) с паузой
+# между ними: БД блокируется только на время копирования порции, а не целиком, и копия всегда согласована,
+# в отличие от копирования файла, в который в это время пишут. Снимок проверяется (integrity_check),
+# сжимается gzip и сохраняется как todo-ГГГГММДД-ЧЧММСС-микросекунды.db.gz; хранятся последние BACKUP_KEEP снимков.
+# Запуск вручную: python bot/backup.py create|list|verify <файл>|restore <файл>
+
+SNAPSHOT_PREFIX = "todo-"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+
+def _copy_database(source_path: str, target_path: str, standalone: bool = False):
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        if standalone:
+            # Копия рабочей БД унаследовала режим WAL; снимок должен быть одним файлом без -wal/-shm
+            target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+
+# Проверка распакованной копии: (True, версия схемы) или (False, описание ошибки)
+def _check_database(path: str):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            return False, f"integrity_check: {result}"
+        return True, get_schema_version(conn)
+    except sqlite3.DatabaseError as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+
+def _decompress(snapshot_path: str, target_path: str):
+    with gzip.open(snapshot_path, "rb") as source, open(target_path, "wb") as target:
+        shutil.copyfileobj(source, target)
+
+
+def list_snapshots(directory: str = BACKUP_DIR):
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX))
+    return [os.path.join(directory, name) for name in names]
+
+
+# Сколько секунд назад снят последний снимок; None, если снимков нет
+def newest_snapshot_age(directory: str = BACKUP_DIR):
+    snapshots = list_snapshots(directory)
+    if not snapshots:
+        return None
+    return time.time() - os.path.getmtime(snapshots[-1])
+
+
+# Снимок БД в directory; возвращает путь к созданному файлу. Блокирующая функция — из бота вызывается в потоке.
+def create_snapshot(directory: str = BACKUP_DIR, database: str = DATABASE_NAME) -> str:
+    os.makedirs(directory, exist_ok=True)
+    # Промежуточные файлы с уникальными именами: снимок может одновременно снимать бот и команда create
+    descriptor, copy_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".db", dir=directory)
+    os.close(descriptor)
+    compressed_path = copy_path + ".gz"
+    try:
+        _copy_database(database, copy_path, standalone=True)
+        ok, details = _check_database(copy_path)
+        if not ok:
+            raise RuntimeError(f"backup copy is corrupted: {details}")
+        with open(copy_path, "rb") as source, gzip.open(compressed_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        # Сжатый файл появляется под итоговым именем только целиком; link не перезаписывает
+        # существующий файл, поэтому при совпадении имени берётся следующее
+        while True:
+            snapshot_path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{datetime.now():%Y%m%d-%H%M%S-%f}{SNAPSHOT_SUFFIX}")
+            try:
+                os.link(compressed_path, snapshot_path)
+                break
+            except FileExistsError:
+                continue
+    finally:
+        for path in (copy_path, compressed_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return snapshot_path
+
+
+# Удаляет старые снимки, оставляя keep последних; возвращает кол-во удалённых
+def rotate_snapshots(directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    stale = list_snapshots(directory)[:-keep] if keep > 0 else []
+    for path in stale:
+        os.remove(path)
+    return len(stale)
+
+
+# Проверка снимка: (True, версия схемы) или (False, описание ошибки)
+def verify_snapshot(snapshot_path: str):
+    copy_path = snapshot_path + ".verify"
+    try:
+        _decompress(snapshot_path, copy_path)
+        return _check_database(copy_path)
+    except (OSError, EOFError) as e:
+        return False, str(e)
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+
+# Восстановление БД из снимка (бот должен быть остановлен). Снимок сначала проверяется,
+# затем переносится в БД тем же backup API — файл БД не подменяется, WAL и открытые соединения учитываются.
+def restore_snapshot(snapshot_path: str, database: str = DATABASE_NAME):
+    copy_path = snapshot_path + ".restore"
+    try:
+        _decompress(snapshot_path, copy_path)
+        ok, details = _check_database(copy_path)
+        if not ok:
+            raise RuntimeError(f"snapshot {snapshot_path} is corrupted: {details}")
+        _copy_database(copy_path, database)
+        return details
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Резервные копии БД бота")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="каталог снимков")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="снять снимок и удалить старые")
+    commands.add_parser("list", help="список снимков")
+    commands.add_parser("verify", help="проверить снимок").add_argument("snapshot")
+    commands.add_parser("restore", help="восстановить БД из снимка (бот должен быть остановлен)").add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        print(create_snapshot(args.dir))
+        rotate_snapshots(args.dir)
+    elif args.command == "list":
+        for path in list_snapshots(args.dir):
+            print(f"{path}  {os.path.getsize(path) / 1024:.0f} KiB")
+    elif args.command == "verify":
+        ok, details = verify_snapshot(args.snapshot)
+        print(f"OK, schema version {details}" if ok else f"FAILED: {details}")
+        return 0 if ok else 1
+    else:
+        schema_version = restore_snapshot(args.snapshot)
+        print(f"Restored {DATABASE_NAME} from {args.snapshot} (schema version {schema_version})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,60 @@
+import sys
+import timeit
+
+from aiogram.filters.callback_data import CallbackData
+
+from keyboards import inline
+from keyboards.callback_codec import CompactCallbackData
+
+# Сравнение компактного формата callback-данных со стандартным форматом aiogram (pydantic CallbackData):
+# размер данных кнопки, стоимость pack/unpack и разбор нажатия, когда диспетчер перебирает фильтры всех классов.
+# Запуск: python bot/bench_callbacks.py [кол-во повторений]
+
+SAMPLES = [
+    inline.CompleteTaskCallback(filter_type="today", page=3, task_number=1234),
+    inline.EditTaskCallback(page=0, task_number=57, action="select"),
+    inline.SetReminderIntervalCallback(task_internal_id=987654, hours=12),
+    inline.MainMenuCallback(),
+]
+
+
+# Те же поля и префиксы, но со стандартной упаковкой aiogram
+def make_legacy_class(compact_class):
+    return type(f"Legacy{compact_class.__name__}", (CallbackData,), {
+        "__annotations__": {name: field.annotation for name, field in compact_class.model_fields.items()},
+        **{name: field.default for name, field in compact_class.model_fields.items() if not field.is_required()},
+    }, prefix=compact_class.__prefix__)
+
+
+def dispatch(classes, data: str):
+    # Как CallbackQueryFilter: пробуем классы по очереди до первого подходящего
+    for callback_class in classes:
+        try:
+            return callback_class.unpack(data)
+        except (TypeError, ValueError):
+            continue
+
+
+def main(number: int):
+    compact_classes = [value for value in vars(inline).values()
+                       if isinstance(value, type) and issubclass(value, CompactCallbackData) and value is not CompactCallbackData]
+    legacy_classes = {compact_class: make_legacy_class(compact_class) for compact_class in compact_classes}
+
+    print(f"{'callback':<32}{'bytes':>12}{'pack, us':>18}{'unpack, us':>18}{'dispatch, us':>20}")
+    for sample in SAMPLES:
+        legacy = legacy_classes[type(sample)](**sample.model_dump())
+        results = []
+        for instance, classes in ((legacy, list(legacy_classes.values())), (sample, compact_classes)):
+            data = instance.pack()
+            pack_time = timeit.timeit(instance.pack, number=number) / number * 1e6
+            unpack_time = timeit.timeit(lambda: type(instance).unpack(data), number=number) / number * 1e6
+            dispatch_time = timeit.timeit(lambda: dispatch(classes, data), number=number) / number * 1e6
+            results.append((len(data.encode()), pack_time, unpack_time, dispatch_time))
+        (legacy_size, *legacy_times), (compact_size, *compact_times) = results
+        print(f"{type(sample).__name__:<32}{f'{legacy_size} -> {compact_size}':>12}"
+              + "".join(f"{f'{old:.2f} -> {new:.2f}':>{width}}"
+                        for old, new, width in zip(legacy_times, compact_times, (18, 18, 20))))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -4,8 +4,56 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TOKEN = os.getenv("TOKEN")
+# Администраторы бота: user_id через запятую (ADMIN_IDS=123,456)
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if admin_id}
 DATABASE_NAME = 'todo.db'
+# Приоритеты задач: значение в БД -> (значок, название); меньшее значение выше в списке
+TASK_PRIORITIES = {1: ("🔴", "Высокий"), 2: ("🟡", "Обычный"), 3: ("🔵", "Низкий")}
+DEFAULT_TASK_PRIORITY = 2
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Общий уровень логирования
+# Уровни отдельных модулей: имя логгера=уровень через запятую (LOG_LEVELS=jobs=DEBUG,aiogram.event=INFO)
+LOG_LEVELS = dict(item.split("=", 1) for item in os.getenv("LOG_LEVELS", "aiogram.event=WARNING").replace(" ", "").split(",") if item)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json — структурированные записи, text — обычные строки
+LOG_DEBUG_SAMPLE_RATE = int(os.getenv("LOG_DEBUG_SAMPLE_RATE", "10"))  # Из частых DEBUG-записей пишется одна из N
 PAGE_SIZE = 5  # Кол-во задач на странице для пагинации
+DIGEST_PAGE_SIZE = 10  # Кол-во задач на странице ежедневной сводки
+INLINE_RESULTS_LIMIT = 20  # Кол-во задач в одной порции ответа inline-режима
+INLINE_CACHE_SECONDS = 10  # Время жизни кэша inline-результатов (и cache_time для Telegram)
+UNDO_DELETE_MINUTES = 10  # Сколько минут можно отменить удаление задачи
+COMPLETED_RETENTION_DAYS = 180  # Через сколько дней завершённые задачи переносятся в архив
+DELETED_RETENTION_DAYS = 7  # Через сколько дней удалённые задачи переносятся в архив
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))  # Допустимое время проверки `main.py --check`
+OUTBOX_BATCH_SIZE = 50  # Сколько напоминаний из очереди отправки разбирается за один запрос
+OUTBOX_MAX_ATTEMPTS = 5  # После стольких неудачных попыток напоминание уходит в dead letter ('failed')
+OUTBOX_POLL_SECONDS = 30  # Как часто отправитель проверяет очередь напоминаний
+OUTBOX_RETENTION_DAYS = 7  # Через сколько дней отправленные напоминания удаляются из очереди
+REMINDER_TASK_BUTTONS = 6  # Сколько задач с кнопкой «выполнено» показывается в одном напоминании
+REMINDER_SNOOZE_TOMORROW_HOUR = 9  # Во сколько приходит напоминание, отложенное кнопкой «Завтра»
+OUTBOX_MESSAGES_PER_SECOND = 20  # Темп отправки из очереди: уведомления общих списков приходят пачками на всех участников
+SHARED_LIST_VERSION_CHECK_SECONDS = 2  # Как долго процесс не перепроверяет в БД версию состава участников общего списка
+BLOCKED_CLEANUP_BATCH_SIZE = 200  # Сколько заблокировавших бота пользователей очищается за одну транзакцию
+BLOCKED_CLEANUP_SECONDS = 300  # Как часто запускается очистка заблокировавших бота пользователей
+BROADCAST_MESSAGES_PER_SECOND = 20  # Темп рассылки администратора (лимит Telegram — около 30 сообщений в секунду)
+BROADCAST_BATCH_SIZE = 100  # После каждой пачки сохраняется курсор рассылки и обновляется сообщение с прогрессом
+BROADCAST_POLL_SECONDS = 10  # Как часто проверяются новые рассылки
+CALLBACK_TOKEN_TTL_DAYS = 30  # Сколько дней хранятся серверные callback-данные кнопок, не поместившиеся в 64 байта
+PROFILER_MAX_SECONDS = 60  # Максимальная длительность профилирования командой /profile
+PROFILER_SAMPLE_INTERVAL = 0.005  # Интервал между снимками стека при профилировании (200 раз в секунду)
+LOOP_LAG_CHECK_SECONDS = 0.5  # Как часто измеряется задержка event loop
+LOOP_LAG_THRESHOLD_SECONDS = float(os.getenv("LOOP_LAG_THRESHOLD_SECONDS", "0.25"))  # Задержка event loop, о которой пишется в лог
+DASHBOARD_DEBOUNCE_SECONDS = 3  # Изменения задач за это время собираются в одно обновление закреплённой панели
+DASHBOARD_BATCH_SIZE = 50  # Сколько панелей обновляется за один проход
+DASHBOARD_TASKS_LIMIT = 20  # Сколько задач показывается на панели
+# Резервные копии БД (backup.py): каталог снимков, период, сколько снимков хранить
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES_PER_STEP = 256  # Страниц БД за один шаг копирования; между шагами БД доступна остальным соединениям
+BACKUP_STEP_SLEEP = 0.01  # Пауза между шагами копирования, секунды
+# Процессы-воркеры для обработки апдейтов: 0 — всё в одном процессе, N — апдейты раздаются N процессам по user_id
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_RESTART_CHECK_SECONDS = 5  # Как часто проверяется, что воркеры живы (упавший воркер перезапускается)
+DRAIN_TIMEOUT_SECONDS = 20  # Сколько секунд ждать завершения обработчиков и фоновых задач при остановке
 
 welcome_text = """
 Привет! Я твой личный ToDo бот!👋
@@ -24,4 +72,11 @@ welcome_text = """
 Для редактирования задачи используйте  /edit_task
 Для удаления задачи используйте  /delete_task
 Для просмотра напоминаний используйте  /reminders
+Для поиска задач используйте  /search
+Для просмотра повторяющихся задач используйте  /recurring
+Для настройки ежедневной сводки используйте  /digest
+Для просмотра статистики используйте  /stats
+Для просмотра задач по тегам используйте  /tags
+Для закреплённой панели задач на сегодня используйте  /dashboard
+Для общего списка задач в группе добавьте меня в чат и используйте  /share_list
 """
@@ -0,0 +1,115 @@
+import re
+from datetime import date, timedelta
+
+# Разбор сроков, написанных словами: "завтра", "в пятницу", "через 3 дня", "на выходных", "25.10", "25 октября".
+# Срок ищется одним регулярным выражением в тексте описания задачи и вырезается из него,
+# поэтому задача со сроком создаётся одним сообщением, без календаря.
+# Число с точкой считается датой уверенно, только если указан год или день и месяц записаны двумя цифрами
+# ("25.10", "03.12"); "1.5 кг", "5.5 км", "python 3.12" — скорее числа, такой срок бот предлагает подтвердить.
+
+WEEKDAYS = {
+    "понедельник": 0, "вторник": 1, "среду": 2, "среда": 2, "четверг": 3,
+    "пятницу": 4, "пятница": 4, "субботу": 5, "суббота": 5, "воскресенье": 6,
+}
+MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+
+_DATE_PATTERN = re.compile(
+    r"(?<![\w.])(?:(?:до|к|на)\s+)?(?:"
+    r"(?P<relative>сегодня|послезавтра|завтра)"
+    r"|во?\s+(?P<weekday>" + "|".join(WEEKDAYS) + r")"
+    r"|через\s+(?:(?P<count>\d{1,3})\s+)?(?P<unit>дн(?:я|ей)|день|недел(?:ю|и|ь)|месяц(?:а|ев)?)"
+    r"|(?P<weekend>выходны(?:х|е))"
+    r"|(?P<day>\d{1,2})\.(?P<month>\d{1,2})(?:\.(?P<year>\d{2}|\d{4}))?"
+    r"|(?P<text_day>\d{1,2})\s+(?P<text_month>" + "|".join(MONTHS) + r")"
+    r")(?!\w|\.\d)",
+    re.IGNORECASE,
+)
+
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.!?;:])")
+
+
+def _add_months(start: date, months: int) -> date:
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    for day in range(start.day, 27, -1):  # 31 января + 1 месяц -> последний день февраля
+        try:
+            return date(year, month, day)
+        except ValueError:
+            continue
+    return date(year, month, min(start.day, 28))
+
+
+# Ближайшая суббота (сегодня, если сегодня выходной)
+def next_weekend(today: date) -> date:
+    if today.weekday() >= 5:
+        return today
+    return today + timedelta(days=5 - today.weekday())
+
+
+def _resolve(match: re.Match, today: date):
+    groups = match.groupdict()
+    if groups["relative"]:
+        return today + timedelta(days=RELATIVE_DAYS[groups["relative"].lower()])
+    if groups["weekday"]:
+        # "в пятницу" в пятницу — следующая пятница
+        days_ahead = (WEEKDAYS[groups["weekday"].lower()] - today.weekday() - 1) % 7 + 1
+        return today + timedelta(days=days_ahead)
+    if groups["unit"]:
+        count = int(groups["count"] or 1)
+        unit = groups["unit"].lower()
+        if unit.startswith("д"):
+            return today + timedelta(days=count)
+        if unit.startswith("н"):
+            return today + timedelta(weeks=count)
+        return _add_months(today, count)
+    if groups["weekend"]:
+        return next_weekend(today)
+
+    day = int(groups["day"] or groups["text_day"])
+    month = int(groups["month"]) if groups["month"] else MONTHS[groups["text_month"].lower()]
+    year = groups["year"]
+    try:
+        if year:
+            return date(int(year) + 2000 if len(year) == 2 else int(year), month, day)
+        parsed = date(today.year, month, day)
+        # Дата без года, которая в этом году уже прошла, — в следующем году
+        return parsed if parsed >= today else parsed.replace(year=today.year + 1)
+    except ValueError:
+        return None
+
+
+# "d.m" без года, где день или месяц записан одной цифрой, может оказаться обычным числом
+def _is_certain(match: re.Match) -> bool:
+    day, month = match.group("day"), match.group("month")
+    return day is None or bool(match.group("year")) or (len(day) == 2 and len(month) == 2)
+
+
+# Срок из текста: (текст без упоминания срока, дата, уверенно ли это срок) или (исходный текст, None, False),
+# если срока в тексте нет. Уверенно распознанный срок предпочитается неуверенному ("1.5 кг мяса завтра").
+def extract_deadline(text: str, today: date):
+    found = None
+    for match in _DATE_PATTERN.finditer(text):
+        deadline = _resolve(match, today)
+        if deadline is None:
+            continue
+        certain = _is_certain(match)
+        if found is None or certain:
+            found = match, deadline, certain
+        if certain:
+            break
+    if found is None:
+        return text, None, False
+    match, deadline, certain = found
+    rest = " ".join((text[:match.start()] + " " + text[match.end():]).split())
+    rest = _SPACE_BEFORE_PUNCTUATION.sub(r"\1", rest).strip(" ,.-")
+    return rest, deadline, certain
+
+
+# Срок, введённый отдельным сообщением в ответ на вопрос о сроке (весь текст — дата, поэтому "3.12" тоже срок)
+def parse_deadline(text: str, today: date):
+    rest, deadline, certain = extract_deadline(text.strip(), today)
+    return deadline if not rest else None
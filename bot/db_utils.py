@@ -1,95 +1,27 @@
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+import calendar
 import logging
+import re
+import uuid
 
-from config import DATABASE_NAME
+from config import DATABASE_NAME, PAGE_SIZE
+from recurrence import iter_occurrences
+from migrations import run_migrations, parse_tags, USER_STATS_COUNTERS, user_stats_counter_expr
 
-# Настройка базы данных
+logger = logging.getLogger(__name__)
+
+# Настройка базы данных: применяет недостающие миграции (см. migrations.py)
 def init_db():
     conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-
-    # Создаем таблицу задач, если она не существует
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            task_number INTEGER,
-            description TEXT NOT NULL,
-            deadline TEXT,
-            status TEXT DEFAULT 'active',
-            remind_me INTEGER DEFAULT 0 -- 0: не напоминать, 1: напоминать
-        )
-    ''')
-    conn.commit()
-
-    # Проверяем и добавляем столбец task_number, если его нет
-    cursor.execute("PRAGMA table_info(tasks)")
-    columns = [col[1] for col in cursor.fetchall()]
-
-    if 'task_number' not in columns:
-        cursor.execute("ALTER TABLE tasks ADD COLUMN task_number INTEGER;")
-        conn.commit()
-        # Заполняем task_number для существующих записей
-        cursor.execute("SELECT DISTINCT user_id FROM tasks")
-        user_ids = cursor.fetchall()
-        for user_id_tuple in user_ids:
-            user_id = user_id_tuple[0]
-            cursor.execute("SELECT id FROM tasks WHERE user_id = ? ORDER BY id", (user_id,))
-            user_tasks = cursor.fetchall()
-            for i, task_id_tuple in enumerate(user_tasks):
-                task_id = task_id_tuple[0]
-                cursor.execute("UPDATE tasks SET task_number = ? WHERE id = ?", (i + 1, task_id))
-            conn.commit()
-
-    # Проверяем и добавляем столбец status, если его нет
-    if 'status' not in columns:
-        cursor.execute("ALTER TABLE tasks ADD COLUMN status TEXT DEFAULT 'active';")
-        conn.commit()
-        # Обновляем существующие задачи, чтобы они имели статус 'active'
-        cursor.execute("UPDATE tasks SET status = 'active' WHERE status IS NULL;")
-        conn.commit()
-
-    # Проверяем и добавляем столбец remind_me, если его нет
-    if 'remind_me' not in columns:
-        cursor.execute("ALTER TABLE tasks ADD COLUMN remind_me INTEGER DEFAULT 0;")
-        conn.commit()
-        # Обновляем существующие задачи, чтобы remind_me по умолчанию был 0
-        cursor.execute("UPDATE tasks SET remind_me = 0 WHERE remind_me IS NULL;")
-        conn.commit()
-
     try:
-        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_task_number ON tasks (user_id, task_number);")
-        conn.commit()
-    except sqlite3.OperationalError as e:
-        logging.warning(
-            f"Could not create unique index 'idx_user_task_number': {e}. Please check your database for duplicate (user_id, task_number) pairs if this warning persists.")
-
-    # Создаем таблицу для статуса напоминаний пользователя (для контроля частоты)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_reminder_status (
-            user_id INTEGER PRIMARY KEY,
-            last_reminded_at TEXT -- Время последнего напоминания в формате YYYY-MM-DD HH:MM:SS
-        )
-    ''')
-    conn.commit()
-
-    # Добавляем колонку интервала напоминаний, если отсутствует
-    cursor.execute("PRAGMA table_info(user_reminder_status)")
-    urs_columns = [col[1] for col in cursor.fetchall()]
-    if 'interval_hours' not in urs_columns:
-        cursor.execute("ALTER TABLE user_reminder_status ADD COLUMN interval_hours INTEGER DEFAULT 1;")
-        conn.commit()
-
-    # Создаем таблицу для статистики пользователя (счетчик завершенных задач)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_stats (
-            user_id INTEGER PRIMARY KEY,
-            completed_tasks_count INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+        run_migrations(conn)
+        # WAL: читатели не ждут писателя — важно, когда с базой работают несколько процессов (WORKER_PROCESSES).
+        # Включается после миграций: переключение записывает заголовок файла, и для новой БД
+        # auto_vacuum=INCREMENTAL уже нельзя было бы включить без VACUUM
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
 
 
 # Форматирование дедлайна
@@ -113,12 +45,25 @@ def format_deadline(deadline_str):
         return deadline_str
 
 
-# Вспомогательная функция получения задач с фильтром и статусом
+# Последняя дата, которую видит пользователь при данном фильтре — до неё создаются экземпляры повторяющихся задач
+def get_visible_window_end(filter_type: str, current_date: datetime) -> str:
+    if filter_type == "week":
+        window_end = current_date + timedelta(days=6 - current_date.weekday())
+    elif filter_type in ("month", "all") or filter_type.startswith(("priority_", "tag_")):
+        window_end = current_date.replace(day=calendar.monthrange(current_date.year, current_date.month)[1])
+    else:
+        window_end = current_date
+    return window_end.strftime('%Y-%m-%d')
+
+
+# Вспомогательная функция получения задач с фильтром и статусом: [(id, task_number, description, deadline, priority), ...].
+# Кроме фильтров по сроку поддерживаются "priority_<приоритет>" и "tag_<id тега>".
+# Активные задачи упорядочены по приоритету, затем по номеру (индекс idx_tasks_user_status_priority).
 def get_tasks_for_user(user_id: int, filter_type: str, status_filter: str = 'active', remind_me_filter: bool = None):
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
 
-    query = "SELECT id, task_number, description, deadline FROM tasks WHERE user_id = ? AND status = ?"
+    query = "SELECT id, task_number, description, deadline, priority FROM tasks WHERE user_id = ? AND status = ?"
     params = [user_id, status_filter]
 
     if remind_me_filter is not None:
@@ -127,6 +72,9 @@ def get_tasks_for_user(user_id: int, filter_type: str, status_filter: str = 'act
 
     current_date = datetime.now()
 
+    if status_filter == 'active':
+        materialize_recurring_tasks(get_visible_window_end(filter_type, current_date), user_id)
+
     if filter_type == "today":
         query += " AND deadline = ?"
         params.append(current_date.strftime('%Y-%m-%d'))
@@ -138,10 +86,1255 @@ def get_tasks_for_user(user_id: int, filter_type: str, status_filter: str = 'act
     elif filter_type == "month":
         query += " AND strftime('%Y-%m', deadline) = strftime('%Y-%m', ?)"
         params.append(current_date.strftime('%Y-%m-%d'))
+    elif filter_type == "overdue":
+        query += " AND deadline < ?"
+        params.append(current_date.strftime('%Y-%m-%d'))
+    elif filter_type == "due":
+        # Задачи на сегодня и просроченные (используется ежедневной сводкой)
+        query += " AND deadline <= ?"
+        params.append(current_date.strftime('%Y-%m-%d'))
+    elif filter_type.startswith("priority_"):
+        query += " AND priority = ?"
+        params.append(int(filter_type.removeprefix("priority_")))
+    elif filter_type.startswith("tag_"):
+        query += " AND id IN (SELECT task_id FROM task_tags WHERE tag_id = ?)"
+        params.append(int(filter_type.removeprefix("tag_")))
 
-    query += " ORDER BY task_number"
+    query += " ORDER BY priority, task_number" if status_filter == 'active' else " ORDER BY task_number"
     cursor.execute(query, tuple(params))
     tasks = cursor.fetchall()
     conn.close()
     return tasks
 
+
+
+# Настройки ежедневной сводки пользователя: (digest_hour, last_sent_date) или None
+def get_user_digest(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT digest_hour, last_sent_date FROM user_digest WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def set_user_digest(user_id: int, hour: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO user_digest (user_id, digest_hour) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET digest_hour = excluded.digest_hour
+    """, (user_id, hour))
+    conn.commit()
+    conn.close()
+
+
+def disable_user_digest(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_digest WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+
+# Один запрос на всех пользователей, чья сводка приходится на этот час и ещё не отправлена сегодня.
+# Возвращает {user_id: [(id, task_number, description, deadline, priority), ...]}; у пользователей
+# без задач список пустой — их тоже нужно отметить, чтобы не выбирать повторно.
+def get_due_digests(hour: int, date_str: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT d.user_id, t.id, t.task_number, t.description, t.deadline, t.priority
+        FROM user_digest d
+        LEFT JOIN tasks t ON t.user_id = d.user_id AND t.status = 'active'
+                         AND t.remind_me = 1 AND t.deadline <= ?
+        WHERE d.digest_hour = ? AND (d.last_sent_date IS NULL OR d.last_sent_date < ?)
+          AND d.user_id NOT IN (SELECT user_id FROM blocked_users)
+        ORDER BY d.user_id, t.priority, t.task_number
+    """, (date_str, hour, date_str))
+    digests = {}
+    for user_id, task_id, task_number, description, deadline, priority in cursor.fetchall():
+        user_tasks = digests.setdefault(user_id, [])
+        if task_id is not None:
+            user_tasks.append((task_id, task_number, description, deadline, priority))
+    conn.close()
+    return digests
+
+
+def mark_digests_sent(user_ids, date_str: str):
+    if not user_ids:
+        return
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE user_digest SET last_sent_date = ? WHERE user_id = ?",
+                       [(date_str, user_id) for user_id in user_ids])
+    conn.commit()
+    conn.close()
+
+
+# Пользователь заблокировал бота: только запись в blocked_users, без тяжёлых обновлений на горячем пути
+# отправки — напоминания и сводку отключает фоновая очистка (cleanup_blocked_users)
+def record_blocked_user(user_id: int, reason: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO blocked_users (user_id, reason, blocked_at) VALUES (?, ?, ?)",
+                   (user_id, reason, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    conn.close()
+
+
+# Пользователь снова разблокировал бота. Отключённые напоминания не восстанавливаются — их включает сам пользователь.
+def unblock_user(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM blocked_users WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+
+# Очистка заблокировавших бота пользователей пачками по batch_size: удаление из user_reminder_status и
+# user_digest, отключение напоминаний по задачам, перевод их неотправленных напоминаний в 'failed'.
+# Каждая пачка — одна транзакция. Возвращает кол-во очищенных пользователей.
+def cleanup_blocked_users(batch_size: int = 200):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cleaned_count = 0
+    while True:
+        cursor.execute("SELECT user_id FROM blocked_users WHERE cleaned_at IS NULL ORDER BY blocked_at LIMIT ?",
+                       (batch_size,))
+        user_ids = [row[0] for row in cursor.fetchall()]
+        if not user_ids:
+            break
+
+        placeholders = ",".join("?" * len(user_ids))
+        cursor.execute(f"DELETE FROM user_reminder_status WHERE user_id IN ({placeholders})", user_ids)
+        cursor.execute(f"DELETE FROM user_digest WHERE user_id IN ({placeholders})", user_ids)
+        cursor.execute(f"DELETE FROM dashboards WHERE user_id IN ({placeholders})", user_ids)
+        cursor.execute(f"UPDATE tasks SET remind_me = 0 WHERE user_id IN ({placeholders}) AND remind_me = 1", user_ids)
+        cursor.execute(f"UPDATE task_recurrences SET remind_me = 0 WHERE user_id IN ({placeholders}) AND remind_me = 1", user_ids)
+        cursor.execute(f"""
+            UPDATE reminder_outbox SET status = 'failed', last_error = 'user blocked the bot'
+            WHERE status = 'pending' AND user_id IN ({placeholders})
+        """, user_ids)
+        cursor.execute(f"UPDATE blocked_users SET cleaned_at = ? WHERE user_id IN ({placeholders})",
+                       (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), *user_ids))
+        conn.commit()
+        cleaned_count += len(user_ids)
+        if len(user_ids) < batch_size:
+            break
+    conn.close()
+    return cleaned_count
+
+
+def is_overdue_deadline(deadline_str) -> int:
+    if not deadline_str:
+        return 0
+    return 1 if deadline_str < datetime.now().strftime('%Y-%m-%d') else 0
+
+
+def get_job_state(name: str, default=None):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM job_state WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else default
+
+
+def _set_job_state(cursor, name: str, value: str):
+    cursor.execute("""
+        INSERT INTO job_state (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, (name, value))
+
+
+# Инкрементальная пометка просроченных задач.
+# Обходим индекс (status, deadline) начиная с сохранённой отметки (deadline, id) до вчерашнего дня,
+# пачками по batch_size; каждая пачка и сдвиг отметки — одна транзакция, поэтому после падения
+# обход продолжается с места остановки. Пользователям с напоминаниями по новым просроченным задачам
+# сбрасываем last_reminded_at — они попадут в ближайший проход напоминаний.
+# Возвращает (кол-во помеченных задач, множество user_id для напоминания).
+def mark_overdue_tasks(batch_size: int = 500):
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT value FROM job_state WHERE name = 'overdue_hwm'")
+    row = cursor.fetchone()
+    hwm_deadline, hwm_id = row[0].split("|") if row else ("", "0")
+    hwm_id = int(hwm_id)
+
+    marked_count = 0
+    users_to_remind = set()
+    while True:
+        cursor.execute("""
+            SELECT id, user_id, remind_me, deadline FROM tasks
+            WHERE status = 'active' AND (deadline, id) > (?, ?) AND deadline < ?
+            ORDER BY deadline, id
+            LIMIT ?
+        """, (hwm_deadline, hwm_id, today_str, batch_size))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+
+        cursor.executemany("UPDATE tasks SET overdue = 1 WHERE id = ?", [(task_id,) for task_id, _, _, _ in batch])
+        batch_users = {user_id for _, user_id, remind_me, _ in batch if remind_me}
+        cursor.executemany("UPDATE user_reminder_status SET last_reminded_at = NULL WHERE user_id = ?",
+                           [(user_id,) for user_id in batch_users])
+        hwm_id, hwm_deadline = batch[-1][0], batch[-1][3]
+        _set_job_state(cursor, "overdue_hwm", f"{hwm_deadline}|{hwm_id}")
+        conn.commit()
+
+        marked_count += len(batch)
+        users_to_remind |= batch_users
+        if len(batch) < batch_size:
+            break
+
+    conn.close()
+    return marked_count, users_to_remind
+
+
+# Привязка задачи к тегам из её описания (без commit); прежние связи задачи заменяются
+def _set_task_tags(cursor, task_id: int, user_id: int, description: str):
+    cursor.execute("DELETE FROM task_tags WHERE task_id = ?", (task_id,))
+    tags = parse_tags(description)
+    if not tags:
+        return
+    cursor.executemany("INSERT OR IGNORE INTO tags (user_id, name) VALUES (?, ?)", [(user_id, tag) for tag in tags])
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO task_tags (tag_id, task_id)
+        SELECT id, ? FROM tags WHERE user_id = ? AND name IN ({",".join("?" * len(tags))})
+    """, (task_id, user_id, *tags))
+
+
+# Добавление новой активной задачи; возвращает (id, task_number)
+def add_task(user_id: int, description: str, deadline_str: str = None):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+
+    # Номер вычисляется в том же запросе, что и вставка: в общий список группы задачи могут
+    # одновременно добавлять несколько участников (и несколько процессов)
+    cursor.execute("""
+        INSERT INTO tasks (user_id, task_number, description, deadline, status, remind_me, overdue, created_at)
+        SELECT ?, COALESCE(MAX(task_number), 0) + 1, ?, ?, 'active', 0, ?, ? FROM tasks WHERE user_id = ?
+        RETURNING id, task_number
+    """, (user_id, description, deadline_str, is_overdue_deadline(deadline_str),
+          datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user_id))
+    internal_task_id, new_task_number = cursor.fetchone()
+    _set_task_tags(cursor, internal_task_id, user_id, description)
+
+    if new_task_number == 1:
+        cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, completed_tasks_count) VALUES (?, 0)", (user_id,))
+    conn.commit()
+    conn.close()
+    return internal_task_id, new_task_number
+
+
+# Новое описание активной задачи вместе с её тегами. Возвращает True, если задача обновлена.
+def update_task_description(task_internal_id: int, user_id: int, description: str) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET description = ? WHERE id = ? AND user_id = ? AND status = 'active'",
+                   (description, task_internal_id, user_id))
+    updated = cursor.rowcount > 0
+    if updated:
+        _set_task_tags(cursor, task_internal_id, user_id, description)
+    conn.commit()
+    conn.close()
+    return updated
+
+
+# Новый срок активной задачи с пересчётом признака просрочки. Возвращает True, если задача обновлена.
+def update_task_deadline(task_internal_id: int, user_id: int, deadline_str: str) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET deadline = ?, overdue = ? WHERE id = ? AND user_id = ? AND status = 'active'",
+                   (deadline_str, is_overdue_deadline(deadline_str), task_internal_id, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def set_task_priority(task_internal_id: int, user_id: int, priority: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET priority = ? WHERE id = ? AND user_id = ? AND status = 'active'",
+                   (priority, task_internal_id, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# Теги пользователя с количеством активных задач: [(id, name, active_count), ...] по имени; теги без активных задач не показываются
+def get_user_tags(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT g.id, g.name, COUNT(*) FROM tags g
+        JOIN task_tags tt ON tt.tag_id = g.id
+        JOIN tasks t ON t.id = tt.task_id AND t.status = 'active'
+        WHERE g.user_id = ?
+        GROUP BY g.id
+        ORDER BY g.name
+    """, (user_id,))
+    tags = cursor.fetchall()
+    conn.close()
+    return tags
+
+
+def get_tag_name(user_id: int, tag_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM tags WHERE id = ? AND user_id = ?", (tag_id, user_id))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# Страница активных задач пользователя (без выборки всего списка) — в том же порядке, что и список
+# задач в get_tasks_for_user: по приоритету, затем по номеру (индекс idx_tasks_user_status_priority).
+# Возвращает (задачи страницы, есть ли следующая страница).
+def get_active_tasks_page(user_id: int, page: int = 0, page_size: int = PAGE_SIZE):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, task_number, description, deadline FROM tasks
+        WHERE user_id = ? AND status = 'active'
+        ORDER BY priority, task_number
+        LIMIT ? OFFSET ?
+    """, (user_id, page_size + 1, page * page_size))
+    tasks = cursor.fetchall()
+    conn.close()
+    return tasks[:page_size], len(tasks) > page_size
+
+
+# Последние limit активных задач пользователя (по возрастанию номера) — для краткого списка /list_tasks:
+# [(id, task_number, description, deadline, priority), ...]
+def get_latest_active_tasks(user_id: int, limit: int):
+    materialize_recurring_tasks(get_visible_window_end("all", datetime.now()), user_id)
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, task_number, description, deadline, priority FROM tasks
+        WHERE user_id = ? AND status = 'active'
+        ORDER BY task_number DESC
+        LIMIT ?
+    """, (user_id, limit))
+    tasks = cursor.fetchall()
+    conn.close()
+    return tasks[::-1]
+
+
+# Страница задач для меню выбора: если запрошенная страница опустела (задачи удалили/завершили),
+# возвращается последняя непустая. Возвращает (задачи, номер страницы, есть ли следующая).
+def get_selection_page(user_id: int, page: int = 0, page_size: int = PAGE_SIZE):
+    tasks, has_next = get_active_tasks_page(user_id, page, page_size)
+    if not tasks and page > 0:
+        conn = sqlite3.connect(DATABASE_NAME)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ? AND status = 'active'", (user_id,))
+        active_count = cursor.fetchone()[0]
+        conn.close()
+        if active_count:
+            page = (active_count - 1) // page_size
+            tasks, has_next = get_active_tasks_page(user_id, page, page_size)
+        else:
+            page = 0
+    return tasks, page, has_next
+
+
+# Одна задача пользователя по её номеру: (id, task_number, description, deadline) или None
+def get_task_by_number(user_id: int, task_number: int, status_filter: str = 'active'):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, task_number, description, deadline FROM tasks WHERE user_id = ? AND task_number = ? AND status = ?",
+        (user_id, task_number, status_filter))
+    task = cursor.fetchone()
+    conn.close()
+    return task
+
+
+# Ленивое создание экземпляров повторяющихся задач по until_date_str включительно
+# (для одного пользователя или для всех, если user_id не задан — так делает движок напоминаний).
+# Пропущенные повторения в прошлом схлопываются в одно: неактивный месяц не превращается
+# в десятки просроченных задач. Экземпляры и сдвиг materialized_until пишутся одной транзакцией.
+def materialize_recurring_tasks(until_date_str: str, user_id: int = None):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+
+    query = """
+        SELECT id, user_id, description, rule, start_date, remind_me, materialized_until, priority
+        FROM task_recurrences WHERE active = 1 AND materialized_until < ?
+    """
+    params = [until_date_str]
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    cursor.execute(query, tuple(params))
+    recurrences = cursor.fetchall()
+
+    today = date.today()
+    until = date.fromisoformat(until_date_str)
+    created_count = 0
+    for recurrence_id, rec_user_id, description, rule, start_date, remind_me, materialized_until, priority in recurrences:
+        try:
+            occurrences = list(iter_occurrences(rule, date.fromisoformat(start_date),
+                                                 date.fromisoformat(materialized_until), until))
+        except ValueError as e:
+            logger.error("Invalid recurrence rule %r for recurrence %s: %s", rule, recurrence_id, e)
+            continue
+
+        past = [d for d in occurrences if d < today]
+        occurrences = past[-1:] + [d for d in occurrences if d >= today]
+
+        # Экземпляры правила создаются одной транзакцией с блокировкой на запись: фоновая задача и команда
+        # пользователя (или другой процесс) могут материализовать то же правило одновременно.
+        # Номер задачи вычисляется в самой вставке, как в add_task.
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("UPDATE task_recurrences SET materialized_until = ? WHERE id = ? AND materialized_until = ?",
+                       (until_date_str, recurrence_id, materialized_until))
+        if cursor.rowcount == 0:
+            # Правило уже материализовал кто-то другой
+            conn.rollback()
+            continue
+        for occurrence in occurrences:
+            deadline_str = occurrence.strftime('%Y-%m-%d')
+            cursor.execute("""
+                INSERT INTO tasks (user_id, task_number, description, deadline, status, remind_me, overdue, recurrence_id,
+                                   created_at, priority)
+                SELECT ?, COALESCE(MAX(task_number), 0) + 1, ?, ?, 'active', ?, ?, ?, ?, ? FROM tasks WHERE user_id = ?
+                RETURNING id
+            """, (rec_user_id, description, deadline_str, remind_me, is_overdue_deadline(deadline_str), recurrence_id,
+                  datetime.now().strftime('%Y-%m-%d %H:%M:%S'), priority, rec_user_id))
+            _set_task_tags(cursor, cursor.fetchone()[0], rec_user_id, description)
+        conn.commit()
+        created_count += len(occurrences)
+
+    conn.close()
+    return created_count
+
+
+# Делает существующую задачу первым экземпляром повторяющейся. Возвращает id правила или None.
+def create_recurrence_from_task(task_internal_id: int, user_id: int, rule: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT description, deadline, remind_me, recurrence_id, priority FROM tasks
+            WHERE id = ? AND user_id = ? AND status = 'active'
+        """, (task_internal_id, user_id))
+        task = cursor.fetchone()
+        if not task or not task[1]:
+            return None
+        description, deadline, remind_me, existing_recurrence_id, priority = task
+
+        if existing_recurrence_id:
+            cursor.execute("UPDATE task_recurrences SET rule = ?, priority = ?, active = 1 WHERE id = ? AND user_id = ?",
+                           (rule, priority, existing_recurrence_id, user_id))
+            conn.commit()
+            return existing_recurrence_id
+
+        cursor.execute("""
+            INSERT INTO task_recurrences (user_id, description, rule, start_date, remind_me, materialized_until, priority)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, description, rule, deadline, remind_me, deadline, priority))
+        recurrence_id = cursor.lastrowid
+        cursor.execute("UPDATE tasks SET recurrence_id = ? WHERE id = ?", (recurrence_id, task_internal_id))
+        conn.commit()
+        return recurrence_id
+    finally:
+        conn.close()
+
+
+def get_recurrences_for_user(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, description, rule, start_date FROM task_recurrences
+        WHERE user_id = ? AND active = 1 ORDER BY id
+    """, (user_id,))
+    recurrences = cursor.fetchall()
+    conn.close()
+    return recurrences
+
+
+# Останавливает повторение; уже созданные экземпляры остаются обычными задачами
+def stop_recurrence(recurrence_id: int, user_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE task_recurrences SET active = 0 WHERE id = ? AND user_id = ?", (recurrence_id, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# Поиск задач пользователя (включая завершённые) по словам из описания, с ранжированием bm25.
+# Каждое слово ищется по префиксу; status_filter ограничивает статус задач. Возвращает (задачи страницы, есть ли следующая страница);
+# задача — (id, task_number, description, deadline, status).
+def search_tasks(user_id: int, query_text: str, page: int = 0, page_size: int = PAGE_SIZE, status_filter: str = None):
+    terms = re.findall(r"\w+", query_text.lower())
+    if not terms:
+        return [], False
+
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'")
+    if cursor.fetchone():
+        # Владелец — фраза в кавычках: у общего списка группы id отрицательный, "u-100123" без кавычек
+        # FTS5 разбирает как оператор "-" и имя столбца
+        match_expr = f'owner:"u{int(user_id)}" AND ' + " AND ".join(f'description:"{term}"*' for term in terms)
+        cursor.execute("""
+            SELECT t.id, t.task_number, t.description, t.deadline, t.status
+            FROM tasks_fts f JOIN tasks t ON t.id = f.rowid
+            WHERE tasks_fts MATCH ? AND t.status != 'deleted' AND (? IS NULL OR t.status = ?)
+            ORDER BY f.rank
+            LIMIT ? OFFSET ?
+        """, (match_expr, status_filter, status_filter, page_size + 1, page * page_size))
+    else:
+        query = "SELECT id, task_number, description, deadline, status FROM tasks WHERE user_id = ? AND status != 'deleted'"
+        params = [user_id]
+        for term in terms:
+            query += " AND description LIKE ?"
+            params.append(f"%{term}%")
+        if status_filter is not None:
+            query += " AND status = ?"
+            params.append(status_filter)
+        query += " ORDER BY status, task_number DESC LIMIT ? OFFSET ?"
+        params.extend([page_size + 1, page * page_size])
+        cursor.execute(query, tuple(params))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows[:page_size], len(rows) > page_size
+
+
+# Мягкое удаление: задача скрывается из всех списков, но её можно восстановить в течение окна отмены
+def soft_delete_task(task_internal_id: int, user_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE tasks SET status = 'deleted', deleted_at = ?, remind_me = 0
+        WHERE id = ? AND user_id = ? AND status = 'active'
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), task_internal_id, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def restore_deleted_task(task_internal_id: int, user_id: int, window_minutes: int) -> bool:
+    window_start = (datetime.now() - timedelta(minutes=window_minutes)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE tasks SET status = 'active', deleted_at = NULL,
+            overdue = CASE WHEN deadline < ? THEN 1 ELSE 0 END
+        WHERE id = ? AND user_id = ? AND status = 'deleted' AND deleted_at >= ?
+    """, (datetime.now().strftime('%Y-%m-%d'), task_internal_id, user_id, window_start))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# Перенос старых завершённых и удалённых задач в tasks_archive пачками по batch_size.
+# Каждая пачка — отдельная транзакция (копирование + удаление), чтобы не держать долгую блокировку записи.
+# Возвращает кол-во перенесённых задач.
+def archive_old_tasks(completed_before: str, deleted_before: str, batch_size: int = 500):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    archived_count = 0
+    for status, column, threshold in (('completed', 'completed_at', completed_before),
+                                      ('deleted', 'deleted_at', deleted_before)):
+        while True:
+            cursor.execute(f"""
+                SELECT id FROM tasks WHERE status = ? AND {column} < ?
+                ORDER BY {column} LIMIT ?
+            """, (status, threshold, batch_size))
+            task_ids = [row[0] for row in cursor.fetchall()]
+            if not task_ids:
+                break
+
+            placeholders = ",".join("?" * len(task_ids))
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO tasks_archive
+                    (id, user_id, task_number, description, deadline, status, completed_at, deleted_at, archived_at)
+                SELECT id, user_id, task_number, description, deadline, status, completed_at, deleted_at, ?
+                FROM tasks WHERE id IN ({placeholders})
+            """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), *task_ids))
+            cursor.execute(f"DELETE FROM tasks WHERE id IN ({placeholders})", task_ids)
+            conn.commit()
+            archived_count += len(task_ids)
+            if len(task_ids) < batch_size:
+                break
+    conn.close()
+    return archived_count
+
+
+# Возврат свободных страниц файлу БД небольшими порциями (нужен auto_vacuum = INCREMENTAL)
+def incremental_vacuum(max_pages: int = 1000):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA freelist_count")
+    free_pages = cursor.fetchone()[0]
+    if free_pages:
+        cursor.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        cursor.fetchall()
+    conn.close()
+    return min(free_pages, max_pages)
+
+
+# Постановка напоминаний в очередь отправки. reminders — [(user_id, dedup_key, text, button_filter, reply_markup)].
+# Вставка в reminder_outbox и отметка last_reminded_at — одна транзакция: после падения
+# напоминание либо уже в очереди и отмечено, либо не поставлено вовсе. Возвращает кол-во новых записей.
+def enqueue_reminders(reminders, reminded_at: str):
+    if not reminders:
+        return 0
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    queued_count = 0
+    for user_id, dedup_key, text, button_filter, reply_markup in reminders:
+        cursor.execute("""
+            INSERT OR IGNORE INTO reminder_outbox (user_id, dedup_key, text, button_filter, reply_markup, status,
+                                                   next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)
+        """, (user_id, dedup_key, text, button_filter, reply_markup, reminded_at, reminded_at))
+        queued_count += cursor.rowcount
+    cursor.executemany("UPDATE user_reminder_status SET last_reminded_at = ? WHERE user_id = ?",
+                       [(reminded_at, reminder[0]) for reminder in reminders])
+    conn.commit()
+    conn.close()
+    return queued_count
+
+
+# Пачка напоминаний, готовых к отправке: [(id, user_id, text, button_filter, reply_markup, attempts), ...]
+def get_pending_outbox(now_str: str, limit: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, user_id, text, button_filter, reply_markup, attempts FROM reminder_outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+          AND user_id NOT IN (SELECT user_id FROM blocked_users)
+        ORDER BY next_attempt_at, id LIMIT ?
+    """, (now_str, limit))
+    messages = cursor.fetchall()
+    conn.close()
+    return messages
+
+
+def mark_outbox_sent(message_id: int, sent_at: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE reminder_outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL
+        WHERE id = ?
+    """, (sent_at, message_id))
+    conn.commit()
+    conn.close()
+
+
+# Неудачная попытка отправки. Если next_attempt_at не задан или попытки исчерпаны (max_attempts),
+# сообщение переводится в 'failed'. count_attempt=False — для ограничения частоты (RetryAfter),
+# которое не считается ошибкой доставки. Возвращает True, если сообщение ушло в dead letter.
+def mark_outbox_failed(message_id: int, error: str, next_attempt_at: str = None,
+                       max_attempts: int = 1, count_attempt: bool = True) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE reminder_outbox
+        SET attempts = attempts + ?,
+            last_error = ?,
+            status = CASE WHEN ? IS NULL OR attempts + ? >= ? THEN 'failed' ELSE 'pending' END,
+            next_attempt_at = COALESCE(?, next_attempt_at)
+        WHERE id = ?
+        RETURNING status
+    """, (int(count_attempt), error[:500], next_attempt_at, int(count_attempt), max_attempts,
+          next_attempt_at, message_id))
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return row is not None and row[0] == 'failed'
+
+
+# Удаление старых отправленных напоминаний пачками; dead letter остаётся для разбора
+def purge_sent_outbox(sent_before: str, batch_size: int = 500):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    purged_count = 0
+    while True:
+        cursor.execute("""
+            DELETE FROM reminder_outbox WHERE id IN (
+                SELECT id FROM reminder_outbox WHERE status = 'sent' AND sent_at < ? LIMIT ?
+            )
+        """, (sent_before, batch_size))
+        conn.commit()
+        purged_count += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    conn.close()
+    return purged_count
+
+
+# Пересчёт счётчиков user_stats из tasks на дату date_str для пачки пользователей (без commit)
+def _recompute_user_stats(cursor, user_ids, date_str: str):
+    placeholders = ",".join("?" * len(user_ids))
+    cursor.execute(f"""
+        UPDATE user_stats SET {", ".join(f"{column} = 0" for column in USER_STATS_COUNTERS)}, stats_date = ?
+        WHERE user_id IN ({placeholders})
+    """, (date_str, *user_ids))
+    sums = ", ".join(f"SUM({user_stats_counter_expr(column, 'tasks', 'p.d')}) AS {column}"
+                     for column in USER_STATS_COUNTERS)
+    cursor.execute(f"""
+        WITH p AS (SELECT ? AS d),
+        agg AS (SELECT tasks.user_id, {sums} FROM tasks, p WHERE tasks.user_id IN ({placeholders}) GROUP BY tasks.user_id)
+        UPDATE user_stats SET {", ".join(f"{column} = agg.{column}" for column in USER_STATS_COUNTERS)}
+        FROM agg WHERE user_stats.user_id = agg.user_id
+    """, (date_str, *user_ids))
+
+
+# Пересчёт устаревших счётчиков (stats_date раньше date_str или не задан) пачками по batch_size.
+# Выполняется в начале прохода напоминаний, после смены даты это один пересчёт на пользователя в сутки.
+def refresh_user_stats(date_str: str, batch_size: int = 500):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    refreshed_count = 0
+    while True:
+        cursor.execute("SELECT user_id FROM user_stats WHERE stats_date IS NULL OR stats_date < ? LIMIT ?",
+                       (date_str, batch_size))
+        user_ids = [row[0] for row in cursor.fetchall()]
+        if not user_ids:
+            break
+        _recompute_user_stats(cursor, user_ids, date_str)
+        conn.commit()
+        refreshed_count += len(user_ids)
+        if len(user_ids) < batch_size:
+            break
+    conn.close()
+    return refreshed_count
+
+
+# Счётчики задач пользователя на сегодня одним чтением строки user_stats:
+# {"active_count": ..., "overdue_count": ..., "remind_due_count": ..., "remind_overdue_count": ..., "completed_today_count": ...}
+def get_user_counters(user_id: int):
+    today_date_str = datetime.now().strftime('%Y-%m-%d')
+    columns = list(USER_STATS_COUNTERS)
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT stats_date, {', '.join(columns)} FROM user_stats WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] != today_date_str:
+        cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (user_id,))
+        _recompute_user_stats(cursor, [user_id], today_date_str)
+        conn.commit()
+        cursor.execute(f"SELECT stats_date, {', '.join(columns)} FROM user_stats WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+    conn.close()
+    return dict(zip(columns, row[1:]))
+
+
+# Проверка согласованности: сравнивает актуальные (stats_date = date_str) счётчики с пересчётом из tasks.
+# Расхождения при repair=True исправляются. Возвращает список user_id с расхождениями.
+def check_user_stats(date_str: str, repair: bool = True, batch_size: int = 500):
+    sums = ", ".join(f"SUM({user_stats_counter_expr(column, 'tasks', 'p.d')}) AS {column}"
+                     for column in USER_STATS_COUNTERS)
+    mismatch = " OR ".join(f"s.{column} != COALESCE(agg.{column}, 0)" for column in USER_STATS_COUNTERS)
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        WITH p AS (SELECT ? AS d),
+        agg AS (SELECT tasks.user_id, {sums} FROM tasks, p GROUP BY tasks.user_id)
+        SELECT s.user_id FROM user_stats s LEFT JOIN agg ON agg.user_id = s.user_id
+        WHERE s.stats_date = ? AND ({mismatch})
+    """, (date_str, date_str))
+    mismatched_user_ids = [row[0] for row in cursor.fetchall()]
+    if repair:
+        for start in range(0, len(mismatched_user_ids), batch_size):
+            _recompute_user_stats(cursor, mismatched_user_ids[start:start + batch_size], date_str)
+            conn.commit()
+    conn.close()
+    return mismatched_user_ids
+
+
+# Статистика продуктивности из дневных агрегатов user_daily_stats (без обхода задач пользователя).
+# Возвращает словарь: завершено за сегодня/7/30 дней и всего, завершения по дням последней недели
+# [(день, кол-во), ...], текущая и лучшая серия дней с завершениями, вовремя/с опозданием, среднее время выполнения.
+def get_productivity_stats(user_id: int, today: date = None):
+    today = today or date.today()
+    week_start = today - timedelta(days=6)
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COALESCE(SUM(completed_count), 0),
+               COALESCE(SUM(CASE WHEN day >= ? THEN completed_count END), 0),
+               COALESCE(SUM(CASE WHEN day >= ? THEN completed_count END), 0),
+               COALESCE(SUM(on_time_count), 0), COALESCE(SUM(late_count), 0),
+               COALESCE(SUM(lead_time_seconds), 0), COALESCE(SUM(lead_time_count), 0)
+        FROM user_daily_stats WHERE user_id = ?
+    """, ((today - timedelta(days=29)).isoformat(), week_start.isoformat(), user_id))
+    total, last_30_days, last_7_days, on_time, late, lead_time_seconds, lead_time_count = cursor.fetchone()
+
+    cursor.execute("SELECT day, completed_count FROM user_daily_stats WHERE user_id = ? AND day BETWEEN ? AND ?",
+                   (user_id, week_start.isoformat(), today.isoformat()))
+    completed_by_day = dict(cursor.fetchall())
+    week = [(week_start + timedelta(days=i), completed_by_day.get((week_start + timedelta(days=i)).isoformat(), 0))
+            for i in range(7)]
+
+    # Серии: дни подряд образуют группу с одинаковой разностью (номер дня - номер строки)
+    cursor.execute("""
+        SELECT MIN(day), MAX(day), COUNT(*) FROM (
+            SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS grp
+            FROM user_daily_stats WHERE user_id = ? AND completed_count > 0
+        ) GROUP BY grp ORDER BY MAX(day) DESC
+    """, (user_id,))
+    streaks = cursor.fetchall()
+    conn.close()
+
+    best_streak = max((length for _, _, length in streaks), default=0)
+    current_streak = 0
+    if streaks and date.fromisoformat(streaks[0][1]) >= today - timedelta(days=1):
+        current_streak = streaks[0][2]
+
+    return {
+        "today": completed_by_day.get(today.isoformat(), 0),
+        "last_7_days": last_7_days,
+        "last_30_days": last_30_days,
+        "total": total,
+        "week": week,
+        "current_streak": current_streak,
+        "best_streak": best_streak,
+        "on_time": on_time,
+        "late": late,
+        "avg_lead_time_seconds": lead_time_seconds / lead_time_count if lead_time_count else None,
+    }
+
+
+# Отметка активности пользователя за день (для DAU) и регистрация нового пользователя.
+# Вызывается не чаще раза в день на пользователя (см. analytics.track_activity).
+def record_user_activity(user_id: int, day: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO bot_users (user_id, first_seen_at) VALUES (?, ?)",
+                   (user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    cursor.execute("INSERT OR IGNORE INTO user_activity (day, user_id) VALUES (?, ?)", (day, user_id))
+    conn.commit()
+    conn.close()
+
+
+# Аналитика для администратора из daily_analytics: (всего пользователей,
+# [(day, active_users, new_users, tasks_created, tasks_completed), ...] за последние days дней по убыванию даты)
+def get_daily_analytics(days: int = 7):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(SUM(new_users), 0) FROM daily_analytics")
+    total_users = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT day, active_users, new_users, tasks_created, tasks_completed FROM daily_analytics
+        WHERE day >= ? ORDER BY day DESC
+    """, ((date.today() - timedelta(days=days - 1)).isoformat(),))
+    rows = cursor.fetchall()
+    conn.close()
+    return total_users, rows
+
+
+# Новая рассылка администратора; получатели — все пользователи бота, кроме заблокировавших его. Возвращает id.
+def create_broadcast(text: str, created_by: int, progress_chat_id: int = None, progress_message_id: int = None):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO broadcasts (text, created_by, created_at, total_count, progress_chat_id, progress_message_id)
+        VALUES (?, ?, ?, (SELECT COUNT(*) FROM bot_users WHERE user_id NOT IN (SELECT user_id FROM blocked_users)), ?, ?)
+    """, (text, created_by, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), progress_chat_id, progress_message_id))
+    broadcast_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return broadcast_id
+
+
+_BROADCAST_COLUMNS = ("id, text, status, last_user_id, total_count, sent_count, failed_count, "
+                      "progress_chat_id, progress_message_id")
+
+
+# Рассылка, которую нужно продолжить или начать (самая старая незавершённая), или None
+def get_next_broadcast():
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {_BROADCAST_COLUMNS} FROM broadcasts
+        WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1
+    """)
+    broadcast = cursor.fetchone()
+    conn.close()
+    return broadcast
+
+
+def get_broadcast(broadcast_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {_BROADCAST_COLUMNS} FROM broadcasts WHERE id = ?", (broadcast_id,))
+    broadcast = cursor.fetchone()
+    conn.close()
+    return broadcast
+
+
+def get_recent_broadcasts(limit: int = 5):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {_BROADCAST_COLUMNS} FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,))
+    broadcasts = cursor.fetchall()
+    conn.close()
+    return broadcasts
+
+
+# Следующая пачка получателей рассылки после курсора after_user_id (по возрастанию user_id)
+def get_broadcast_recipients(after_user_id: int, limit: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT user_id FROM bot_users
+        WHERE user_id > ? AND user_id NOT IN (SELECT user_id FROM blocked_users)
+        ORDER BY user_id LIMIT ?
+    """, (after_user_id, limit))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return user_ids
+
+
+# Сохранение прогресса пачки рассылки (курсор и счётчики). Отменённая рассылка остаётся отменённой.
+# Возвращает текущий статус рассылки.
+def update_broadcast_progress(broadcast_id: int, last_user_id: int, sent: int, failed: int, status: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE broadcasts SET
+            last_user_id = ?, sent_count = sent_count + ?, failed_count = failed_count + ?,
+            status = CASE WHEN status = 'cancelled' THEN status ELSE ? END,
+            finished_at = CASE WHEN ? = 'done' AND status != 'cancelled' THEN ? ELSE finished_at END
+        WHERE id = ?
+        RETURNING status
+    """, (last_user_id, sent, failed, status, status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), broadcast_id))
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE broadcasts SET status = 'cancelled', finished_at = ?
+        WHERE id = ? AND status IN ('pending', 'running')
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), broadcast_id))
+    cancelled = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return cancelled
+
+
+# Серверное хранилище callback-данных по токену (для кнопок, данные которых не помещаются в 64 байта)
+def save_callback_token(token: str, payload: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO callback_tokens (token, payload, created_at) VALUES (?, ?, ?)",
+                   (token, payload, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    conn.close()
+
+
+def load_callback_token(token: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT payload FROM callback_tokens WHERE token = ?", (token,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def purge_callback_tokens(created_before: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM callback_tokens WHERE created_at < ?", (created_before,))
+    purged_count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return purged_count
+
+
+# Общий список группы; создатель сразу становится участником. Возвращает False, если у чата уже есть список.
+def create_shared_list(chat_id: int, title: str, created_by: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("INSERT OR IGNORE INTO shared_lists (chat_id, title, created_by, created_at) VALUES (?, ?, ?, ?)",
+                   (chat_id, title, created_by, now))
+    created = cursor.rowcount > 0
+    if created:
+        cursor.execute("INSERT OR IGNORE INTO list_members (chat_id, user_id, joined_at) VALUES (?, ?, ?)",
+                       (chat_id, created_by, now))
+    conn.commit()
+    conn.close()
+    return created
+
+
+# Версия состава участников общего списка группы или None, если у чата нет общего списка
+def get_shared_list_version(chat_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT members_version FROM shared_lists WHERE chat_id = ?", (chat_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# Участники общего списка группы: (версия состава, frozenset user_id) или None, если у чата нет общего списка
+def get_shared_list_members(chat_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT l.members_version, m.user_id FROM shared_lists l
+        LEFT JOIN list_members m ON m.chat_id = l.chat_id
+        WHERE l.chat_id = ?
+    """, (chat_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    if not rows:
+        return None
+    return rows[0][0], frozenset(row[1] for row in rows if row[1] is not None)
+
+
+def add_list_member(chat_id: int, user_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR IGNORE INTO list_members (chat_id, user_id, joined_at)
+        SELECT chat_id, ?, ? FROM shared_lists WHERE chat_id = ?
+    """, (user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), chat_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def remove_list_member(chat_id: int, user_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM list_members WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# Уведомление участникам общего списка (кроме автора изменения и заблокировавших бота): одна вставка
+# в очередь отправки reminder_outbox на всех участников, доставляет её фоновая задача deliver_reminders.
+# Возвращает кол-во поставленных сообщений.
+def enqueue_list_notification(chat_id: int, actor_id: int, text: str) -> int:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("""
+        INSERT OR IGNORE INTO reminder_outbox (user_id, dedup_key, text, button_filter, status, next_attempt_at, created_at)
+        SELECT user_id, ? || user_id, ?, NULL, 'pending', ?, ? FROM list_members
+        WHERE chat_id = ? AND user_id != ? AND user_id NOT IN (SELECT user_id FROM blocked_users)
+    """, (f"list:{chat_id}:{uuid.uuid4().hex}:", text, now, now, chat_id, actor_id))
+    queued_count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return queued_count
+
+
+# Кандидаты на почасовое напоминание: [(user_id, last_reminded_at, interval_hours, remind_due_count, remind_overdue_count), ...].
+# Пользователи, у которых есть задачи с напоминанием на сегодня или просроченные (по счётчикам user_stats);
+# пора ли напоминать по интервалу, решает планировщик. Пользователи с ещё не доставленным напоминанием
+# пропускаются — очередь не копит дубли.
+def get_reminder_candidates(stats_date: str, now_str: str):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT s.user_id, urs.last_reminded_at, COALESCE(urs.interval_hours, 1) as interval_hours,
+               s.remind_due_count, s.remind_overdue_count
+        FROM user_stats s
+        JOIN user_reminder_status urs ON s.user_id = urs.user_id
+        WHERE s.stats_date = ? AND s.remind_due_count > 0
+          AND s.user_id NOT IN (SELECT user_id FROM user_digest) -- Пользователи со сводкой получают её вместо напоминаний
+          AND s.user_id NOT IN (SELECT user_id FROM reminder_outbox WHERE status = 'pending')
+          AND s.user_id NOT IN (SELECT user_id FROM blocked_users) -- Заблокировавшие бота ждут очистки
+          AND (urs.snoozed_until IS NULL OR urs.snoozed_until <= ?) -- Отложенные кнопкой в напоминании
+    """, (stats_date, now_str))
+    candidates = cursor.fetchall()
+    conn.close()
+    return candidates
+
+
+# Задачи для напоминания сразу по пачке пользователей: {user_id: [(id, task_number, description, overdue), ...]},
+# не больше limit на пользователя — сначала просроченные, затем по приоритету и номеру
+def get_due_reminder_tasks(user_ids, date_str: str, limit: int):
+    if not user_ids:
+        return {}
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    placeholders = ",".join("?" * len(user_ids))
+    cursor.execute(f"""
+        SELECT user_id, id, task_number, description, overdue FROM (
+            SELECT user_id, id, task_number, description, overdue,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY overdue DESC, priority, task_number) AS position
+            FROM tasks
+            WHERE user_id IN ({placeholders}) AND status = 'active' AND remind_me = 1 AND (deadline = ? OR overdue = 1)
+        ) WHERE position <= ?
+        ORDER BY user_id, position
+    """, (*user_ids, date_str, limit))
+    tasks_by_user = {}
+    for user_id, *task in cursor.fetchall():
+        tasks_by_user.setdefault(user_id, []).append(tuple(task))
+    conn.close()
+    return tasks_by_user
+
+
+# Завершение активной задачи по внутреннему id (кнопка в напоминании) со счётчиком выполненных задач.
+# Возвращает (task_number, description) или None, если задача не найдена или уже не активна.
+def complete_task_by_id(task_internal_id: int, user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE tasks SET status = 'completed', remind_me = 0, completed_at = ?
+        WHERE id = ? AND user_id = ? AND status = 'active'
+        RETURNING task_number, description
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), task_internal_id, user_id))
+    task = cursor.fetchone()
+    if task:
+        cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, completed_tasks_count) VALUES (?, 0)", (user_id,))
+        cursor.execute("UPDATE user_stats SET completed_tasks_count = completed_tasks_count + 1 WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+    return task
+
+
+# Завершение активной задачи по номеру (кнопка в списке задач).
+# Возвращает (description, completed_tasks_count) или None, если задача не найдена или уже не активна.
+def complete_task_by_number(user_id: int, task_number: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE tasks SET status = 'completed', remind_me = 0, completed_at = ?
+        WHERE user_id = ? AND task_number = ? AND status = 'active'
+        RETURNING description
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user_id, task_number))
+    task = cursor.fetchone()
+    result = None
+    if task:
+        cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, completed_tasks_count) VALUES (?, 0)", (user_id,))
+        cursor.execute("""
+            UPDATE user_stats SET completed_tasks_count = completed_tasks_count + 1 WHERE user_id = ?
+            RETURNING completed_tasks_count
+        """, (user_id,))
+        result = (task[0], cursor.fetchone()[0])
+    conn.commit()
+    conn.close()
+    return result
+
+
+# Включает напоминание по задаче (и будущим экземплярам повторяющейся) с интервалом в часах
+def set_task_reminder_interval(task_internal_id: int, user_id: int, hours: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET remind_me = 1 WHERE id = ? AND user_id = ? AND status = 'active'",
+                   (task_internal_id, user_id))
+    cursor.execute("UPDATE task_recurrences SET remind_me = 1 WHERE id = (SELECT recurrence_id FROM tasks WHERE id = ? AND user_id = ?)",
+                   (task_internal_id, user_id))
+    cursor.execute("INSERT OR IGNORE INTO user_reminder_status (user_id, last_reminded_at) VALUES (?, ?)",
+                   (user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    cursor.execute("UPDATE user_reminder_status SET interval_hours = ? WHERE user_id = ?", (hours, user_id))
+    conn.commit()
+    conn.close()
+
+
+# Отключает напоминание по задаче; у повторяющейся задачи — и для её будущих экземпляров
+def disable_task_reminder(task_internal_id: int, user_id: int) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET remind_me = 0 WHERE id = ? AND user_id = ?", (task_internal_id, user_id))
+    disabled = cursor.rowcount > 0
+    cursor.execute("""
+        UPDATE task_recurrences SET remind_me = 0
+        WHERE id = (SELECT recurrence_id FROM tasks WHERE id = ? AND user_id = ?)
+    """, (task_internal_id, user_id))
+    conn.commit()
+    conn.close()
+    return disabled
+
+
+# Отключает все напоминания пользователя, включая будущие экземпляры повторяющихся задач
+def disable_all_reminders(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE tasks SET remind_me = 0 WHERE user_id = ? AND status = 'active'", (user_id,))
+    cursor.execute("UPDATE task_recurrences SET remind_me = 0 WHERE user_id = ?", (user_id,))
+    cursor.execute("DELETE FROM user_reminder_status WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+
+# Откладывает напоминания пользователя: планировщик пропускает его до snoozed_until
+def snooze_reminders(user_id: int, snoozed_until: str) -> bool:
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE user_reminder_status SET snoozed_until = ? WHERE user_id = ?", (snoozed_until, user_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# Закреплённая панель владельца задач; возвращает (chat_id, message_id) прежней панели или None
+def save_dashboard(user_id: int, chat_id: int, message_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chat_id, message_id FROM dashboards WHERE user_id = ?", (user_id,))
+    previous = cursor.fetchone()
+    cursor.execute("""
+        INSERT INTO dashboards (user_id, chat_id, message_id, created_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET chat_id = excluded.chat_id, message_id = excluded.message_id,
+                                           created_at = excluded.created_at
+    """, (user_id, chat_id, message_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    conn.close()
+    return previous
+
+
+# Отключение панели; возвращает (chat_id, message_id) удалённой панели или None
+def delete_dashboard(user_id: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM dashboards WHERE user_id = ? RETURNING chat_id, message_id", (user_id,))
+    dashboard = cursor.fetchone()
+    cursor.execute("DELETE FROM dashboard_dirty WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+    return dashboard
+
+
+# Забирает до limit панелей, отмеченных триггерами: [(user_id, chat_id, message_id), ...]
+def take_dirty_dashboards(limit: int):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        DELETE FROM dashboard_dirty WHERE user_id IN (SELECT user_id FROM dashboard_dirty LIMIT ?)
+        RETURNING user_id
+    """, (limit,))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    dashboards = []
+    if user_ids:
+        placeholders = ",".join("?" * len(user_ids))
+        cursor.execute(f"SELECT user_id, chat_id, message_id FROM dashboards WHERE user_id IN ({placeholders})", user_ids)
+        dashboards = cursor.fetchall()
+    conn.commit()
+    conn.close()
+    return dashboards
+
+
+# Отметить панели для обновления: все (смена даты) или перечисленных владельцев (повтор после ошибки)
+def mark_dashboards_dirty(user_ids=None):
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    if user_ids is None:
+        cursor.execute("INSERT OR IGNORE INTO dashboard_dirty (user_id) SELECT user_id FROM dashboards")
+    else:
+        cursor.executemany("INSERT OR IGNORE INTO dashboard_dirty (user_id) VALUES (?)", [(user_id,) for user_id in user_ids])
+    conn.commit()
+    conn.close()
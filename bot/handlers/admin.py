@@ -0,0 +1,159 @@
+import logging
+from datetime import date, datetime
+
+from aiogram import F, Router, types
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+
+from config import ADMIN_IDS, PROFILER_MAX_SECONDS, PROFILER_SAMPLE_INTERVAL
+from db_utils import create_broadcast, get_daily_analytics, get_recent_broadcasts, cancel_broadcast
+from keyboards.inline import BroadcastCallback, build_broadcast_confirm_keyboard, build_broadcast_stop_keyboard
+from states.admin_states import Broadcast
+from lifecycle import lifecycle
+from profiler import profile_event_loop
+
+logger = logging.getLogger(__name__)
+
+
+# Команды администратора; доступны только пользователям из ADMIN_IDS, для остальных роутер не срабатывает
+admin_router = Router()
+admin_router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+admin_router.callback_query.filter(F.from_user.id.in_(ADMIN_IDS))
+
+BROADCAST_STATUS_LABELS = {
+    "pending": "⏳ в очереди",
+    "running": "📤 отправляется",
+    "done": "✅ завершена",
+    "cancelled": "⏹ остановлена",
+}
+
+admin_help_text = """
+🛠 Команды администратора:
+/analytics — пользователи, DAU, созданные и завершённые задачи по дням
+/broadcast — разослать сообщение всем пользователям
+/broadcasts — последние рассылки и их прогресс
+/profile [секунды] — профилировать бота (по умолчанию 10 с) и прислать collapsed stacks для flamegraph
+"""
+
+
+# Текст прогресса рассылки; broadcast — строка из get_broadcast/get_recent_broadcasts
+def build_broadcast_progress_text(broadcast):
+    broadcast_id, text, status, last_user_id, total_count, sent_count, failed_count = broadcast[:7]
+    preview = text if len(text) <= 50 else text[:47] + "..."
+    return (f"Рассылка #{broadcast_id} ({BROADCAST_STATUS_LABELS.get(status, status)}): «{preview}»\n"
+            f"Обработано {sent_count + failed_count} из {total_count}, доставлено {sent_count}, ошибок {failed_count}")
+
+
+@admin_router.message(Command("admin"))
+async def cmd_admin(message: types.Message):
+    await message.answer(admin_help_text)
+
+
+@admin_router.message(Command("analytics"))
+async def cmd_analytics(message: types.Message):
+    total_users, rows = get_daily_analytics(days=7)
+    today = date.today().isoformat()
+    today_row = next((row for row in rows if row[0] == today), (today, 0, 0, 0, 0))
+
+    response = (f"📈 Аналитика\n\nВсего пользователей: {total_users}\n"
+                f"Активных сегодня (DAU): {today_row[1]}, новых: {today_row[2]}\n\n"
+                "День: активные / новые / создано задач / завершено\n")
+    for day, active_users, new_users, tasks_created, tasks_completed in rows:
+        response += f"{date.fromisoformat(day).strftime('%d.%m')}: {active_users} / {new_users} / {tasks_created} / {tasks_completed}\n"
+    await message.answer(response)
+
+
+@admin_router.message(Command("broadcast"))
+async def cmd_broadcast(message: types.Message, state: FSMContext):
+    await state.set_state(Broadcast.waiting_for_text)
+    await message.answer("Отправьте текст рассылки (или /cancel для отмены):")
+
+
+@admin_router.message(Broadcast.waiting_for_text, Command("cancel"))
+@admin_router.message(Broadcast.waiting_for_confirmation, Command("cancel"))
+async def cancel_broadcast_draft(message: types.Message, state: FSMContext):
+    await state.clear()
+    await message.answer("Рассылка отменена.")
+
+
+@admin_router.message(Broadcast.waiting_for_text, F.text)
+async def process_broadcast_text(message: types.Message, state: FSMContext):
+    await state.update_data(broadcast_text=message.text)
+    await state.set_state(Broadcast.waiting_for_confirmation)
+    await message.answer(f"Предпросмотр рассылки:\n\n{message.text}\n\nОтправить всем пользователям?",
+                         reply_markup=build_broadcast_confirm_keyboard())
+
+
+@admin_router.callback_query(Broadcast.waiting_for_confirmation, BroadcastCallback.filter(F.action.in_({"confirm", "cancel"})))
+async def process_broadcast_confirmation(callback_query: types.CallbackQuery, callback_data: BroadcastCallback,
+                                         state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    if callback_data.action == "cancel" or not data.get("broadcast_text"):
+        await callback_query.message.edit_text("Рассылка отменена.")
+        await callback_query.answer()
+        return
+
+    # Сообщение с прогрессом обновляет фоновая задача рассылки
+    progress_message = await callback_query.message.answer("Рассылка поставлена в очередь...")
+    broadcast_id = create_broadcast(data["broadcast_text"], callback_query.from_user.id,
+                                    progress_message.chat.id, progress_message.message_id)
+    await progress_message.edit_text(f"Рассылка #{broadcast_id} поставлена в очередь.",
+                                     reply_markup=build_broadcast_stop_keyboard(broadcast_id))
+    await callback_query.message.edit_reply_markup(reply_markup=None)
+    logger.info("Admin %s created broadcast %s.", callback_query.from_user.id, broadcast_id)
+    await callback_query.answer()
+
+
+@admin_router.message(Command("broadcasts"))
+async def cmd_broadcasts(message: types.Message):
+    broadcasts = get_recent_broadcasts()
+    if not broadcasts:
+        await message.answer("Рассылок пока не было.")
+        return
+    for broadcast in broadcasts:
+        reply_markup = build_broadcast_stop_keyboard(broadcast[0]) if broadcast[2] in ("pending", "running") else None
+        await message.answer(build_broadcast_progress_text(broadcast), reply_markup=reply_markup)
+
+
+@admin_router.callback_query(BroadcastCallback.filter(F.action == "stop"))
+async def process_stop_broadcast(callback_query: types.CallbackQuery, callback_data: BroadcastCallback):
+    if cancel_broadcast(callback_data.broadcast_id):
+        await callback_query.message.edit_reply_markup(reply_markup=None)
+        await callback_query.answer(f"Рассылка #{callback_data.broadcast_id} остановлена.")
+    else:
+        await callback_query.answer("Рассылка уже завершена.", show_alert=True)
+
+
+# Профилирование идёт фоновой задачей, отчёт приходит по её окончании: в многопроцессном режиме /profile
+# выполняет основной процесс, а он разбирает апдейты по очереди (handle_as_tasks=False) — ожидание внутри
+# обработчика остановило бы получение апдейтов для всех пользователей на время профиля
+_profile_task = None
+
+
+@admin_router.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject):
+    global _profile_task
+    if _profile_task is not None and not _profile_task.done():
+        await message.answer("Профилирование уже выполняется, дождитесь результата.")
+        return
+    try:
+        seconds = int(command.args) if command.args else 10
+    except ValueError:
+        await message.answer(f"Использование: /profile [секунды], не больше {PROFILER_MAX_SECONDS}")
+        return
+    seconds = max(1, min(seconds, PROFILER_MAX_SECONDS))
+
+    await message.answer(f"⏱ Профилирую event loop {seconds} с...")
+    _profile_task = lifecycle.start_background(send_profile_report(message, seconds), "profile")
+
+
+async def send_profile_report(message: types.Message, seconds: int):
+    profiler = await profile_event_loop(seconds, PROFILER_SAMPLE_INTERVAL)
+
+    summary = (f"Процесс: {profiler.process_label}\nСнимков стека: {sum(profiler.samples.values())}, "
+               f"макс. задержка event loop за это время: {profiler.max_lag * 1000:.0f} мс\n\nГорячие точки:\n")
+    summary += "\n".join(f"{share * 100:.1f}% {frame}" for frame, share in profiler.top_frames())
+    document = types.BufferedInputFile(profiler.collapsed().encode(),
+                                       filename=f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+    await message.answer_document(document, caption=summary[:1024])
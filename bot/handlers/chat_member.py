@@ -0,0 +1,26 @@
+import logging
+
+from aiogram import F, Router, types
+from aiogram.filters import ChatMemberUpdatedFilter, KICKED, MEMBER
+
+from db_utils import record_blocked_user, unblock_user
+
+logger = logging.getLogger(__name__)
+
+
+chat_member_router = Router()
+chat_member_router.my_chat_member.filter(F.chat.type == "private")
+
+
+# Пользователь заблокировал бота: Telegram присылает my_chat_member со статусом kicked,
+# очистку его напоминаний выполнит фоновая задача
+@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def process_bot_blocked(event: types.ChatMemberUpdated):
+    logger.info("User %s blocked the bot.", event.from_user.id)
+    record_blocked_user(event.from_user.id, "kicked")
+
+
+@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def process_bot_unblocked(event: types.ChatMemberUpdated):
+    logger.info("User %s unblocked the bot.", event.from_user.id)
+    unblock_user(event.from_user.id)
@@ -0,0 +1,101 @@
+import logging
+from datetime import datetime
+
+from aiogram import Bot, Router, types
+from aiogram.filters import Command
+import aiogram.exceptions
+
+from config import DASHBOARD_TASKS_LIMIT
+from db_utils import (
+    get_tasks_for_user,
+    get_user_counters,
+    format_deadline,
+    save_dashboard,
+    delete_dashboard
+)
+from keyboards.inline import DashboardCallback, build_dashboard_keyboard, priority_mark
+
+logger = logging.getLogger(__name__)
+
+
+# Закреплённая панель "на сегодня": бот присылает и закрепляет сообщение со списком задач на сегодня
+# и просроченных, а затем редактирует его сам. Изменения задач отмечают панель триггером в БД,
+# фоновая задача update_dashboards (jobs.py) обновляет отмеченные панели с паузой DASHBOARD_DEBOUNCE_SECONDS.
+dashboard_router = Router()
+
+_rendered_texts = {}  # user_id -> последний отправленный текст панели (в этом процессе), чтобы не редактировать впустую
+
+
+def build_dashboard_text(user_id: int) -> str:
+    now = datetime.now()
+    today_str = now.strftime('%Y-%m-%d')
+    tasks = get_tasks_for_user(user_id, filter_type="due")
+    completed_today_count = get_user_counters(user_id)["completed_today_count"]
+
+    response = f"📌 Задачи на {format_deadline(today_str)}\n\n"
+    if not tasks:
+        response += "На сегодня задач нет 🎉\n"
+    for internal_id, task_number, description, deadline, priority in tasks[:DASHBOARD_TASKS_LIMIT]:
+        overdue_mark = f"⚠️ ({format_deadline(deadline)}) " if deadline and deadline < today_str else ""
+        response += f"{overdue_mark}{priority_mark(priority)}№{task_number} {description}\n"
+    if len(tasks) > DASHBOARD_TASKS_LIMIT:
+        response += f"…и ещё {len(tasks) - DASHBOARD_TASKS_LIMIT}\n"
+    response += f"\n✅ Завершено сегодня: {completed_today_count}"
+    return response
+
+
+# Перерисовка панели; не обращается к Telegram, если текст не изменился с прошлого обновления
+async def render_dashboard(bot: Bot, user_id: int, chat_id: int, message_id: int) -> bool:
+    text = build_dashboard_text(user_id)
+    if _rendered_texts.get(user_id) == text:
+        return False
+    try:
+        await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id,
+                                    reply_markup=build_dashboard_keyboard())
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    _rendered_texts[user_id] = text
+    return True
+
+
+def forget_dashboard(user_id: int):
+    _rendered_texts.pop(user_id, None)
+
+
+async def _unpin(bot: Bot, chat_id: int, message_id: int):
+    try:
+        await bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
+    except aiogram.exceptions.TelegramBadRequest as e:
+        logger.debug("Could not unpin dashboard %s in chat %s: %s", message_id, chat_id, e)
+
+
+@dashboard_router.message(Command("dashboard"))
+async def cmd_dashboard(message: types.Message, bot: Bot, scope_id: int):
+    text = build_dashboard_text(scope_id)
+    dashboard_message = await message.answer(text, reply_markup=build_dashboard_keyboard())
+    try:
+        await dashboard_message.pin(disable_notification=True)
+    except aiogram.exceptions.TelegramBadRequest as e:
+        # В группе у бота может не быть права закреплять сообщения — панель всё равно обновляется
+        logger.info("Could not pin dashboard in chat %s: %s", message.chat.id, e)
+    previous = save_dashboard(scope_id, message.chat.id, dashboard_message.message_id)
+    _rendered_texts[scope_id] = text
+    if previous:
+        await _unpin(bot, *previous)
+
+@dashboard_router.callback_query(DashboardCallback.filter())
+async def process_dashboard_callback(callback_query: types.CallbackQuery, callback_data: DashboardCallback,
+                                     bot: Bot, scope_id: int):
+    if callback_data.action == "off":
+        dashboard = delete_dashboard(scope_id)
+        forget_dashboard(scope_id)
+        await callback_query.message.edit_text("📌 Панель задач отключена. Включить снова: /dashboard")
+        if dashboard:
+            await _unpin(bot, *dashboard)
+        await callback_query.answer()
+        return
+
+    forget_dashboard(scope_id)
+    await render_dashboard(bot, scope_id, callback_query.message.chat.id, callback_query.message.message_id)
+    await callback_query.answer("Панель обновлена")
@@ -0,0 +1,101 @@
+import logging
+import time
+
+from aiogram import Bot, Router, types
+
+from config import INLINE_RESULTS_LIMIT, INLINE_CACHE_SECONDS
+from db_utils import get_active_tasks_page, search_tasks, add_task, format_deadline
+
+logger = logging.getLogger(__name__)
+
+
+inline_router = Router()
+
+# Короткоживущий кэш результатов на пользователя: {(user_id, query, offset): (expires_at, results, next_offset)}.
+# Пользователь печатает запрос посимвольно, и Telegram часто повторяет одинаковые запросы подряд.
+_results_cache = {}
+_CACHE_MAX_SIZE = 5000
+
+
+def _cache_get(key):
+    cached = _results_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+    return None
+
+
+def _cache_put(key, results, next_offset):
+    if len(_results_cache) >= _CACHE_MAX_SIZE:
+        now = time.monotonic()
+        for expired_key in [k for k, v in _results_cache.items() if v[0] <= now]:
+            del _results_cache[expired_key]
+        if len(_results_cache) >= _CACHE_MAX_SIZE:
+            _results_cache.clear()
+    _results_cache[key] = (time.monotonic() + INLINE_CACHE_SECONDS, results, next_offset)
+
+
+def invalidate_inline_cache(user_id: int):
+    for key in [k for k in _results_cache if k[0] == user_id]:
+        del _results_cache[key]
+
+
+def build_task_article(internal_id, task_number, description, deadline):
+    formatted_deadline = format_deadline(deadline)
+    deadline_str = f" (Срок выполнения: {formatted_deadline})" if formatted_deadline else ""
+    return types.InlineQueryResultArticle(
+        id=f"task:{internal_id}",
+        title=f"{task_number}. {description[:60]}",
+        description=f"Срок выполнения: {formatted_deadline}" if formatted_deadline else "Срок не указан",
+        input_message_content=types.InputTextMessageContent(
+            message_text=f"📌 Задача {task_number}: {description}{deadline_str}"
+        )
+    )
+
+
+# Inline-режим (@bot запрос): активные задачи пользователя, подходящие под запрос, и пункт «создать задачу»
+@inline_router.inline_query()
+async def process_inline_query(inline_query: types.InlineQuery):
+    user_id = inline_query.from_user.id
+    query_text = inline_query.query.strip()
+    page = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+
+    cache_key = (user_id, query_text.lower(), page)
+    cached = _cache_get(cache_key)
+    if cached:
+        results, next_offset = cached
+    else:
+        if query_text:
+            tasks, has_next = search_tasks(user_id, query_text, page=page, page_size=INLINE_RESULTS_LIMIT,
+                                           status_filter='active')
+            tasks = [task[:4] for task in tasks]
+        else:
+            tasks, has_next = get_active_tasks_page(user_id, page=page, page_size=INLINE_RESULTS_LIMIT)
+
+        results = [build_task_article(*task) for task in tasks]
+        if query_text and page == 0:
+            results.insert(0, types.InlineQueryResultArticle(
+                id="new",
+                title=f"➕ Создать задачу: {query_text[:60]}",
+                description="Задача будет добавлена без срока выполнения",
+                input_message_content=types.InputTextMessageContent(message_text=f"📝 Новая задача: {query_text}")
+            ))
+        next_offset = str(page + 1) if has_next else ""
+        _cache_put(cache_key, results, next_offset)
+
+    await inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS, is_personal=True, next_offset=next_offset)
+
+
+# Выбранный пункт «создать задачу» (требует включённого inline feedback у бота в @BotFather)
+@inline_router.chosen_inline_result()
+async def process_chosen_inline_result(chosen_result: types.ChosenInlineResult, bot: Bot):
+    if chosen_result.result_id != "new" or not chosen_result.query.strip():
+        return
+    user_id = chosen_result.from_user.id
+    description = chosen_result.query.strip()
+    internal_task_id, new_task_number = add_task(user_id, description)
+    invalidate_inline_cache(user_id)
+    logger.info("Task %s created via inline mode by user %s.", internal_task_id, user_id)
+    try:
+        await bot.send_message(chat_id=user_id, text=f"✍ Задача '{description}' (Номер: {new_task_number}) добавлена!")
+    except Exception as e:
+        logger.warning("Could not confirm inline task creation to user %s: %s", user_id, e)
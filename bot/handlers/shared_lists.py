@@ -0,0 +1,45 @@
+import logging
+
+from aiogram import F, Router, types
+from aiogram.filters import Command
+
+from db_utils import create_shared_list, add_list_member, remove_list_member
+from shared_lists import invalidate
+
+logger = logging.getLogger(__name__)
+
+
+# Управление общим списком задач группы; команды работают только в группах
+shared_list_router = Router()
+shared_list_router.message.filter(F.chat.type.in_({"group", "supergroup"}))
+
+NOTIFICATIONS_HINT = "Чтобы получать уведомления об изменениях в списке, запустите бота в личных сообщениях (/start)."
+
+
+@shared_list_router.message(Command("share_list"))
+async def cmd_share_list(message: types.Message):
+    if create_shared_list(message.chat.id, message.chat.title, message.from_user.id):
+        invalidate(message.chat.id)
+        logger.info("Shared list created in chat %s by user %s.", message.chat.id, message.from_user.id)
+        await message.answer("👥 В этом чате создан общий список задач. Команды /add_task, /list_tasks и другие "
+                             "теперь работают с ним. Чтобы присоединиться, отправьте /join_list.\n" + NOTIFICATIONS_HINT)
+    else:
+        await message.answer("В этом чате уже есть общий список задач. Присоединиться: /join_list")
+
+
+@shared_list_router.message(Command("join_list"))
+async def cmd_join_list(message: types.Message):
+    if add_list_member(message.chat.id, message.from_user.id):
+        invalidate(message.chat.id)
+        await message.reply("Вы присоединились к общему списку задач чата.\n" + NOTIFICATIONS_HINT)
+    else:
+        await message.reply("Вы уже участник общего списка или в этом чате его нет (создать: /share_list).")
+
+
+@shared_list_router.message(Command("leave_list"))
+async def cmd_leave_list(message: types.Message):
+    if remove_list_member(message.chat.id, message.from_user.id):
+        invalidate(message.chat.id)
+        await message.reply("Вы вышли из общего списка задач чата. Вернуться можно командой /join_list.")
+    else:
+        await message.reply("Вы не участник общего списка задач этого чата.")
@@ -1,21 +1,53 @@
 import logging
-import sqlite3 # Keep for direct DB interaction within handlers if needed, or refactor to db_utils
 from datetime import datetime, timedelta
 
 from aiogram import Bot, types, Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardRemove
 import aiogram.exceptions
 # Correct import for InlineKeyboardBuilder
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from aiogram_calendar import SimpleCalendarCallback
-
-from config import DATABASE_NAME, PAGE_SIZE, welcome_text
-from db_utils import get_tasks_for_user, format_deadline
+from config import (PAGE_SIZE, DIGEST_PAGE_SIZE, UNDO_DELETE_MINUTES, TASK_PRIORITIES,
+                    REMINDER_SNOOZE_TOMORROW_HOUR, welcome_text)
+from db_utils import (
+    get_tasks_for_user,
+    get_latest_active_tasks,
+    get_user_counters,
+    get_selection_page,
+    get_task_by_number,
+    get_visible_window_end,
+    materialize_recurring_tasks,
+    add_task,
+    format_deadline,
+    get_user_digest,
+    set_user_digest,
+    disable_user_digest,
+    create_recurrence_from_task,
+    get_recurrences_for_user,
+    stop_recurrence,
+    search_tasks,
+    soft_delete_task,
+    restore_deleted_task,
+    get_productivity_stats,
+    update_task_description,
+    update_task_deadline,
+    set_task_priority,
+    get_user_tags,
+    get_tag_name,
+    complete_task_by_id,
+    complete_task_by_number,
+    set_task_reminder_interval,
+    snooze_reminders,
+    disable_task_reminder,
+    disable_all_reminders
+)
+from recurrence import PRESET_RULES
 from keyboards.inline import (
-    simple_calendar,
+    CALENDAR_CALLBACK_PREFIX,
+    get_simple_calendar,
+    unpack_calendar_callback,
     get_main_menu_inline_keyboard,
     get_reminder_confirmation_keyboard,
     get_task_list_keyboard,
@@ -25,6 +57,17 @@ from keyboards.inline import (
     build_delete_task_keyboard,
     build_reminders_keyboard,
     build_reminder_intervals_keyboard,
+    build_digest_hours_keyboard,
+    build_digest_keyboard,
+    build_recurrence_presets_keyboard,
+    build_recurrences_keyboard,
+    build_search_results_keyboard,
+    build_undo_delete_keyboard,
+    build_task_priority_keyboard,
+    build_tags_keyboard,
+    build_deadline_keyboard,
+    build_deadline_confirm_keyboard,
+    priority_mark,
     TaskListFilterCallback,
     TaskActionCallback,
     CompleteTaskCallback,
@@ -36,11 +79,36 @@ from keyboards.inline import (
     SetReminderIntervalCallback,
     RemindersMenuCallback,
     RemoveTaskReminderCallback,
-    DisableAllRemindersCallback
+    DisableAllRemindersCallback,
+    DigestMenuCallback,
+    SetDigestHourCallback,
+    DisableDigestCallback,
+    DigestPageCallback,
+    MakeRecurringCallback,
+    SetRecurrenceCallback,
+    StopRecurrenceCallback,
+    SearchPageCallback,
+    UndoDeleteCallback,
+    TaskPriorityFilterCallback,
+    TaskTagFilterCallback,
+    TagsMenuCallback,
+    SetTaskPriorityCallback,
+    ReminderDoneCallback,
+    ReminderSnoozeCallback,
+    REMINDER_SNOOZE_PERIODS,
+    QuickDeadlineCallback,
+    DeadlineConfirmCallback,
+    QUICK_DEADLINES
 )
-from states.admin_states import AddTask, EditTask, DeleteTask # Renamed for clarity in this context
+from dateparse import extract_deadline, parse_deadline
+from shared_lists import notify_list_members
+from states.admin_states import AddTask, EditTask, DeleteTask, SearchTasks # Renamed for clarity in this context
 
+logger = logging.getLogger(__name__)
 
+
+# Обработчики задач получают scope_id (middleware shared_lists.resolve_task_scope) — владельца задач:
+# id пользователя или id группы, если пользователь работает с общим списком группы
 welcome_router = Router()
 task_router = Router()
 
@@ -48,17 +116,34 @@ task_router = Router()
 # Вспомогательная функция для получения и отправки списка задач (при обычном просмотре)
 async def send_task_list(target_message_or_query: types.Message | types.CallbackQuery, user_id: int,
                          task_limit: int = None, filter_type: str = None, status_filter: str = 'active'):
-    tasks = get_tasks_for_user(user_id, filter_type=filter_type or "all", status_filter=status_filter)
+    if task_limit and status_filter == 'active':
+        # Краткий список: только последние задачи, общее количество — из счётчиков user_stats
+        tasks = get_latest_active_tasks(user_id, 5)
+        active_count = get_user_counters(user_id)["active_count"]
+    else:
+        tasks = get_tasks_for_user(user_id, filter_type=filter_type or "all", status_filter=status_filter)
+
+    filter_title = ""
+    if filter_type and filter_type.startswith("priority_"):
+        filter_title = f"с приоритетом «{TASK_PRIORITIES[int(filter_type.removeprefix('priority_'))][1]}»"
+    elif filter_type and filter_type.startswith("tag_"):
+        filter_title = f"с тегом #{get_tag_name(user_id, int(filter_type.removeprefix('tag_')))}"
 
     response = ""
     if not tasks:
         if status_filter == 'active':
-            if filter_type == "today":
+            if filter_title:
+                response = f"У вас нет активных задач {filter_title}."
+            elif filter_type == "today":
                 response = "У вас нет активных задач на сегодня."
             elif filter_type == "week":
                 response = "У вас нет активных задач на текущую неделю."
             elif filter_type == "month":
                 response = "У вас нет активных задач на текущий месяц."
+            elif filter_type == "overdue":
+                response = "У вас нет просроченных задач 👍"
+            elif filter_type == "due":
+                response = "У вас нет задач на сегодня и просроченных задач."
             else:
                 response = "У вас пока нет активных задач."
         else:
@@ -66,25 +151,30 @@ async def send_task_list(target_message_or_query: types.Message | types.Callback
     else:
         response_header = ""
         if status_filter == 'active':
-            if filter_type == "today":
+            if filter_title:
+                response_header = f"🗂 Ваши активные задачи {filter_title}:\n\n"
+            elif filter_type == "today":
                 response_header = "🗓 Ваши активные задачи на сегодня:\n\n"
             elif filter_type == "week":
                 response_header = "🗓 Ваши активные задачи на текущую неделю:\n\n"
             elif filter_type == "month":
                 response_header = "🗓 Ваши активные задачи на текущий месяц:\n\n"
+            elif filter_type == "overdue":
+                response_header = "⚠️ Ваши просроченные задачи:\n\n"
+            elif filter_type == "due":
+                response_header = "🗓 Ваши задачи на сегодня и просроченные:\n\n"
             elif task_limit:
-                response_header = "📞 Ваши последние 5 активных задач:\n\n"
+                response_header = f"📞 Ваши последние 5 активных задач (всего активных: {active_count}):\n\n"
             elif filter_type == "all":
                 response_header = "🗓 Ваши все активные задачи:\n\n"
         else:
             response_header = "🏆 Ваши завершенные задачи:\n\n"
 
         response = response_header
-        selected_tasks = tasks if not task_limit else tasks[-5::1]
-        for internal_id, task_number, description, deadline in selected_tasks:
+        for internal_id, task_number, description, deadline, priority in tasks:
             formatted_deadline = format_deadline(deadline)
             deadline_str = f" (Срок выполнения: {formatted_deadline})" if formatted_deadline else ""
-            response += f"Номер: {task_number}.\n   Задача: {description}{deadline_str}\n"
+            response += f"{priority_mark(priority)}Номер: {task_number}.\n   Задача: {description}{deadline_str}\n"
 
     keyboard = get_task_list_keyboard(filter_type)
 
@@ -103,7 +193,7 @@ async def send_task_list(target_message_or_query: types.Message | types.Callback
         current_keyboard_data = get_keyboard_data(current_reply_markup)
 
         if response == current_text and new_keyboard_data == current_keyboard_data:
-            logging.info("Skipping message edit: content and markup are identical.")
+            logger.debug("Skipping message edit: content and markup are identical.")
         else:
             try:
                 await target_message_or_query.message.edit_text(
@@ -112,10 +202,74 @@ async def send_task_list(target_message_or_query: types.Message | types.Callback
                 )
             except aiogram.exceptions.TelegramBadRequest as e:
                 if "message is not modified" in str(e):
-                    logging.info("Caught TelegramBadRequest: message not modified. Ignoring.")
+                    logger.debug("Caught TelegramBadRequest: message not modified. Ignoring.")
                 else:
                     raise e
 
+# Текст ежедневной сводки: задачи на сегодня и просроченные, постранично
+def build_digest_text(tasks, page: int = 0):
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    overdue_count = sum(1 for task in tasks if task[3] and task[3] < today_str)
+
+    response = f"☀️ Ваша сводка: задач с напоминаниями на сегодня — {len(tasks)}"
+    if overdue_count:
+        response += f", из них просрочено — {overdue_count}"
+    response += ".\n\n"
+
+    start = page * DIGEST_PAGE_SIZE
+    for internal_id, task_number, description, deadline, priority in tasks[start:start + DIGEST_PAGE_SIZE]:
+        formatted_deadline = format_deadline(deadline)
+        overdue_mark = "⚠️ " if deadline and deadline < today_str else ""
+        deadline_str = f" (Срок выполнения: {formatted_deadline})" if formatted_deadline else ""
+        response += f"{overdue_mark}{priority_mark(priority)}Номер: {task_number}.\n   Задача: {description}{deadline_str}\n"
+    return response
+
+# Текст страницы результатов поиска
+def build_search_results_text(query_text: str, tasks, page: int = 0):
+    if not tasks:
+        if page > 0:
+            return f"🔍 По запросу «{query_text}» больше ничего не найдено."
+        return f"🔍 По запросу «{query_text}» ничего не найдено."
+
+    response = f"🔍 Результаты поиска по запросу «{query_text}»:\n\n"
+    for internal_id, task_number, description, deadline, status in tasks:
+        formatted_deadline = format_deadline(deadline)
+        deadline_str = f" (Срок выполнения: {formatted_deadline})" if formatted_deadline else ""
+        status_mark = "✅ " if status == 'completed' else ""
+        response += f"{status_mark}Номер: {task_number}.\n   Задача: {description}{deadline_str}\n"
+    return response
+
+WEEKDAY_SHORT_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+# Текст статистики продуктивности (/stats) по данным get_productivity_stats
+def build_stats_text(stats):
+    if not stats["total"]:
+        return "📊 Статистика появится, когда вы завершите первую задачу. Вперёд! 💪"
+
+    response = ("📊 Ваша статистика\n\n"
+                f"Завершено сегодня: {stats['today']}, за 7 дней: {stats['last_7_days']}, "
+                f"за 30 дней: {stats['last_30_days']}, всего: {stats['total']}\n"
+                f"🔥 Серия: {stats['current_streak']} дн. подряд (лучшая: {stats['best_streak']})\n")
+
+    with_deadline = stats["on_time"] + stats["late"]
+    if with_deadline:
+        response += (f"⏱ Вовремя: {stats['on_time'] * 100 // with_deadline}% "
+                     f"({stats['on_time']} из {with_deadline} задач со сроком)\n")
+    if stats["avg_lead_time_seconds"] is not None:
+        lead_time_hours = stats["avg_lead_time_seconds"] / 3600
+        if lead_time_hours < 24:
+            response += f"⌛ Среднее время выполнения: {lead_time_hours:.1f} ч.\n"
+        else:
+            response += f"⌛ Среднее время выполнения: {lead_time_hours / 24:.1f} дн.\n"
+
+    response += "\nЗа неделю:\n"
+    max_count = max(count for _, count in stats["week"]) or 1
+    for day, count in stats["week"]:
+        bar = "▇" * round(count * 10 / max_count)
+        response += f"{WEEKDAY_SHORT_NAMES[day.weekday()]} {day.strftime('%d.%m')} {bar} {count}\n"
+    return response
+
 # Обработчик команды /start
 @welcome_router.message(Command("start"))
 async def start_command(message: types.Message):
@@ -132,7 +286,8 @@ async def process_main_menu_callback(callback_query: types.CallbackQuery):
 async def cmd_add_task(message: types.Message, state: FSMContext):
     builder = InlineKeyboardBuilder() # Corrected here
     builder.add(types.InlineKeyboardButton(text="🔙 Отмена", callback_data="cancel_add_task"))
-    await message.answer("Отлично! Что нужно сделать? Опишите задачу.", reply_markup=builder.as_markup())
+    await message.answer("Отлично! Что нужно сделать? Опишите задачу.\nСлова с # станут тегами задачи, например: #работа",
+                         reply_markup=builder.as_markup())
     await state.set_state(AddTask.waiting_for_description)
 
 # Обработчик inline кнопки отмены при добавлении задачи
@@ -143,66 +298,94 @@ async def process_cancel_add_task(callback_query: types.CallbackQuery, state: FS
     await callback_query.message.answer(welcome_text)
     await callback_query.answer()
 
+# Сохранение новой задачи; message — сообщение с календарём (edit=True, заменяется итогом) или сообщение пользователя
+async def save_new_task(message: types.Message, actor: types.User, state: FSMContext, scope_id: int,
+                        description: str, deadline_str: str, edit: bool):
+    internal_task_id, new_task_number = add_task(scope_id, description, deadline_str)
+
+    notify_list_members(scope_id, message.chat, actor, f"новая задача №{new_task_number} «{description}»")
+    if new_task_number == 1:
+        await message.answer("Поздравляем с вашей первой задачей! Спасибо что выбрали нас 😉")
+
+    formatted_deadline_display = format_deadline(deadline_str)
+    result_text = f"✍ Задача '{description}' (Номер: {new_task_number}) со сроком выполнения '{formatted_deadline_display}' добавлена!"
+    if edit:
+        await message.edit_text(result_text)
+    else:
+        await message.answer(result_text)
+
+    reminder_text = "Если хотите, чтобы я напомнил вам о задаче, жмите кнопку 👇\nПриоритет задачи можно выбрать ниже."
+    builder = InlineKeyboardBuilder() # Corrected here
+    builder.attach(InlineKeyboardBuilder.from_markup(build_task_priority_keyboard(internal_task_id)))
+    builder.add(types.InlineKeyboardButton(
+        text="Напомнить о задаче",
+        callback_data=EnableReminderForTaskCallback(task_internal_id=internal_task_id).pack()
+    ))
+    builder.add(types.InlineKeyboardButton(
+        text="🔁 Повторять задачу",
+        callback_data=MakeRecurringCallback(task_internal_id=internal_task_id).pack()
+    ))
+    builder.add(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    builder.adjust(len(TASK_PRIORITIES), 1)
+    await message.answer(reminder_text, reply_markup=builder.as_markup())
+
+    await state.clear()
+
+DEADLINE_PROMPT = "Теперь выберите срок выполнения (дедлайн) или напишите его, например: завтра, в пятницу, через 3 дня, 25.10"
+
+# Срок, написанный в описании ("купить молоко завтра"), сразу создаёт задачу без календаря.
+# Если срок найден неуверенно ("купить 1.5 кг мяса"), описание сохраняется как есть, а срок нужно подтвердить.
 @task_router.message(AddTask.waiting_for_description)
-async def process_description(message: types.Message, state: FSMContext):
+async def process_description(message: types.Message, state: FSMContext, scope_id: int):
     if not message.text:
         await message.answer("Пожалуйста, введите описание задачи текстом.")
         return
+    description, deadline, certain = extract_deadline(message.text, datetime.now().date())
+    if deadline is not None and description and certain:
+        await save_new_task(message, message.from_user, state, scope_id, description, deadline.strftime('%Y-%m-%d'), edit=False)
+        return
     await state.update_data(description=message.text)
-    await message.answer("Теперь выберите срок выполнения (дедлайн) с помощью календаря:",
-                         reply_markup=await simple_calendar.start_calendar())
     await state.set_state(AddTask.waiting_for_deadline)
+    if deadline is not None:
+        deadline_str = deadline.strftime('%Y-%m-%d')
+        await state.update_data(suggested_deadline=deadline_str)
+        await message.answer(f"Срок выполнения — {format_deadline(deadline_str)}?",
+                             reply_markup=build_deadline_confirm_keyboard(format_deadline(deadline_str)))
+        return
+    await message.answer(DEADLINE_PROMPT, reply_markup=await build_deadline_keyboard())
+
+@task_router.callback_query(DeadlineConfirmCallback.filter(), AddTask.waiting_for_deadline)
+async def process_deadline_confirm_callback(callback_query: types.CallbackQuery, callback_data: DeadlineConfirmCallback,
+                                            state: FSMContext, scope_id: int):
+    data = await state.get_data()
+    if callback_data.confirm and data.get('suggested_deadline'):
+        await save_new_task(callback_query.message, callback_query.from_user, state, scope_id,
+                            data['description'], data['suggested_deadline'], edit=True)
+    else:
+        await callback_query.message.edit_text(DEADLINE_PROMPT, reply_markup=await build_deadline_keyboard())
+    await callback_query.answer()
 
-@task_router.callback_query(SimpleCalendarCallback.filter(), AddTask.waiting_for_deadline)
-async def process_add_deadline_calendar(callback_query: types.CallbackQuery, callback_data: SimpleCalendarCallback,
-                                        state: FSMContext):
-    selected, date = await simple_calendar.process_selection(callback_query, callback_data)
+@task_router.callback_query(F.data.startswith(f"{CALENDAR_CALLBACK_PREFIX}:"), AddTask.waiting_for_deadline)
+async def process_add_deadline_calendar(callback_query: types.CallbackQuery, state: FSMContext, scope_id: int):
+    callback_data = unpack_calendar_callback(callback_query.data)
+    selected, date = await get_simple_calendar().process_selection(callback_query, callback_data)
     if selected:
-        user_id = callback_query.from_user.id
         data = await state.get_data()
-        description = data['description']
-        deadline_str = f"{date.strftime('%Y-%m-%d')}"
-
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT MAX(task_number) FROM tasks WHERE user_id = ?", (user_id,))
-        max_task_number = cursor.fetchone()[0]
-        new_task_number = (max_task_number or 0) + 1
-
-        cursor.execute("INSERT INTO tasks (user_id, task_number, description, deadline, status, remind_me) VALUES (?, ?, ?, ?, ?, ?)",
-                       (user_id, new_task_number, description, deadline_str, 'active', 0))
-        internal_task_id = cursor.lastrowid
-        conn.commit()
-
-        if new_task_number == 1:
-            cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, completed_tasks_count) VALUES (?, 0)", (user_id,))
-            conn.commit()
-            await callback_query.message.answer("Поздравляем с вашей первой задачей! Спасибо что выбрали нас 😉")
-
-        conn.close()
-
-        formatted_deadline_display = format_deadline(deadline_str)
-        await callback_query.message.edit_text(
-            f"✍ Задача '{description}' (Номер: {new_task_number}) со сроком выполнения '{formatted_deadline_display}' добавлена!")
-
-        reminder_text = "Если хотите, чтобы я напомнил вам о задаче, жмите кнопку 👇"
-        builder = InlineKeyboardBuilder() # Corrected here
-        builder.add(types.InlineKeyboardButton(
-            text="Напомнить о задаче",
-            callback_data=EnableReminderForTaskCallback(task_internal_id=internal_task_id).pack()
-        ))
-        builder.add(types.InlineKeyboardButton(
-            text="🏠 Главное меню",
-            callback_data=MainMenuCallback().pack()
-        ))
-        builder.adjust(1)
-        await callback_query.message.answer(reminder_text, reply_markup=builder.as_markup())
+        await save_new_task(callback_query.message, callback_query.from_user, state, scope_id,
+                            data['description'], date.strftime('%Y-%m-%d'), edit=True)
+    await callback_query.answer()
 
-        await state.clear()
-        await callback_query.answer()
-    else:
-        await callback_query.answer()
+@task_router.message(AddTask.waiting_for_deadline, F.text, ~F.text.startswith("/"))
+async def process_add_deadline_text(message: types.Message, state: FSMContext, scope_id: int):
+    deadline = parse_deadline(message.text, datetime.now().date())
+    if deadline is None:
+        await message.answer("Не удалось распознать дату. Напишите, например: завтра, в пятницу, через 3 дня, 25.10 — или выберите её в календаре.")
+        return
+    data = await state.get_data()
+    await save_new_task(message, message.from_user, state, scope_id, data['description'], deadline.strftime('%Y-%m-%d'), edit=False)
 
 # Обработчик для включения напоминаний для конкретной задачи — показ меню интервалов
 @task_router.callback_query(EnableReminderForTaskCallback.filter())
@@ -232,40 +415,26 @@ async def process_reminder_interval_menu_callback(callback_query: types.Callback
 
 # Сохранение выбранного интервала
 @task_router.callback_query(SetReminderIntervalCallback.filter())
-async def process_set_reminder_interval_callback(callback_query: types.CallbackQuery, callback_data: SetReminderIntervalCallback):
-    user_id = callback_query.from_user.id
+async def process_set_reminder_interval_callback(callback_query: types.CallbackQuery, callback_data: SetReminderIntervalCallback, scope_id: int):
+    user_id = scope_id
     task_id_to_remind = callback_data.task_internal_id
     hours = callback_data.hours
 
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE tasks SET remind_me = 1 WHERE id = ? AND user_id = ? AND status = 'active'",
-                       (task_id_to_remind, user_id))
-        conn.commit()
-
-        cursor.execute("INSERT OR IGNORE INTO user_reminder_status (user_id, last_reminded_at) VALUES (?, ?)",
-                       (user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        conn.commit()
-
-        cursor.execute("UPDATE user_reminder_status SET interval_hours = ? WHERE user_id = ?", (hours, user_id))
-        conn.commit()
-
+        set_task_reminder_interval(task_id_to_remind, user_id, hours)
         await callback_query.message.edit_text(
             f"Готово! Буду напоминать об этой задаче каждые {hours} ч.",
             reply_markup=get_reminder_confirmation_keyboard()
         )
     except Exception as e:
-        logging.error(f"Error setting reminder interval {hours}h for task {task_id_to_remind} by user {user_id}: {e}")
+        logger.error("Error setting reminder interval %sh for task %s by user %s: %s", hours, task_id_to_remind, user_id, e)
         await callback_query.message.edit_text("Произошла ошибка при сохранении интервала напоминаний.", reply_markup=get_main_menu_inline_keyboard())
-    finally:
-        conn.close()
     await callback_query.answer()
 
 # Обработчик команды /reminders (для просмотра и управления напоминаниями)
 @task_router.message(Command("reminders"))
-async def cmd_reminders(message: types.Message):
-    user_id = message.from_user.id
+async def cmd_reminders(message: types.Message, scope_id: int):
+    user_id = scope_id
     remindable_tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active', remind_me_filter=True)
 
     if not remindable_tasks:
@@ -277,8 +446,8 @@ async def cmd_reminders(message: types.Message):
 
 # Обработчик callback для меню напоминаний (пагинация)
 @task_router.callback_query(RemindersMenuCallback.filter())
-async def process_reminders_menu_callback(callback_query: types.CallbackQuery, callback_data: RemindersMenuCallback):
-    user_id = callback_query.from_user.id
+async def process_reminders_menu_callback(callback_query: types.CallbackQuery, callback_data: RemindersMenuCallback, scope_id: int):
+    user_id = scope_id
     current_page = callback_data.page
 
     remindable_tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active', remind_me_filter=True)
@@ -298,17 +467,13 @@ async def process_reminders_menu_callback(callback_query: types.CallbackQuery, c
 
 # Обработчик callback для удаления напоминания для конкретной задачи
 @task_router.callback_query(RemoveTaskReminderCallback.filter())
-async def process_remove_task_reminder_callback(callback_query: types.CallbackQuery, callback_data: RemoveTaskReminderCallback):
+async def process_remove_task_reminder_callback(callback_query: types.CallbackQuery, callback_data: RemoveTaskReminderCallback, scope_id: int):
     task_id_to_remove_reminder = callback_data.task_internal_id
     current_page = callback_data.current_page
-    user_id = callback_query.from_user.id
+    user_id = scope_id
 
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE tasks SET remind_me = 0 WHERE id = ? AND user_id = ?",
-                       (task_id_to_remove_reminder, user_id))
-        conn.commit()
+        disable_task_reminder(task_id_to_remove_reminder, user_id)
         await callback_query.answer("Напоминание по задаче отключено.", show_alert=False)
 
         remindable_tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active', remind_me_filter=True)
@@ -323,7 +488,7 @@ async def process_remove_task_reminder_callback(callback_query: types.CallbackQu
                     raise e
 
     except Exception as e:
-        logging.error(f"Error removing reminder for task {task_id_to_remove_reminder} by user {user_id}: {e}")
+        logger.error("Error removing reminder for task %s by user %s: %s", task_id_to_remove_reminder, user_id, e)
         await callback_query.answer("Произошла ошибка при отключении напоминания.", show_alert=True)
         remindable_tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active', remind_me_filter=True)
         keyboard = build_reminders_keyboard(remindable_tasks, page=current_page)
@@ -331,50 +496,39 @@ async def process_remove_task_reminder_callback(callback_query: types.CallbackQu
             await callback_query.message.edit_reply_markup(reply_markup=keyboard)
         except aiogram.exceptions.TelegramBadRequest:
             pass
-    finally:
-        conn.close()
 
 # Обработчик callback для отключения всех напоминаний
 @task_router.callback_query(DisableAllRemindersCallback.filter())
-async def process_disable_all_reminders_callback(callback_query: types.CallbackQuery):
-    user_id = callback_query.from_user.id
+async def process_disable_all_reminders_callback(callback_query: types.CallbackQuery, scope_id: int):
+    user_id = scope_id
 
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE tasks SET remind_me = 0 WHERE user_id = ? AND status = 'active'", (user_id,))
-        conn.commit()
-
-        cursor.execute("DELETE FROM user_reminder_status WHERE user_id = ?", (user_id,))
-        conn.commit()
-
+        disable_all_reminders(user_id)
         await callback_query.message.edit_text(
             "Все напоминания отключены. Вы можете включить их снова для конкретных задач при их добавлении или командой /reminders.",
             reply_markup=get_main_menu_inline_keyboard()
         )
     except Exception as e:
-        logging.error(f"Error disabling all reminders for user {user_id}: {e}")
+        logger.error("Error disabling all reminders for user %s: %s", user_id, e)
         await callback_query.message.edit_text("Произошла ошибка при отключении всех напоминаний.", reply_markup=get_main_menu_inline_keyboard())
-    finally:
-        conn.close()
     await callback_query.answer()
 
 # Обработчик команды /list_tasks
 @task_router.message(Command("list_tasks"))
-async def cmd_list_tasks(message: types.Message):
-    user_id = message.from_user.id
+async def cmd_list_tasks(message: types.Message, scope_id: int):
+    user_id = scope_id
     await send_task_list(message, user_id, task_limit=1, status_filter='active', filter_type="all")
 
 # Обработчик команды /history_tasks
 @task_router.message(Command("history_tasks"))
-async def cmd_history_tasks(message: types.Message):
-    user_id = message.from_user.id
+async def cmd_history_tasks(message: types.Message, scope_id: int):
+    user_id = scope_id
     await send_task_list(message, user_id, filter_type="history_all", status_filter='completed')
 
 # Обработчик callback-запросов от кнопок фильтрации задач
 @task_router.callback_query(TaskListFilterCallback.filter())
-async def process_task_list_filter_callback(callback_query: types.CallbackQuery, callback_data: TaskListFilterCallback):
-    user_id = callback_query.from_user.id
+async def process_task_list_filter_callback(callback_query: types.CallbackQuery, callback_data: TaskListFilterCallback, scope_id: int):
+    user_id = scope_id
     filter_type = callback_data.filter_type
 
     status_filter = 'active'
@@ -391,18 +545,20 @@ async def process_task_list_filter_callback(callback_query: types.CallbackQuery,
         await callback_query.answer("Ваши задачи на месяц", show_alert=False)
     elif filter_type == "all":
         await callback_query.answer("Все ваши задачи", show_alert=False)
+    elif filter_type == "overdue":
+        await callback_query.answer("Ваши просроченные задачи", show_alert=False)
     else:
         await callback_query.answer()
 
 # Обработчик нажатия "Завершить задачу" с фильтром в callback
 @task_router.callback_query(TaskActionCallback.filter())
 async def process_complete_task_action(callback_query: types.CallbackQuery, callback_data: TaskActionCallback,
-                                       state: FSMContext):
+                                       state: FSMContext, scope_id: int):
     action = callback_data.action
     if action.startswith("complete_task"):
         parts = action.split("_", 2)
         filter_type = parts[2] if len(parts) > 2 else "all"
-        user_id = callback_query.from_user.id
+        user_id = scope_id
 
         tasks = get_tasks_for_user(user_id, filter_type=filter_type, status_filter='active')
 
@@ -424,65 +580,45 @@ async def process_complete_task_action(callback_query: types.CallbackQuery, call
 
 # Обработчик callback для завершения задачи / пагинации
 @task_router.callback_query(CompleteTaskCallback.filter())
-async def process_complete_task_callback(callback_query: types.CallbackQuery, callback_data: CompleteTaskCallback, state: FSMContext):
-    user_id = callback_query.from_user.id
+async def process_complete_task_callback(callback_query: types.CallbackQuery, callback_data: CompleteTaskCallback, state: FSMContext, scope_id: int):
+    user_id = scope_id
     filter_type = callback_data.filter_type
     page = callback_data.page
     selected_task_number = callback_data.task_number
 
-    tasks = get_tasks_for_user(user_id, filter_type=filter_type, status_filter='active')
-
     if selected_task_number is not None:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT description FROM tasks WHERE user_id = ? AND task_number = ? AND status = 'active'",
-                           (user_id, selected_task_number))
-            task_info = cursor.fetchone()
-            if not task_info:
-                await callback_query.answer("Задача не найдена или уже завершена.", show_alert=True)
-                keyboard = build_complete_task_keyboard(tasks, filter_type, page)
-                try:
-                    await callback_query.message.edit_reply_markup(reply_markup=keyboard)
-                except aiogram.exceptions.TelegramBadRequest as e:
-                    if "message is not modified" not in str(e):
-                        raise e
-                return
-
-            task_description = task_info[0]
-
-            cursor.execute("UPDATE tasks SET status = 'completed', remind_me = 0 WHERE user_id = ? AND task_number = ? AND status = 'active'",
-                           (user_id, selected_task_number))
-            conn.commit()
-
-            if cursor.rowcount > 0:
-                cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, completed_tasks_count) VALUES (?, 0)", (user_id,))
-                cursor.execute("UPDATE user_stats SET completed_tasks_count = completed_tasks_count + 1 WHERE user_id = ?", (user_id,))
-                conn.commit()
-
-                cursor.execute("SELECT completed_tasks_count FROM user_stats WHERE user_id = ?", (user_id,))
-                completed_tasks_count = cursor.fetchone()[0]
-
-                congrats_message = ""
-                if completed_tasks_count == 10:
-                    congrats_message = "У вас уже 10 задач! Вероятно, вы на пути к идеальной продуктивности 🪷"
-                elif completed_tasks_count == 100:
-                    congrats_message = "У вас уже 100 задач! Дела идут в гору, а вы становитесь лучше чем вчера. Я прав? 👁"
-                elif completed_tasks_count == 500:
-                    congrats_message = "у вас целых 500 задач! Вы гуру продуктивности!🌓"
-                elif completed_tasks_count == 1000:
-                    congrats_message = "1000 завершенных задач - Вы настоящий бог продуктивности!🤞 🧘"
-
-                await send_task_list(callback_query.message, user_id, filter_type=filter_type, status_filter='active')
-                await callback_query.answer(f"Задача '{task_description}' (Номер: {selected_task_number}) завершена.")
+        completed = complete_task_by_number(user_id, selected_task_number)
+        if not completed:
+            await callback_query.answer("Задача не найдена или уже завершена.", show_alert=True)
+            tasks = get_tasks_for_user(user_id, filter_type=filter_type, status_filter='active')
+            keyboard = build_complete_task_keyboard(tasks, filter_type, page)
+            try:
+                await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+            except aiogram.exceptions.TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise e
+            return
 
-                if congrats_message:
-                    await callback_query.message.answer(congrats_message)
-            else:
-                await callback_query.answer("Не удалось завершить задачу.", show_alert=True)
-        finally:
-            conn.close()
+        task_description, completed_tasks_count = completed
+        congrats_message = ""
+        if completed_tasks_count == 10:
+            congrats_message = "У вас уже 10 задач! Вероятно, вы на пути к идеальной продуктивности 🪷"
+        elif completed_tasks_count == 100:
+            congrats_message = "У вас уже 100 задач! Дела идут в гору, а вы становитесь лучше чем вчера. Я прав? 👁"
+        elif completed_tasks_count == 500:
+            congrats_message = "у вас целых 500 задач! Вы гуру продуктивности!🌓"
+        elif completed_tasks_count == 1000:
+            congrats_message = "1000 завершенных задач - Вы настоящий бог продуктивности!🤞 🧘"
+
+        notify_list_members(scope_id, callback_query.message.chat, callback_query.from_user,
+                            f"задача №{selected_task_number} «{task_description}» завершена")
+        await send_task_list(callback_query.message, user_id, filter_type=filter_type, status_filter='active')
+        await callback_query.answer(f"Задача '{task_description}' (Номер: {selected_task_number}) завершена.")
+
+        if congrats_message:
+            await callback_query.message.answer(congrats_message)
     else:
+        tasks = get_tasks_for_user(user_id, filter_type=filter_type, status_filter='active')
         keyboard = build_complete_task_keyboard(tasks, filter_type, page=page)
         try:
             await callback_query.message.edit_reply_markup(reply_markup=keyboard)
@@ -493,32 +629,33 @@ async def process_complete_task_callback(callback_query: types.CallbackQuery, ca
 
 # Обработчики редактирования задачи
 @task_router.message(Command("edit_task"))
-async def cmd_edit_task(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active')
+async def cmd_edit_task(message: types.Message, state: FSMContext, scope_id: int):
+    user_id = scope_id
+    materialize_recurring_tasks(get_visible_window_end("all", datetime.now()), user_id)
+    tasks, page, has_next = get_selection_page(user_id, page=0)
 
     if not tasks:
         await message.answer("У вас нет активных задач для редактирования.", reply_markup=get_main_menu_inline_keyboard())
         await state.clear()
         return
 
-    keyboard = build_edit_task_keyboard(tasks, page=0)
+    keyboard = build_edit_task_keyboard(tasks, page=0, has_next=has_next)
     await message.answer("✏ Выберите задачу для редактирования:", reply_markup=keyboard)
 
 @task_router.callback_query(EditTaskCallback.filter())
 async def process_edit_task_callback(callback_query: types.CallbackQuery, callback_data: EditTaskCallback,
-                                     state: FSMContext):
-    user_id = callback_query.from_user.id
-    tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active')
-
-    if not tasks:
-        await callback_query.message.edit_text("У вас нет активных задач для редактирования.",
-                                               reply_markup=get_main_menu_inline_keyboard())
-        await callback_query.answer()
-        return
+                                     state: FSMContext, scope_id: int):
+    user_id = scope_id
 
     if callback_data.action == "view":
-        keyboard = build_edit_task_keyboard(tasks, page=callback_data.page)
+        tasks, page, has_next = get_selection_page(user_id, page=callback_data.page)
+        if not tasks:
+            await callback_query.message.edit_text("У вас нет активных задач для редактирования.",
+                                                   reply_markup=get_main_menu_inline_keyboard())
+            await callback_query.answer()
+            return
+
+        keyboard = build_edit_task_keyboard(tasks, page=page, has_next=has_next)
         try:
             await callback_query.message.edit_reply_markup(reply_markup=keyboard)
         except aiogram.exceptions.TelegramBadRequest as e:
@@ -527,18 +664,16 @@ async def process_edit_task_callback(callback_query: types.CallbackQuery, callba
         await callback_query.answer()
     elif callback_data.action == "select":
         selected_task_number = callback_data.task_number
-
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, task_number, description, deadline FROM tasks WHERE user_id = ? AND task_number = ? AND status = 'active'",
-            (user_id, selected_task_number))
-        task = cursor.fetchone()
-        conn.close()
+        task = get_task_by_number(user_id, selected_task_number)
 
         if not task:
             await callback_query.answer("Задача не найдена или уже завершена.", show_alert=True)
-            keyboard = build_edit_task_keyboard(tasks, page=callback_data.page)
+            tasks, page, has_next = get_selection_page(user_id, page=callback_data.page)
+            if not tasks:
+                await callback_query.message.edit_text("У вас нет активных задач для редактирования.",
+                                                       reply_markup=get_main_menu_inline_keyboard())
+                return
+            keyboard = build_edit_task_keyboard(tasks, page=page, has_next=has_next)
             try:
                 await callback_query.message.edit_text(
                     "Задача не найдена или уже завершена. Выберите другую задачу или отмените.", reply_markup=keyboard)
@@ -557,7 +692,7 @@ async def process_edit_task_callback(callback_query: types.CallbackQuery, callba
         keyboard = types.ReplyKeyboardMarkup(
             keyboard=[
                 [types.KeyboardButton(text="Описание"), types.KeyboardButton(text="Срок выполнения")],
-                [types.KeyboardButton(text="Отмена")]
+                [types.KeyboardButton(text="Приоритет"), types.KeyboardButton(text="Отмена")]
             ],
             resize_keyboard=True,
             one_time_keyboard=True
@@ -571,7 +706,7 @@ async def process_edit_task_callback(callback_query: types.CallbackQuery, callba
         await state.set_state(EditTask.waiting_for_new_data)
         await callback_query.answer()
 
-@task_router.message(EditTask.waiting_for_new_data, F.text.in_({"Описание", "Срок выполнения", "Отмена"}))
+@task_router.message(EditTask.waiting_for_new_data, F.text.in_({"Описание", "Срок выполнения", "Приоритет", "Отмена"}))
 async def process_edit_field_selection(message: types.Message, state: FSMContext):
 
     if message.text == "Отмена":
@@ -584,12 +719,18 @@ async def process_edit_field_selection(message: types.Message, state: FSMContext
         await message.answer("Введите новое описание задачи:", reply_markup=types.ReplyKeyboardRemove())
         await state.set_state(EditTask.waiting_for_new_description)
     elif message.text == "Срок выполнения":
-        await message.answer("Выберите новый срок выполнения с помощью календаря:",
-                             reply_markup=await simple_calendar.start_calendar())
+        await message.answer("Выберите новый срок выполнения или напишите его, например: завтра, в пятницу, 25.10",
+                             reply_markup=await build_deadline_keyboard())
         await state.set_state(EditTask.waiting_for_new_deadline)
+    elif message.text == "Приоритет":
+        data = await state.get_data()
+        await message.answer("Выбор приоритета:", reply_markup=types.ReplyKeyboardRemove())
+        await message.answer(f"Выберите приоритет задачи (Номер: {data['editing_task_number']}):",
+                             reply_markup=build_task_priority_keyboard(data['editing_internal_db_id']))
+        await state.clear()
 
 @task_router.message(EditTask.waiting_for_new_description)
-async def process_new_description(message: types.Message, state: FSMContext):
+async def process_new_description(message: types.Message, state: FSMContext, scope_id: int):
     if not message.text:
         await message.answer("Пожалуйста, введите описание задачи текстом.",
                              reply_markup=get_main_menu_inline_keyboard())
@@ -600,14 +741,9 @@ async def process_new_description(message: types.Message, state: FSMContext):
     task_number_for_user = data['editing_task_number']
     new_description = message.text
 
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE tasks SET description = ? WHERE id = ? AND user_id = ? AND status = 'active'",
-                   (new_description, internal_db_id, message.from_user.id))
-    conn.commit()
-    conn.close()
-
-    if cursor.rowcount > 0:
+    if update_task_description(internal_db_id, scope_id, new_description):
+        notify_list_members(scope_id, message.chat, message.from_user,
+                            f"описание задачи №{task_number_for_user} изменено на «{new_description}»")
         await message.answer(f"Описание задачи (Номер: {task_number_for_user}) обновлено на: '{new_description}'",
                              reply_markup=get_main_menu_inline_keyboard())
     else:
@@ -616,64 +752,87 @@ async def process_new_description(message: types.Message, state: FSMContext):
             reply_markup=get_main_menu_inline_keyboard())
     await state.clear()
 
-@task_router.callback_query(SimpleCalendarCallback.filter(), EditTask.waiting_for_new_deadline)
-async def process_edit_deadline_calendar(callback_query: types.CallbackQuery, callback_data: SimpleCalendarCallback,
-                                         state: FSMContext):
-    selected, date = await simple_calendar.process_selection(callback_query, callback_data)
+# Сохранение нового срока задачи; message — сообщение с календарём (edit=True) или сообщение пользователя
+async def save_new_deadline(message: types.Message, actor: types.User, state: FSMContext, scope_id: int,
+                            deadline_str: str, edit: bool):
+    data = await state.get_data()
+    internal_db_id = data['editing_internal_db_id']
+    task_number_for_user = data['editing_task_number']
+
+    if update_task_deadline(internal_db_id, scope_id, deadline_str):
+        formatted_deadline_display = format_deadline(deadline_str)
+        notify_list_members(scope_id, message.chat, actor,
+                            f"срок задачи №{task_number_for_user} изменён на {formatted_deadline_display}")
+        result_text = f"Срок выполнения задачи (Номер: {task_number_for_user}) обновлен на: '{formatted_deadline_display}'"
+    else:
+        result_text = "Не удалось обновить задачу. Возможно, задача не найдена, не принадлежит вам или неактивна."
+    if edit:
+        await message.edit_text(result_text, reply_markup=get_main_menu_inline_keyboard())
+    else:
+        await message.answer(result_text, reply_markup=get_main_menu_inline_keyboard())
+    await state.clear()
+
+@task_router.callback_query(F.data.startswith(f"{CALENDAR_CALLBACK_PREFIX}:"), EditTask.waiting_for_new_deadline)
+async def process_edit_deadline_calendar(callback_query: types.CallbackQuery, state: FSMContext, scope_id: int):
+    callback_data = unpack_calendar_callback(callback_query.data)
+    selected, date = await get_simple_calendar().process_selection(callback_query, callback_data)
     if selected:
-        data = await state.get_data()
-        internal_db_id = data['editing_internal_db_id']
-        task_number_for_user = data['editing_task_number']
-        user_id = callback_query.from_user.id
-        deadline_str = f"{date.strftime('%Y-%m-%d')}"
-
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET deadline = ? WHERE id = ? AND user_id = ? AND status = 'active'",
-                       (deadline_str, internal_db_id, user_id))
-        conn.commit()
-        conn.close()
-
-        if cursor.rowcount > 0:
-            formatted_deadline_display = format_deadline(deadline_str)
-            await callback_query.message.edit_text(
-                f"Срок выполнения задачи (Номер: {task_number_for_user}) обновлен на: '{formatted_deadline_display}'",
-                reply_markup=get_main_menu_inline_keyboard())
-        else:
-            await callback_query.message.edit_text(
-                "Не удалось обновить задачу. Возможно, задача не найдена, не принадлежит вам или неактивна.",
-                reply_markup=get_main_menu_inline_keyboard())
-        await state.clear()
+        await save_new_deadline(callback_query.message, callback_query.from_user, state, scope_id,
+                                date.strftime('%Y-%m-%d'), edit=True)
+    await callback_query.answer()
+
+@task_router.message(EditTask.waiting_for_new_deadline, F.text, ~F.text.startswith("/"))
+async def process_edit_deadline_text(message: types.Message, state: FSMContext, scope_id: int):
+    deadline = parse_deadline(message.text, datetime.now().date())
+    if deadline is None:
+        await message.answer("Не удалось распознать дату. Напишите, например: завтра, в пятницу, через 3 дня, 25.10 — или выберите её в календаре.")
+        return
+    await save_new_deadline(message, message.from_user, state, scope_id, deadline.strftime('%Y-%m-%d'), edit=False)
+
+# Быстрый выбор срока (сегодня/завтра/на выходных) над календарём — при добавлении и при редактировании задачи
+@task_router.callback_query(QuickDeadlineCallback.filter(), AddTask.waiting_for_deadline)
+@task_router.callback_query(QuickDeadlineCallback.filter(), EditTask.waiting_for_new_deadline)
+async def process_quick_deadline_callback(callback_query: types.CallbackQuery, callback_data: QuickDeadlineCallback,
+                                          state: FSMContext, scope_id: int):
+    if callback_data.choice not in QUICK_DEADLINES:
         await callback_query.answer()
+        return
+    deadline_str = parse_deadline(QUICK_DEADLINES[callback_data.choice], datetime.now().date()).strftime('%Y-%m-%d')
+    if await state.get_state() == AddTask.waiting_for_deadline.state:
+        data = await state.get_data()
+        await save_new_task(callback_query.message, callback_query.from_user, state, scope_id,
+                            data['description'], deadline_str, edit=True)
     else:
-        await callback_query.answer()
+        await save_new_deadline(callback_query.message, callback_query.from_user, state, scope_id, deadline_str, edit=True)
+    await callback_query.answer()
 
 # Обработчики удаления задачи
 @task_router.message(Command("delete_task"))
-async def cmd_delete_task(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active')
+async def cmd_delete_task(message: types.Message, state: FSMContext, scope_id: int):
+    user_id = scope_id
+    materialize_recurring_tasks(get_visible_window_end("all", datetime.now()), user_id)
+    tasks, page, has_next = get_selection_page(user_id, page=0)
 
     if not tasks:
         await message.answer("У вас нет активных задач для удаления.", reply_markup=get_main_menu_inline_keyboard())
         await state.clear()
         return
 
-    keyboard = build_delete_task_keyboard(tasks, page=0)
+    keyboard = build_delete_task_keyboard(tasks, page=0, has_next=has_next)
     await message.answer("🗑 Выберите задачу для удаления:", reply_markup=keyboard)
 
 @task_router.callback_query(DeleteTaskCallback.filter())
-async def process_delete_task_callback(callback_query: types.CallbackQuery, callback_data: DeleteTaskCallback, state: FSMContext):
-    user_id = callback_query.from_user.id
-    tasks = get_tasks_for_user(user_id, filter_type="all", status_filter='active')
-
-    if not tasks:
-        await callback_query.message.edit_text("У вас нет активных задач для удаления.", reply_markup=get_main_menu_inline_keyboard())
-        await callback_query.answer()
-        return
+async def process_delete_task_callback(callback_query: types.CallbackQuery, callback_data: DeleteTaskCallback, state: FSMContext, scope_id: int):
+    user_id = scope_id
 
     if callback_data.action == "view":
-        keyboard = build_delete_task_keyboard(tasks, page=callback_data.page)
+        tasks, page, has_next = get_selection_page(user_id, page=callback_data.page)
+        if not tasks:
+            await callback_query.message.edit_text("У вас нет активных задач для удаления.", reply_markup=get_main_menu_inline_keyboard())
+            await callback_query.answer()
+            return
+
+        keyboard = build_delete_task_keyboard(tasks, page=page, has_next=has_next)
         try:
             await callback_query.message.edit_reply_markup(reply_markup=keyboard)
         except aiogram.exceptions.TelegramBadRequest as e:
@@ -682,18 +841,15 @@ async def process_delete_task_callback(callback_query: types.CallbackQuery, call
         await callback_query.answer()
     elif callback_data.action == "select":
         selected_task_number = callback_data.task_number
-
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, task_number, description, deadline FROM tasks WHERE user_id = ? AND task_number = ? AND status = 'active'",
-            (user_id, selected_task_number))
-        task = cursor.fetchone()
-        conn.close()
+        task = get_task_by_number(user_id, selected_task_number)
 
         if not task:
             await callback_query.answer("Задача не найдена или уже завершена.", show_alert=True)
-            keyboard = build_delete_task_keyboard(tasks, page=callback_data.page)
+            tasks, page, has_next = get_selection_page(user_id, page=callback_data.page)
+            if not tasks:
+                await callback_query.message.edit_text("У вас нет активных задач для удаления.", reply_markup=get_main_menu_inline_keyboard())
+                return
+            keyboard = build_delete_task_keyboard(tasks, page=page, has_next=has_next)
             try:
                 await callback_query.message.edit_text("Задача не найдена или уже завершена. Выберите другую задачу или отмените.", reply_markup=keyboard)
             except aiogram.exceptions.TelegramBadRequest as e:
@@ -724,24 +880,20 @@ async def process_delete_task_callback(callback_query: types.CallbackQuery, call
         await callback_query.answer()
 
 @task_router.message(DeleteTask.waiting_for_confirmation, F.text.in_({"Да", "Нет"}))
-async def process_delete_confirmation(message: types.Message, state: FSMContext):
+async def process_delete_confirmation(message: types.Message, state: FSMContext, scope_id: int):
     if message.text == "Да":
         data = await state.get_data()
         internal_db_id = data['deleting_internal_db_id']
         task_number_for_user = data['deleting_task_number']
         task_description = data['deleting_task_desc']
-        user_id = message.from_user.id
-
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM tasks WHERE id = ? AND user_id = ? AND status = 'active'",
-                       (internal_db_id, user_id))
-        conn.commit()
-        conn.close()
-
-        if cursor.rowcount > 0:
-            await message.answer(f"Задача '{task_description}' (Номер: {task_number_for_user}) успешно удалена.",
-                                 reply_markup=get_main_menu_inline_keyboard())
+        user_id = scope_id
+
+        if soft_delete_task(internal_db_id, user_id):
+            notify_list_members(scope_id, message.chat, message.from_user,
+                                f"задача №{task_number_for_user} «{task_description}» удалена")
+            await message.answer(f"Задача '{task_description}' (Номер: {task_number_for_user}) успешно удалена.\n"
+                                 f"Удаление можно отменить в течение {UNDO_DELETE_MINUTES} минут.",
+                                 reply_markup=build_undo_delete_keyboard(internal_db_id))
         else:
             await message.answer(
                 "Не удалось удалить задачу. Возможно, задача уже была удалена, не принадлежит вам или неактивна.",
@@ -750,3 +902,293 @@ async def process_delete_confirmation(message: types.Message, state: FSMContext)
         await message.answer("Удаление отменено.", reply_markup=get_main_menu_inline_keyboard())
     await state.clear()
 
+
+# Обработчик команды /digest (настройка ежедневной сводки)
+@task_router.message(Command("digest"))
+async def cmd_digest(message: types.Message):
+    digest = get_user_digest(message.from_user.id)
+    if digest:
+        text = (f"📋 Ежедневная сводка включена: приходит в {digest[0]:02d}:00.\n"
+                "Вместо отдельных напоминаний вы получаете одно сообщение со всеми задачами на сегодня и просроченными.\n\n"
+                "Выберите другое время или отключите сводку:")
+    else:
+        text = ("📋 Ежедневная сводка — одно сообщение в выбранный час со всеми задачами с напоминаниями "
+                "на сегодня и просроченными (вместо отдельных напоминаний).\n\nВыберите время отправки:")
+    await message.answer(text, reply_markup=build_digest_hours_keyboard(page=0, enabled=digest is not None))
+
+# Пагинация меню выбора часа сводки
+@task_router.callback_query(DigestMenuCallback.filter())
+async def process_digest_menu_callback(callback_query: types.CallbackQuery, callback_data: DigestMenuCallback):
+    digest = get_user_digest(callback_query.from_user.id)
+    try:
+        await callback_query.message.edit_reply_markup(
+            reply_markup=build_digest_hours_keyboard(page=callback_data.page, enabled=digest is not None)
+        )
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise e
+    await callback_query.answer()
+
+# Сохранение часа отправки сводки
+@task_router.callback_query(SetDigestHourCallback.filter())
+async def process_set_digest_hour_callback(callback_query: types.CallbackQuery, callback_data: SetDigestHourCallback):
+    user_id = callback_query.from_user.id
+    try:
+        set_user_digest(user_id, callback_data.hour)
+        await callback_query.message.edit_text(
+            f"Готово! Ежедневная сводка будет приходить в {callback_data.hour:02d}:00.",
+            reply_markup=get_reminder_confirmation_keyboard()
+        )
+    except Exception as e:
+        logger.error("Error setting digest hour %s for user %s: %s", callback_data.hour, user_id, e)
+        await callback_query.message.edit_text("Произошла ошибка при сохранении настроек сводки.", reply_markup=get_main_menu_inline_keyboard())
+    await callback_query.answer()
+
+# Отключение сводки — пользователь возвращается к обычным напоминаниям по интервалу
+@task_router.callback_query(DisableDigestCallback.filter())
+async def process_disable_digest_callback(callback_query: types.CallbackQuery):
+    disable_user_digest(callback_query.from_user.id)
+    await callback_query.message.edit_text(
+        "Ежедневная сводка отключена. Напоминания снова будут приходить по выбранному интервалу.",
+        reply_markup=get_main_menu_inline_keyboard()
+    )
+    await callback_query.answer()
+
+# Пагинация сообщения сводки
+@task_router.callback_query(DigestPageCallback.filter())
+async def process_digest_page_callback(callback_query: types.CallbackQuery, callback_data: DigestPageCallback):
+    user_id = callback_query.from_user.id
+    tasks = get_tasks_for_user(user_id, filter_type="due", status_filter='active', remind_me_filter=True)
+    if not tasks:
+        await callback_query.message.edit_text("На сегодня задач с напоминаниями больше нет 🎉", reply_markup=get_main_menu_inline_keyboard())
+        await callback_query.answer()
+        return
+
+    page = min(callback_data.page, (len(tasks) - 1) // DIGEST_PAGE_SIZE)
+    try:
+        await callback_query.message.edit_text(build_digest_text(tasks, page),
+                                               reply_markup=build_digest_keyboard(len(tasks), page))
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise e
+    await callback_query.answer()
+
+# Выбор правила повторения для только что добавленной задачи
+@task_router.callback_query(MakeRecurringCallback.filter())
+async def process_make_recurring_callback(callback_query: types.CallbackQuery, callback_data: MakeRecurringCallback):
+    try:
+        await callback_query.message.edit_text(
+            "Как часто повторять задачу? Новые экземпляры появятся в списке по мере приближения срока.",
+            reply_markup=build_recurrence_presets_keyboard(callback_data.task_internal_id)
+        )
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise e
+    await callback_query.answer()
+
+@task_router.callback_query(SetRecurrenceCallback.filter())
+async def process_set_recurrence_callback(callback_query: types.CallbackQuery, callback_data: SetRecurrenceCallback, scope_id: int):
+    user_id = scope_id
+    if callback_data.preset not in PRESET_RULES:
+        await callback_query.answer("Неизвестное правило повторения.", show_alert=True)
+        return
+
+    rule, label = PRESET_RULES[callback_data.preset]
+    recurrence_id = create_recurrence_from_task(callback_data.task_internal_id, user_id, rule)
+    if recurrence_id is None:
+        await callback_query.message.edit_text("Задача не найдена или уже завершена.", reply_markup=get_main_menu_inline_keyboard())
+    else:
+        builder = InlineKeyboardBuilder()
+        builder.row(types.InlineKeyboardButton(
+            text="Напомнить о задаче",
+            callback_data=EnableReminderForTaskCallback(task_internal_id=callback_data.task_internal_id).pack()
+        ))
+        builder.row(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack()))
+        await callback_query.message.edit_text(
+            f"Готово! Задача будет повторяться: {label.lower()}. Остановить повторение можно командой /recurring.",
+            reply_markup=builder.as_markup()
+        )
+    await callback_query.answer()
+
+# Обработчик команды /recurring (список повторяющихся задач)
+@task_router.message(Command("recurring"))
+async def cmd_recurring(message: types.Message, scope_id: int):
+    recurrences = get_recurrences_for_user(scope_id)
+    if not recurrences:
+        await message.answer("У вас нет повторяющихся задач. Сделать задачу повторяющейся можно сразу после её добавления.",
+                             reply_markup=get_main_menu_inline_keyboard())
+        return
+    await message.answer("🔁 Ваши повторяющиеся задачи (нажмите, чтобы остановить повторение):",
+                         reply_markup=build_recurrences_keyboard(recurrences))
+
+@task_router.callback_query(StopRecurrenceCallback.filter())
+async def process_stop_recurrence_callback(callback_query: types.CallbackQuery, callback_data: StopRecurrenceCallback, scope_id: int):
+    user_id = scope_id
+    if stop_recurrence(callback_data.recurrence_id, user_id):
+        await callback_query.answer("Повторение остановлено.", show_alert=False)
+    else:
+        await callback_query.answer("Повторяющаяся задача не найдена.", show_alert=True)
+
+    recurrences = get_recurrences_for_user(user_id)
+    if not recurrences:
+        await callback_query.message.edit_text("У вас больше нет повторяющихся задач.", reply_markup=get_main_menu_inline_keyboard())
+        return
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=build_recurrences_keyboard(recurrences))
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise e
+
+# Обработчик команды /search (поиск по активным и завершённым задачам)
+@task_router.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext, scope_id: int):
+    if not command.args:
+        await message.answer("Что ищем? Введите слова из описания задачи:", reply_markup=get_main_menu_inline_keyboard())
+        await state.set_state(SearchTasks.waiting_for_query)
+        return
+    await send_search_results(message, command.args, state, scope_id)
+
+@task_router.message(SearchTasks.waiting_for_query)
+async def process_search_query(message: types.Message, state: FSMContext, scope_id: int):
+    if not message.text:
+        await message.answer("Пожалуйста, введите поисковый запрос текстом.")
+        return
+    await send_search_results(message, message.text, state, scope_id)
+
+async def send_search_results(message: types.Message, query_text: str, state: FSMContext, scope_id: int):
+    tasks, has_next = search_tasks(scope_id, query_text, page=0)
+    await state.clear()
+    await message.answer(build_search_results_text(query_text, tasks),
+                         reply_markup=build_search_results_keyboard(query_text, 0, has_next))
+
+# Пагинация результатов поиска
+@task_router.callback_query(SearchPageCallback.filter())
+async def process_search_page_callback(callback_query: types.CallbackQuery, callback_data: SearchPageCallback, scope_id: int):
+    query_text = callback_data.query
+    if not query_text:
+        await callback_query.answer("Поиск устарел. Повторите команду /search.", show_alert=True)
+        return
+
+    tasks, has_next = search_tasks(scope_id, query_text, page=callback_data.page)
+    try:
+        await callback_query.message.edit_text(build_search_results_text(query_text, tasks, callback_data.page),
+                                               reply_markup=build_search_results_keyboard(query_text, callback_data.page, has_next))
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise e
+    await callback_query.answer()
+
+# Отмена мягкого удаления задачи
+@task_router.callback_query(UndoDeleteCallback.filter())
+async def process_undo_delete_callback(callback_query: types.CallbackQuery, callback_data: UndoDeleteCallback, scope_id: int):
+    if restore_deleted_task(callback_data.task_internal_id, scope_id, UNDO_DELETE_MINUTES):
+        await callback_query.message.edit_text("↩️ Задача восстановлена.", reply_markup=get_main_menu_inline_keyboard())
+        await callback_query.answer()
+    else:
+        await callback_query.message.edit_reply_markup(reply_markup=get_main_menu_inline_keyboard())
+        await callback_query.answer("Время для отмены удаления истекло.", show_alert=True)
+
+# Обработчик команды /stats (статистика продуктивности)
+@task_router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    stats = get_productivity_stats(message.from_user.id)
+    await message.answer(build_stats_text(stats), reply_markup=get_main_menu_inline_keyboard())
+
+# Обработчик выбора приоритета задачи (после добавления или при редактировании)
+@task_router.callback_query(SetTaskPriorityCallback.filter())
+async def process_set_task_priority_callback(callback_query: types.CallbackQuery, callback_data: SetTaskPriorityCallback, scope_id: int):
+    if callback_data.priority not in TASK_PRIORITIES:
+        await callback_query.answer()
+        return
+    icon, name = TASK_PRIORITIES[callback_data.priority]
+    if set_task_priority(callback_data.task_internal_id, scope_id, callback_data.priority):
+        await callback_query.answer(f"Приоритет задачи: {icon} {name}")
+    else:
+        await callback_query.answer("Задача не найдена или уже завершена.", show_alert=True)
+
+# Обработчики фильтров списка задач по приоритету и по тегу
+@task_router.callback_query(TaskPriorityFilterCallback.filter())
+async def process_task_priority_filter_callback(callback_query: types.CallbackQuery, callback_data: TaskPriorityFilterCallback, scope_id: int):
+    if callback_data.priority not in TASK_PRIORITIES:
+        await callback_query.answer()
+        return
+    await send_task_list(callback_query, scope_id, filter_type=f"priority_{callback_data.priority}")
+    await callback_query.answer()
+
+@task_router.callback_query(TaskTagFilterCallback.filter())
+async def process_task_tag_filter_callback(callback_query: types.CallbackQuery, callback_data: TaskTagFilterCallback, scope_id: int):
+    user_id = scope_id
+    if get_tag_name(user_id, callback_data.tag_id) is None:
+        await callback_query.answer("Тег не найден.", show_alert=True)
+        return
+    await send_task_list(callback_query, user_id, filter_type=f"tag_{callback_data.tag_id}")
+    await callback_query.answer()
+
+# Обработчик команды /tags (теги с активными задачами)
+@task_router.message(Command("tags"))
+async def cmd_tags(message: types.Message, scope_id: int):
+    tags = get_user_tags(scope_id)
+    if not tags:
+        await message.answer("У вас пока нет тегов. Добавьте в описание задачи слово с #, например: #работа",
+                             reply_markup=get_main_menu_inline_keyboard())
+        return
+    await message.answer("🏷 Ваши теги (в скобках — активные задачи):", reply_markup=build_tags_keyboard(tags))
+
+@task_router.callback_query(TagsMenuCallback.filter())
+async def process_tags_menu_callback(callback_query: types.CallbackQuery, callback_data: TagsMenuCallback, scope_id: int):
+    tags = get_user_tags(scope_id)
+    if not tags:
+        await callback_query.answer("У вас пока нет тегов. Добавьте в описание задачи слово с #.", show_alert=True)
+        return
+    await callback_query.message.edit_text("🏷 Ваши теги (в скобках — активные задачи):",
+                                           reply_markup=build_tags_keyboard(tags, callback_data.page))
+    await callback_query.answer()
+
+def _is_button_of(button: types.InlineKeyboardButton, callback_class) -> bool:
+    try:
+        callback_class.unpack(button.callback_data or "")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+# Кнопки напоминания: задача завершается прямо из сообщения, кнопка убирается из его клавиатуры
+# (клавиатура берётся из самого сообщения, без повторного чтения задач)
+@task_router.callback_query(ReminderDoneCallback.filter())
+async def process_reminder_done_callback(callback_query: types.CallbackQuery, callback_data: ReminderDoneCallback, scope_id: int):
+    task = complete_task_by_id(callback_data.task_internal_id, scope_id)
+    if task:
+        task_number, description = task
+        notify_list_members(scope_id, callback_query.message.chat, callback_query.from_user,
+                            f"задача №{task_number} «{description}» завершена")
+        await callback_query.answer(f"Задача '{description}' (Номер: {task_number}) завершена.")
+    else:
+        await callback_query.answer("Задача не найдена или уже завершена.")
+
+    rows = [[button for button in row if button.callback_data != callback_query.data]
+            for row in callback_query.message.reply_markup.inline_keyboard]
+    if any(_is_button_of(button, ReminderDoneCallback) for row in rows for button in row):
+        await callback_query.message.edit_reply_markup(
+            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[row for row in rows if row]))
+    else:
+        await callback_query.message.edit_text(callback_query.message.text + "\n\n🎉 Все задачи из напоминания выполнены!")
+
+@task_router.callback_query(ReminderSnoozeCallback.filter())
+async def process_reminder_snooze_callback(callback_query: types.CallbackQuery, callback_data: ReminderSnoozeCallback, scope_id: int):
+    if callback_data.period not in REMINDER_SNOOZE_PERIODS:
+        await callback_query.answer()
+        return
+    now = datetime.now()
+    if callback_data.period == "tomorrow":
+        snoozed_until = (now + timedelta(days=1)).replace(hour=REMINDER_SNOOZE_TOMORROW_HOUR, minute=0, second=0, microsecond=0)
+    else:
+        snoozed_until = now + timedelta(hours=int(callback_data.period.removesuffix("h")))
+    if not snooze_reminders(scope_id, snoozed_until.strftime('%Y-%m-%d %H:%M:%S')):
+        await callback_query.answer("Напоминания уже отключены.", show_alert=True)
+        return
+    # Кнопки завершения задач остаются, убирается только ряд отсрочки
+    rows = [row for row in callback_query.message.reply_markup.inline_keyboard
+            if not any(_is_button_of(button, ReminderSnoozeCallback) for button in row)]
+    await callback_query.message.edit_text(
+        callback_query.message.text + f"\n\n⏰ Следующее напоминание — не раньше {snoozed_until.strftime('%d.%m %H:%M')}",
+        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=rows))
+    await callback_query.answer("Напоминание отложено.")
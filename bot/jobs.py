@@ -0,0 +1,397 @@
+import asyncio
+import logging
+from aiogram import Bot, types
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+import aiogram.exceptions
+from datetime import datetime, timedelta
+
+from config import (
+    COMPLETED_RETENTION_DAYS,
+    DELETED_RETENTION_DAYS,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_SECONDS,
+    OUTBOX_RETENTION_DAYS,
+    OUTBOX_MESSAGES_PER_SECOND,
+    BLOCKED_CLEANUP_BATCH_SIZE,
+    BLOCKED_CLEANUP_SECONDS,
+    BROADCAST_MESSAGES_PER_SECOND,
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_POLL_SECONDS,
+    CALLBACK_TOKEN_TTL_DAYS,
+    REMINDER_TASK_BUTTONS,
+    BACKUP_INTERVAL_HOURS,
+    DASHBOARD_DEBOUNCE_SECONDS,
+    DASHBOARD_BATCH_SIZE
+)
+from db_utils import (
+    materialize_recurring_tasks,
+    mark_overdue_tasks,
+    get_due_digests,
+    mark_digests_sent,
+    archive_old_tasks,
+    incremental_vacuum,
+    record_blocked_user,
+    cleanup_blocked_users,
+    enqueue_reminders,
+    get_pending_outbox,
+    mark_outbox_sent,
+    mark_outbox_failed,
+    purge_sent_outbox,
+    refresh_user_stats,
+    check_user_stats,
+    get_next_broadcast,
+    get_broadcast_recipients,
+    update_broadcast_progress,
+    get_broadcast,
+    purge_callback_tokens,
+    get_reminder_candidates,
+    get_due_reminder_tasks,
+    take_dirty_dashboards,
+    mark_dashboards_dirty,
+    delete_dashboard
+)
+from handlers.users import build_digest_text
+from handlers.admin import build_broadcast_progress_text
+from handlers.dashboard import render_dashboard, forget_dashboard
+from keyboards.inline import (TaskListFilterCallback, build_digest_keyboard, build_broadcast_stop_keyboard,
+                              build_reminder_keyboard)
+from lifecycle import lifecycle
+from backup import create_snapshot, rotate_snapshots, newest_snapshot_age
+
+logger = logging.getLogger(__name__)
+
+
+async def _send_digest_and_mark(bot: Bot, user_id: int, tasks, date_str: str):
+    await bot.send_message(chat_id=user_id, text=build_digest_text(tasks, page=0),
+                           reply_markup=build_digest_keyboard(len(tasks), page=0))
+    mark_digests_sent([user_id], date_str)
+
+
+# Отправка сообщения из очереди и отметка 'sent' — вызывается через asyncio.shield,
+# чтобы остановка бота между отправкой и записью не приводила к повторной отправке
+async def _deliver_outbox_message(bot: Bot, message_id: int, user_id: int, text: str, button_filter: str,
+                                  reply_markup_json: str):
+    reply_markup = None
+    if reply_markup_json:
+        reply_markup = types.InlineKeyboardMarkup.model_validate_json(reply_markup_json)
+    elif button_filter:  # напоминания, поставленные в очередь до появления кнопок в напоминаниях
+        builder = InlineKeyboardBuilder()
+        builder.add(types.InlineKeyboardButton(
+            text="Посмотреть задачи",
+            callback_data=TaskListFilterCallback(filter_type=button_filter).pack()
+        ))
+        reply_markup = builder.as_markup()
+    await bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+    mark_outbox_sent(message_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+# Один проход планирования напоминаний: выбирает пользователей, которым пора напомнить,
+# и ставит напоминания в очередь reminder_outbox
+def _queue_hourly_reminders():
+    # Экземпляры повторяющихся задач на сегодня должны существовать до подсчёта напоминаний
+    materialize_recurring_tasks(datetime.now().strftime('%Y-%m-%d'))
+    current_time = datetime.now()
+    today_date_str = current_time.strftime('%Y-%m-%d')
+    # После смены даты счётчики "на сегодня" пересчитываются один раз для каждого пользователя
+    refresh_user_stats(today_date_str)
+    users_to_check = get_reminder_candidates(today_date_str, current_time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    due_users = []
+    for user_id, last_reminded_str, interval_hours, remind_due_count, remind_overdue_count in users_to_check:
+        should_remind = False
+        if not last_reminded_str:
+            should_remind = True  # Если никогда не напоминали, то напоминаем
+        else:
+            last_reminded_dt = datetime.strptime(last_reminded_str, '%Y-%m-%d %H:%M:%S')
+            # Если с последнего напоминания прошел указанный интервал или более
+            if (current_time - last_reminded_dt) >= timedelta(hours=interval_hours or 1):
+                should_remind = True
+
+        if should_remind:
+            due_users.append((user_id, remind_due_count, remind_overdue_count))
+
+    # Задачи для кнопок «выполнено» — одним запросом на всех, кому пора напомнить
+    tasks_by_user = get_due_reminder_tasks([user[0] for user in due_users], today_date_str, REMINDER_TASK_BUTTONS)
+    reminders = []
+    for user_id, remind_due_count, remind_overdue_count in due_users:
+        tasks = tasks_by_user.get(user_id, [])
+        reminder_message = f"Привет! На сегодня у тебя {remind_due_count} незавершенных задач, по которым я должен напомнить!"
+        if remind_overdue_count:
+            reminder_message += f"\n⚠️ Из них просрочено: {remind_overdue_count}."
+        if tasks:
+            reminder_message += "\n\n" + "\n".join(
+                f"{'⚠️ ' if overdue else ''}№{task_number} {description}"
+                for task_internal_id, task_number, description, overdue in tasks)
+            if remind_due_count > len(tasks):
+                reminder_message += f"\n…и ещё {remind_due_count - len(tasks)}"
+        # Кнопка для просмотра задач на сегодня (или вместе с просроченными)
+        button_filter = "due" if remind_overdue_count else "today"
+        reply_markup = build_reminder_keyboard(tasks, button_filter).model_dump_json(exclude_none=True)
+        dedup_key = f"reminder:{user_id}:{current_time.strftime('%Y-%m-%d %H')}"
+        reminders.append((user_id, dedup_key, reminder_message, button_filter, reply_markup))
+
+    queued_count = enqueue_reminders(reminders, current_time.strftime('%Y-%m-%d %H:%M:%S'))
+    if queued_count:
+        logger.info("Queued %s reminders for delivery.", queued_count)
+
+
+# Фоновая задача планирования напоминаний: раз в час ставит напоминания в очередь (отправляет их deliver_reminders)
+async def send_hourly_reminders():
+    while await lifecycle.sleep(3600):  # Ждем 1 час (3600 секунд) или остановки бота
+        logger.info("Running hourly reminders check...")
+        try:
+            _queue_hourly_reminders()
+        except Exception as e:
+            logger.error("Error while scheduling hourly reminders: %s", e)
+
+
+# Фоновая задача отправки напоминаний из очереди reminder_outbox пачками по OUTBOX_BATCH_SIZE.
+# Временные ошибки повторяются с экспоненциальной паузой, после OUTBOX_MAX_ATTEMPTS попыток
+# сообщение остаётся в dead letter (представление reminder_outbox_dead_letters).
+async def deliver_reminders(bot: Bot):
+    send_interval = 1 / OUTBOX_MESSAGES_PER_SECOND
+    while True:
+        while not lifecycle.stopping:
+            batch = get_pending_outbox(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), OUTBOX_BATCH_SIZE)
+            if not batch:
+                break
+            for message_id, user_id, text, button_filter, reply_markup_json, attempts in batch:
+                if lifecycle.stopping:
+                    logger.info("Stopping requested, interrupting reminder delivery.")
+                    break
+                try:
+                    await asyncio.shield(_deliver_outbox_message(bot, message_id, user_id, text, button_filter,
+                                                                 reply_markup_json))
+                    logger.debug("Reminder %s delivered.", message_id, extra={"user_id": user_id})
+                except aiogram.exceptions.TelegramForbiddenError as e:
+                    # Напоминания пользователя отключит фоновая очистка, здесь только запись о блокировке
+                    logger.warning("Bot blocked by user %s. Queued for cleanup.", user_id)
+                    mark_outbox_failed(message_id, f"forbidden: {e}")
+                    record_blocked_user(user_id, "forbidden")
+                except aiogram.exceptions.TelegramRetryAfter as e:
+                    # Ограничение частоты — не ошибка доставки: ждём и продолжаем со следующей пачкой
+                    retry_at = datetime.now() + timedelta(seconds=e.retry_after)
+                    mark_outbox_failed(message_id, f"retry after {e.retry_after}s",
+                                       retry_at.strftime('%Y-%m-%d %H:%M:%S'), OUTBOX_MAX_ATTEMPTS, count_attempt=False)
+                    await lifecycle.sleep(e.retry_after)
+                    break
+                except Exception as e:
+                    backoff = timedelta(seconds=min(60 * 2 ** attempts, 3600))
+                    retry_at = (datetime.now() + backoff).strftime('%Y-%m-%d %H:%M:%S')
+                    if mark_outbox_failed(message_id, str(e), retry_at, OUTBOX_MAX_ATTEMPTS):
+                        logger.error("Reminder %s for user %s moved to dead letter: %s", message_id, user_id, e)
+                    else:
+                        logger.warning("Error sending reminder %s to user %s, will retry: %s", message_id, user_id, e)
+                await asyncio.sleep(send_interval)
+        if not await lifecycle.sleep(OUTBOX_POLL_SECONDS):
+            return
+
+
+# Фоновая задача пометки просроченных задач: инкрементальный обход от сохранённой отметки,
+# пользователи с новыми просроченными задачами ставятся в начало очереди напоминаний
+async def detect_overdue_tasks():
+    while True:
+        try:
+            marked_count, users_to_remind = mark_overdue_tasks()
+            if marked_count:
+                logger.info("Marked %s tasks as overdue; %s users queued for reminders.", marked_count, len(users_to_remind))
+        except Exception as e:
+            logger.error("Error while marking overdue tasks: %s", e)
+        if not await lifecycle.sleep(3600):
+            return
+
+
+# Фоновая задача очистки пользователей, заблокировавших бота: отключает их напоминания и сводку пачками,
+# вне цикла отправки, чтобы ошибки доставки не тормозили проход напоминаний
+async def cleanup_blocked_users_job():
+    while True:
+        try:
+            cleaned_count = cleanup_blocked_users(BLOCKED_CLEANUP_BATCH_SIZE)
+            if cleaned_count:
+                logger.info("Cleaned up reminders of %s users who blocked the bot.", cleaned_count)
+        except Exception as e:
+            logger.error("Error while cleaning up blocked users: %s", e)
+        if not await lifecycle.sleep(BLOCKED_CLEANUP_SECONDS):
+            return
+
+
+# Фоновая задача хранения: раз в сутки переносит старые завершённые и удалённые задачи в архив
+# и возвращает освободившееся место инкрементальным VACUUM, чтобы горячая таблица tasks оставалась маленькой;
+# заодно сверяет счётчики user_stats с tasks
+async def purge_old_tasks():
+    while True:
+        try:
+            current_time = datetime.now()
+            archived_count = archive_old_tasks(
+                completed_before=(current_time - timedelta(days=COMPLETED_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),
+                deleted_before=(current_time - timedelta(days=DELETED_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+            )
+            purged_count = purge_sent_outbox(
+                (current_time - timedelta(days=OUTBOX_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S'))
+            purged_count += purge_callback_tokens(
+                (current_time - timedelta(days=CALLBACK_TOKEN_TTL_DAYS)).strftime('%Y-%m-%d %H:%M:%S'))
+            if archived_count or purged_count:
+                freed_pages = incremental_vacuum()
+                logger.info("Archived %s old tasks, purged %s sent reminders and callback tokens, freed %s pages.",
+                            archived_count, purged_count, freed_pages)
+            # Проверка согласованности счётчиков user_stats с таблицей tasks
+            mismatched_user_ids = check_user_stats(current_time.strftime('%Y-%m-%d'))
+            if mismatched_user_ids:
+                logger.warning("Repaired user_stats counters for %s users: %s",
+                               len(mismatched_user_ids), mismatched_user_ids[:20])
+        except Exception as e:
+            logger.error("Error while archiving old tasks: %s", e)
+        if not await lifecycle.sleep(24 * 3600):
+            return
+
+
+# Один проход ежедневной сводки: один батч-запрос по всем пользователям, чей час сводки наступил,
+# и одно сообщение на пользователя
+async def _send_daily_digests_pass(bot: Bot):
+    current_time = datetime.now()
+    today_date_str = current_time.strftime('%Y-%m-%d')
+    materialize_recurring_tasks(today_date_str)
+    digests = get_due_digests(current_time.hour, today_date_str)
+    if digests:
+        logger.info("Running daily digest for %s users at %02d:00...", len(digests), current_time.hour)
+
+    empty_user_ids = []
+    for user_id, tasks in digests.items():
+        if lifecycle.stopping:
+            logger.info("Stopping requested, interrupting daily digest pass.")
+            break
+        if not tasks:
+            empty_user_ids.append(user_id)
+            continue
+        try:
+            # Сводка отмечается отправленной сразу после отправки, чтобы остановка не приводила к дублю
+            await asyncio.shield(_send_digest_and_mark(bot, user_id, tasks, today_date_str))
+        except aiogram.exceptions.TelegramForbiddenError:
+            logger.warning("Bot blocked by user %s. Queued for cleanup.", user_id)
+            record_blocked_user(user_id, "forbidden")
+        except Exception as e:
+            logger.error("Error sending daily digest to user %s: %s", user_id, e)
+    mark_digests_sent(empty_user_ids, today_date_str)
+
+
+# Фоновая задача ежедневной сводки: проход раз в час, в начале часа
+async def send_daily_digests(bot: Bot):
+    while True:
+        try:
+            await _send_daily_digests_pass(bot)
+        except Exception as e:
+            logger.error("Error while sending daily digests: %s", e)
+
+        # Спим до начала следующего часа
+        next_hour = (datetime.now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        if not await lifecycle.sleep((next_hour - datetime.now()).total_seconds()):
+            return
+
+
+async def _update_broadcast_progress_message(bot: Bot, broadcast):
+    progress_chat_id, progress_message_id = broadcast[7], broadcast[8]
+    if not progress_chat_id:
+        return
+    # Пока рассылка идёт, под сообщением остаётся кнопка остановки
+    reply_markup = build_broadcast_stop_keyboard(broadcast[0]) if broadcast[2] in ("pending", "running") else None
+    try:
+        await bot.edit_message_text(chat_id=progress_chat_id, message_id=progress_message_id,
+                                    text=build_broadcast_progress_text(broadcast), reply_markup=reply_markup)
+    except aiogram.exceptions.TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.warning("Could not update broadcast progress message: %s", e)
+
+
+# Фоновая задача рассылок администратора. Получатели обходятся по возрастанию user_id пачками по
+# BROADCAST_BATCH_SIZE в темпе BROADCAST_MESSAGES_PER_SECOND; после каждой пачки курсор и счётчики
+# сохраняются в broadcasts, поэтому после перезапуска рассылка продолжается с места остановки.
+async def run_broadcasts(bot: Bot):
+    send_interval = 1 / BROADCAST_MESSAGES_PER_SECOND
+    while True:
+        broadcast = get_next_broadcast()
+        while broadcast and not lifecycle.stopping:
+            broadcast_id, text, status, last_user_id = broadcast[:4]
+            user_ids = get_broadcast_recipients(last_user_id, BROADCAST_BATCH_SIZE)
+            sent = failed = 0
+            for user_id in user_ids:
+                if lifecycle.stopping:
+                    break
+                try:
+                    await bot.send_message(chat_id=user_id, text=text)
+                    sent += 1
+                except aiogram.exceptions.TelegramRetryAfter as e:
+                    # Превышен лимит: ждём и повторяем этому же пользователю в следующей пачке
+                    await lifecycle.sleep(e.retry_after)
+                    break
+                except aiogram.exceptions.TelegramForbiddenError:
+                    record_blocked_user(user_id, "forbidden")
+                    failed += 1
+                except Exception as e:
+                    logger.warning("Broadcast %s: error sending to user %s: %s", broadcast_id, user_id, e)
+                    failed += 1
+                last_user_id = user_id
+                await asyncio.sleep(send_interval)
+
+            status = update_broadcast_progress(broadcast_id, last_user_id, sent, failed,
+                                               "running" if user_ids else "done")
+            await _update_broadcast_progress_message(bot, get_broadcast(broadcast_id))
+            if status not in ("pending", "running"):
+                logger.info("Broadcast %s finished with status %s.", broadcast_id, status)
+            broadcast = get_next_broadcast()
+        if not await lifecycle.sleep(BROADCAST_POLL_SECONDS):
+            return
+
+
+# Фоновая задача резервного копирования БД: снимок online backup API в отдельном потоке (event loop
+# не блокируется, обработчики продолжают писать в БД между шагами копирования) и удаление старых снимков.
+# Первый снимок снимается, как только последний из сохранённых старше интервала: частые перезапуски
+# бота не должны откладывать резервное копирование.
+async def backup_database():
+    interval = BACKUP_INTERVAL_HOURS * 3600
+    try:
+        age = await asyncio.to_thread(newest_snapshot_age)
+    except OSError as e:
+        logger.error("Error while listing database snapshots: %s", e)
+        age = None
+    delay = 0 if age is None else max(0, interval - age)
+    while await lifecycle.sleep(delay):
+        delay = interval
+        try:
+            snapshot_path = await asyncio.to_thread(create_snapshot)
+            removed_count = await asyncio.to_thread(rotate_snapshots)
+            logger.info("Database snapshot saved to %s, %s old snapshots removed.", snapshot_path, removed_count)
+        except Exception as e:
+            logger.error("Error while backing up the database: %s", e)
+
+
+# Фоновая задача обновления закреплённых панелей: раз в DASHBOARD_DEBOUNCE_SECONDS забирает панели, отмеченные
+# триггерами при изменении задач, — все изменения за это время дают одно редактирование сообщения.
+# После смены даты обновляются все панели ("на сегодня" меняет смысл).
+async def update_dashboards(bot: Bot):
+    current_date = datetime.now().strftime('%Y-%m-%d')
+    while await lifecycle.sleep(DASHBOARD_DEBOUNCE_SECONDS):
+        today_date_str = datetime.now().strftime('%Y-%m-%d')
+        if today_date_str != current_date:
+            mark_dashboards_dirty()
+            current_date = today_date_str
+        try:
+            dashboards = take_dirty_dashboards(DASHBOARD_BATCH_SIZE)
+        except Exception as e:
+            logger.error("Error while reading dashboards to update: %s", e)
+            continue
+        for index, (user_id, chat_id, message_id) in enumerate(dashboards):
+            try:
+                await render_dashboard(bot, user_id, chat_id, message_id)
+            except aiogram.exceptions.TelegramRetryAfter as e:
+                # Необновлённые панели остаются отмеченными до следующего прохода
+                mark_dashboards_dirty([dashboard[0] for dashboard in dashboards[index:]])
+                await lifecycle.sleep(e.retry_after)
+                break
+            except (aiogram.exceptions.TelegramBadRequest, aiogram.exceptions.TelegramForbiddenError) as e:
+                # Сообщение удалено или бот больше не может писать в чат — панель отключается
+                logger.info("Dashboard of %s in chat %s disabled: %s", user_id, chat_id, e)
+                delete_dashboard(user_id)
+                forget_dashboard(user_id)
+            except Exception as e:
+                logger.warning("Error updating dashboard of %s: %s", user_id, e)
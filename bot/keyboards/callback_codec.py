@@ -0,0 +1,178 @@
+import secrets
+import types
+import typing
+from collections import OrderedDict
+from typing import Any, ClassVar
+
+from aiogram.filters.callback_data import CallbackData, MAX_CALLBACK_LENGTH
+
+from db_utils import save_callback_token, load_callback_token
+
+# Компактный формат callback-данных: "<код>:<поле>:<поле>...", где код — короткий числовой идентификатор
+# класса в base36, целые числа записываются в base36, списки целых — через запятую, а хвостовые поля
+# со значением по умолчанию опускаются. Распаковка сверяет код до разбора полей и собирает объект без
+# повторной валидации pydantic, поэтому проверка каждого фильтра на нажатие кнопки дешёвая.
+# Классы с store_overflow=True, если данные не помещаются в 64 байта или строковое поле содержит
+# разделитель, сохраняют их (в JSON) на сервере и передают в кнопке только токен: "<код>:~<токен>".
+# Для кнопок, отправленных до перехода на компактный формат, распаковка понимает и старый формат
+# aiogram ("<prefix>:<поле>:...").
+
+SEPARATOR = ":"
+TOKEN_MARK = "~"
+_TOKEN_CACHE_SIZE = 1000
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_DIGIT_PAIRS = [high + low for high in _DIGITS for low in _DIGITS]  # по две цифры base36 за одно деление
+
+_codes = {}
+_token_cache = OrderedDict()
+
+
+def to_base36(number: int) -> str:
+    if number < 0:
+        return "-" + to_base36(-number)
+    if number < 36:
+        return _DIGITS[number]
+    digits = ""
+    while number >= 36:
+        number, remainder = divmod(number, 36 * 36)
+        digits = _DIGIT_PAIRS[remainder] + digits
+    # Если старшая пара оказалась последней, её первая цифра не ноль (остаток был не меньше 36)
+    return _DIGITS[number] + digits if number else digits
+
+
+def _field_kind(annotation) -> tuple:
+    # (тип значения, допускается ли None)
+    nullable = False
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        nullable = len(args) < len(typing.get_args(annotation))
+        annotation = args[0]
+    if typing.get_origin(annotation) in (list, tuple):
+        return "list", nullable
+    if annotation is bool:
+        return "bool", nullable
+    if annotation is int:
+        return "int", nullable
+    if annotation is str:
+        return "str", nullable
+    raise TypeError(f"Unsupported compact callback field type: {annotation!r}")
+
+
+def _remember_token(token: str, payload: str):
+    _token_cache[token] = payload
+    _token_cache.move_to_end(token)
+    if len(_token_cache) > _TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+
+
+class CompactCallbackData(CallbackData, prefix="compact"):
+    _code: ClassVar[str]
+    _store_overflow: ClassVar[bool]
+    _fields_codec: ClassVar[list]
+
+    def __init_subclass__(cls, code: int = None, store_overflow: bool = False, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if code is None:
+            raise ValueError(f"code required for compact callback {cls.__name__}")
+        cls._code = to_base36(code)
+        if cls._code in _codes:
+            raise ValueError(f"Callback code {code} is used by both {_codes[cls._code].__name__} and {cls.__name__}")
+        _codes[cls._code] = cls
+        cls._store_overflow = store_overflow
+
+    @classmethod
+    def _codec(cls) -> list:
+        # Описание полей строится один раз: pydantic заполняет model_fields уже после __init_subclass__
+        codec = cls.__dict__.get("_fields_codec")
+        if codec is None:
+            codec = [(name, *_field_kind(field.annotation), field.get_default(call_default_factory=True))
+                     for name, field in cls.model_fields.items()]
+            cls._fields_codec = codec
+        return codec
+
+    def _encode_field(self, name: str, kind: str, value) -> str:
+        if value is None:
+            return ""
+        if kind == "int":
+            return to_base36(value)
+        if kind == "bool":
+            return "1" if value else "0"
+        if kind == "list":
+            return ",".join(to_base36(item) for item in value)
+        if SEPARATOR in value:
+            raise ValueError(f"Separator symbol {SEPARATOR!r} can not be used in value {name}={value!r}")
+        return value
+
+    def pack(self) -> str:
+        try:
+            return self._pack_compact()
+        except ValueError:
+            if not self._store_overflow:
+                raise
+        token = secrets.token_urlsafe(9)
+        payload = self.model_dump_json()
+        save_callback_token(token, payload)
+        _remember_token(token, payload)
+        return f"{self._code}{SEPARATOR}{TOKEN_MARK}{token}"
+
+    def _pack_compact(self) -> str:
+        parts = [self._code]
+        trailing_defaults = 0
+        for name, kind, nullable, default in self._codec():
+            value = getattr(self, name)
+            parts.append(self._encode_field(name, kind, value))
+            trailing_defaults = trailing_defaults + 1 if value == default else 0
+        if trailing_defaults:
+            parts = parts[:-trailing_defaults]
+        callback_data = SEPARATOR.join(parts)
+        if len(callback_data.encode()) > MAX_CALLBACK_LENGTH:
+            raise ValueError(f"Resulted callback data is too long! len({callback_data!r}.encode()) > {MAX_CALLBACK_LENGTH}")
+        return callback_data
+
+    @classmethod
+    def _construct(cls, values: dict):
+        # То же, что model_construct для уже разобранных значений, но без его накладных расходов
+        instance = cls.__new__(cls)
+        object.__setattr__(instance, "__dict__", values)
+        object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+        object.__setattr__(instance, "__pydantic_extra__", None)
+        object.__setattr__(instance, "__pydantic_private__", None)
+        return instance
+
+    @classmethod
+    def unpack(cls, value: str):
+        code, separator, rest = value.partition(SEPARATOR)
+        if code != cls._code:
+            if code == cls.__prefix__:
+                return super().unpack(value)  # кнопка в старом формате aiogram
+            raise ValueError(f"Bad code ({code!r} != {cls._code!r})")
+
+        if cls._store_overflow and rest.startswith(TOKEN_MARK):
+            token = rest[len(TOKEN_MARK):]
+            payload = _token_cache.get(token) or load_callback_token(token)
+            if payload is None:
+                raise ValueError(f"Callback token {token!r} expired")
+            _remember_token(token, payload)
+            return cls.model_validate_json(payload)
+
+        codec = cls.__dict__.get("_fields_codec") or cls._codec()
+        raw_values = rest.split(SEPARATOR) if separator else ()
+        if len(raw_values) > len(codec):
+            raise TypeError(f"Callback data {cls.__name__!r} takes {len(codec)} arguments but {len(raw_values)} were given")
+        values = {}
+        for index, (name, kind, nullable, default) in enumerate(codec):
+            if index >= len(raw_values):
+                values[name] = list(default) if kind == "list" else default
+                continue
+            raw = raw_values[index]
+            if raw == "":
+                values[name] = None if nullable else (raw if kind == "str" else default)
+            elif kind == "int":
+                values[name] = int(raw, 36)
+            elif kind == "str":
+                values[name] = raw
+            elif kind == "bool":
+                values[name] = raw == "1"
+            else:
+                values[name] = [int(item, 36) for item in raw.split(",")]
+        return cls._construct(values)
@@ -1,65 +1,166 @@
 from aiogram import types
 # Correct import for InlineKeyboardBuilder
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.filters.callback_data import CallbackData
-from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 
-from config import PAGE_SIZE
+from config import PAGE_SIZE, DIGEST_PAGE_SIZE, TASK_PRIORITIES, DEFAULT_TASK_PRIORITY
 from db_utils import format_deadline
-
-simple_calendar = SimpleCalendar()
-
-class TaskListFilterCallback(CallbackData, prefix="task_filter"):
+from keyboards.callback_codec import CompactCallbackData
+from recurrence import PRESET_RULES, describe_rule
+
+# Календарь (aiogram_calendar) нужен только при выборе дедлайна, поэтому загружается при первом обращении.
+# Callback-и календаря распознаются по префиксу, не импортируя SimpleCalendarCallback заранее.
+CALENDAR_CALLBACK_PREFIX = "simple_calendar"
+_simple_calendar = None
+
+def get_simple_calendar():
+    global _simple_calendar
+    if _simple_calendar is None:
+        from aiogram_calendar import SimpleCalendar
+        _simple_calendar = SimpleCalendar()
+    return _simple_calendar
+
+def unpack_calendar_callback(data: str):
+    from aiogram_calendar import SimpleCalendarCallback
+    return SimpleCalendarCallback.unpack(data)
+
+# Callback-данные в компактном формате (см. keyboards/callback_codec.py).
+# code — постоянный идентификатор класса в кнопках: не меняйте и не используйте повторно;
+# prefix — старый формат, нужен для распознавания ранее отправленных кнопок.
+class TaskListFilterCallback(CompactCallbackData, prefix="task_filter", code=1):
     filter_type: str
 
-class TaskActionCallback(CallbackData, prefix="task_action"):
+class TaskActionCallback(CompactCallbackData, prefix="task_action", code=2):
     action: str
 
-class CompleteTaskCallback(CallbackData, prefix="complete_task"):
+class CompleteTaskCallback(CompactCallbackData, prefix="complete_task", code=3):
     filter_type: str
     page: int = 0
     task_number: int | None = None
 
-class EditTaskCallback(CallbackData, prefix="edit_task"):
+class EditTaskCallback(CompactCallbackData, prefix="edit_task", code=4):
     page: int = 0
     task_number: int | None = None
     action: str = "view"
 
-class DeleteTaskCallback(CallbackData, prefix="delete_task"):
+class DeleteTaskCallback(CompactCallbackData, prefix="delete_task", code=5):
     page: int = 0
     task_number: int | None = None
     action: str = "view"
 
-class MainMenuCallback(CallbackData, prefix="main_menu"):
+class MainMenuCallback(CompactCallbackData, prefix="main_menu", code=6):
     action: str = "show"
 
-class EnableReminderForTaskCallback(CallbackData, prefix="enable_task_rem"):
+class EnableReminderForTaskCallback(CompactCallbackData, prefix="enable_task_rem", code=7):
     task_internal_id: int
 
-class ReminderIntervalMenuCallback(CallbackData, prefix="rem_interval_menu"):
+class ReminderIntervalMenuCallback(CompactCallbackData, prefix="rem_interval_menu", code=8):
     task_internal_id: int
     page: int = 0
 
-class SetReminderIntervalCallback(CallbackData, prefix="set_rem_interval"):
+class SetReminderIntervalCallback(CompactCallbackData, prefix="set_rem_interval", code=9):
     task_internal_id: int
     hours: int
 
-class RemindersMenuCallback(CallbackData, prefix="rem_menu"):
+class RemindersMenuCallback(CompactCallbackData, prefix="rem_menu", code=10):
     page: int = 0
     action: str = "view"
 
-class RemoveTaskReminderCallback(CallbackData, prefix="remove_task_rem"):
+class RemoveTaskReminderCallback(CompactCallbackData, prefix="remove_task_rem", code=11):
     task_internal_id: int
     current_page: int = 0
 
-class DisableAllRemindersCallback(CallbackData, prefix="disable_all_rem"):
+class DisableAllRemindersCallback(CompactCallbackData, prefix="disable_all_rem", code=12):
+    pass
+
+class MakeRecurringCallback(CompactCallbackData, prefix="make_recur", code=13):
+    task_internal_id: int
+
+class SetRecurrenceCallback(CompactCallbackData, prefix="set_recur", code=14):
+    task_internal_id: int
+    preset: str
+
+class StopRecurrenceCallback(CompactCallbackData, prefix="stop_recur", code=15):
+    recurrence_id: int
+
+# Запрос передаётся в кнопке: длинный или с двоеточием сохраняется на сервере по токену
+class SearchPageCallback(CompactCallbackData, prefix="search_page", code=16, store_overflow=True):
+    page: int = 0
+    query: str = ""
+
+class UndoDeleteCallback(CompactCallbackData, prefix="undo_delete", code=17):
+    task_internal_id: int
+
+class DigestMenuCallback(CompactCallbackData, prefix="digest_menu", code=18):
+    page: int = 0
+
+class SetDigestHourCallback(CompactCallbackData, prefix="set_digest", code=19):
+    hour: int
+
+class DisableDigestCallback(CompactCallbackData, prefix="disable_digest", code=20):
     pass
 
+class DigestPageCallback(CompactCallbackData, prefix="digest_page", code=21):
+    page: int = 0
+
+class BroadcastCallback(CompactCallbackData, prefix="broadcast", code=22):
+    action: str  # "confirm", "cancel" (черновик) или "stop" (запущенная рассылка)
+    broadcast_id: int = 0
+
+class TaskPriorityFilterCallback(CompactCallbackData, prefix="task_prio_filter", code=23):
+    priority: int
+
+class TaskTagFilterCallback(CompactCallbackData, prefix="task_tag_filter", code=24):
+    tag_id: int
+
+class TagsMenuCallback(CompactCallbackData, prefix="tags_menu", code=25):
+    page: int = 0
+
+class SetTaskPriorityCallback(CompactCallbackData, prefix="set_task_prio", code=26):
+    task_internal_id: int
+    priority: int
+
+class ReminderDoneCallback(CompactCallbackData, prefix="reminder_done", code=27):
+    task_internal_id: int
+
+class ReminderSnoozeCallback(CompactCallbackData, prefix="reminder_snooze", code=28):
+    period: str  # ключ REMINDER_SNOOZE_PERIODS
+
+class QuickDeadlineCallback(CompactCallbackData, prefix="quick_deadline", code=29):
+    choice: str  # ключ QUICK_DEADLINES
+
+class DashboardCallback(CompactCallbackData, prefix="dashboard", code=30):
+    action: str  # "refresh" или "off"
+
+class DeadlineConfirmCallback(CompactCallbackData, prefix="deadline_confirm", code=31):
+    confirm: bool
+
+# Быстрый выбор срока над календарём: ключ -> подпись кнопки (она же фраза для dateparse)
+QUICK_DEADLINES = {"today": "Сегодня", "tomorrow": "Завтра", "weekend": "На выходных"}
+
+# Варианты «отложить» в напоминании: ключ -> подпись кнопки
+REMINDER_SNOOZE_PERIODS = {"1h": "⏰ 1 ч", "3h": "⏰ 3 ч", "tomorrow": "⏰ Завтра"}
+
+# Значок приоритета перед задачей в списках; у обычного приоритета значка нет
+def priority_mark(priority: int) -> str:
+    return "" if priority == DEFAULT_TASK_PRIORITY else TASK_PRIORITIES[priority][0] + " "
+
 def get_main_menu_inline_keyboard():
     builder = InlineKeyboardBuilder()
     builder.add(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack()))
     return builder.as_markup()
 
+def build_undo_delete_keyboard(task_internal_id: int):
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(
+        text="↩️ Отменить удаление",
+        callback_data=UndoDeleteCallback(task_internal_id=task_internal_id).pack()
+    ))
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
 def get_reminder_confirmation_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(types.InlineKeyboardButton(
@@ -90,6 +191,18 @@ def get_task_list_keyboard(current_filter: str = None):
         text="Посмотреть все",
         callback_data=TaskListFilterCallback(filter_type="all").pack()
     ))
+    builder.add(types.InlineKeyboardButton(
+        text="Просроченные",
+        callback_data=TaskListFilterCallback(filter_type="overdue").pack()
+    ))
+    builder.add(types.InlineKeyboardButton(
+        text="🔴 Важные",
+        callback_data=TaskPriorityFilterCallback(priority=1).pack()
+    ))
+    builder.add(types.InlineKeyboardButton(
+        text="🏷 По тегам",
+        callback_data=TagsMenuCallback().pack()
+    ))
     if current_filter != "history_all":
         builder.add(types.InlineKeyboardButton(
             text="Завершить задачу",
@@ -102,15 +215,11 @@ def get_task_list_keyboard(current_filter: str = None):
     builder.adjust(2)
     return builder.as_markup()
 
-def build_task_selection_keyboard(tasks, callback_constructor, page=0):
+# page_tasks — уже выбранная из БД страница задач (см. get_active_tasks_page)
+def build_task_selection_keyboard(page_tasks, callback_constructor, page=0, has_next=False):
     builder = InlineKeyboardBuilder()
-    start = page * PAGE_SIZE
-    end = start + PAGE_SIZE
-    page_tasks = tasks[start:end]
 
-    if not page_tasks and page > 0:
-        return build_task_selection_keyboard(tasks, callback_constructor, page - 1)
-    elif not page_tasks:
+    if not page_tasks:
         builder.row(types.InlineKeyboardButton(text="❌ Отмена", callback_data=MainMenuCallback().pack()))
         return builder.as_markup()
 
@@ -130,7 +239,7 @@ def build_task_selection_keyboard(tasks, callback_constructor, page=0):
             text="⬅️ Назад",
             callback_data=callback_constructor(page=page - 1, action="view").pack()
         ))
-    if end < len(tasks):
+    if has_next:
         nav_buttons.append(types.InlineKeyboardButton(
             text="Вперед ➡️",
             callback_data=callback_constructor(page=page + 1, action="view").pack()
@@ -156,10 +265,10 @@ def build_complete_task_keyboard(tasks, filter_type, page=0):
         builder.row(types.InlineKeyboardButton(text="❌ Отмена", callback_data=TaskListFilterCallback(filter_type=filter_type).pack()))
         return builder.as_markup()
 
-    for internal_id, task_number, description, deadline in page_tasks:
+    for internal_id, task_number, description, deadline, priority in page_tasks:
         formatted_deadline = format_deadline(deadline)
         deadline_str = f" ✅({formatted_deadline})" if formatted_deadline else ""
-        button_text = f"{task_number}{deadline_str}"
+        button_text = f"{priority_mark(priority)}{task_number}{deadline_str}"
 
         builder.row(types.InlineKeyboardButton(
             text=button_text,
@@ -186,11 +295,11 @@ def build_complete_task_keyboard(tasks, filter_type, page=0):
     ))
     return builder.as_markup()
 
-def build_edit_task_keyboard(tasks, page=0):
-    return build_task_selection_keyboard(tasks, EditTaskCallback, page)
+def build_edit_task_keyboard(page_tasks, page=0, has_next=False):
+    return build_task_selection_keyboard(page_tasks, EditTaskCallback, page, has_next)
 
-def build_delete_task_keyboard(tasks, page=0):
-    return build_task_selection_keyboard(tasks, DeleteTaskCallback, page)
+def build_delete_task_keyboard(page_tasks, page=0, has_next=False):
+    return build_task_selection_keyboard(page_tasks, DeleteTaskCallback, page, has_next)
 
 def build_reminders_keyboard(tasks, page=0):
     builder = InlineKeyboardBuilder()
@@ -204,7 +313,7 @@ def build_reminders_keyboard(tasks, page=0):
         builder.row(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack()))
         return builder.as_markup()
 
-    for internal_id, task_number, description, deadline in page_tasks:
+    for internal_id, task_number, description, deadline, priority in page_tasks:
         formatted_deadline = format_deadline(deadline)
         deadline_str = f" ({formatted_deadline})" if formatted_deadline else ""
         button_text = f"✅ {task_number}. {description[:30]}{'...' if len(description) > 30 else ''}{deadline_str}"
@@ -279,3 +388,224 @@ def build_reminder_intervals_keyboard(task_internal_id: int, page: int = 0):
     ))
     return builder.as_markup()
 
+
+
+def build_digest_hours_keyboard(page: int = 0, enabled: bool = False):
+    builder = InlineKeyboardBuilder()
+    # Пагинация часов 0..23, по 6 на страницу (два ряда по три)
+    all_hours = list(range(24))
+    per_page = 6
+    start = page * per_page
+    end = start + per_page
+    page_hours = all_hours[start:end]
+
+    if not page_hours and page > 0:
+        return build_digest_hours_keyboard(page - 1, enabled)
+
+    builder.row(*[types.InlineKeyboardButton(
+        text=f"{h:02d}:00",
+        callback_data=SetDigestHourCallback(hour=h).pack()
+    ) for h in page_hours[:3]])
+    if page_hours[3:]:
+        builder.row(*[types.InlineKeyboardButton(
+            text=f"{h:02d}:00",
+            callback_data=SetDigestHourCallback(hour=h).pack()
+        ) for h in page_hours[3:]])
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=DigestMenuCallback(page=page - 1).pack()
+        ))
+    if end < len(all_hours):
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=DigestMenuCallback(page=page + 1).pack()
+        ))
+    if nav_buttons:
+        builder.row(*nav_buttons)
+
+    if enabled:
+        builder.row(types.InlineKeyboardButton(
+            text="❌ Отключить сводку",
+            callback_data=DisableDigestCallback().pack()
+        ))
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+def build_digest_keyboard(total: int, page: int = 0):
+    builder = InlineKeyboardBuilder()
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=DigestPageCallback(page=page - 1).pack()
+        ))
+    if (page + 1) * DIGEST_PAGE_SIZE < total:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=DigestPageCallback(page=page + 1).pack()
+        ))
+    if nav_buttons:
+        builder.row(*nav_buttons)
+
+    builder.row(types.InlineKeyboardButton(
+        text="Завершить задачу",
+        callback_data=TaskActionCallback(action="complete_task_due").pack()
+    ))
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+
+def build_recurrence_presets_keyboard(task_internal_id: int):
+    builder = InlineKeyboardBuilder()
+    for preset, (rule, label) in PRESET_RULES.items():
+        builder.row(types.InlineKeyboardButton(
+            text=f"🔁 {label}",
+            callback_data=SetRecurrenceCallback(task_internal_id=task_internal_id, preset=preset).pack()
+        ))
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+def build_recurrences_keyboard(recurrences):
+    builder = InlineKeyboardBuilder()
+    for recurrence_id, description, rule, start_date in recurrences:
+        button_text = f"⏹ {description[:30]}{'...' if len(description) > 30 else ''} ({describe_rule(rule)})"
+        builder.row(types.InlineKeyboardButton(
+            text=button_text,
+            callback_data=StopRecurrenceCallback(recurrence_id=recurrence_id).pack()
+        ))
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+
+def build_search_results_keyboard(query_text: str, page: int, has_next: bool):
+    builder = InlineKeyboardBuilder()
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=SearchPageCallback(page=page - 1, query=query_text).pack()
+        ))
+    if has_next:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=SearchPageCallback(page=page + 1, query=query_text).pack()
+        ))
+    if nav_buttons:
+        builder.row(*nav_buttons)
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+def build_broadcast_confirm_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        types.InlineKeyboardButton(text="✅ Отправить", callback_data=BroadcastCallback(action="confirm").pack()),
+        types.InlineKeyboardButton(text="❌ Отмена", callback_data=BroadcastCallback(action="cancel").pack())
+    )
+    return builder.as_markup()
+
+def build_broadcast_stop_keyboard(broadcast_id: int):
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(
+        text="⏹ Остановить рассылку",
+        callback_data=BroadcastCallback(action="stop", broadcast_id=broadcast_id).pack()
+    ))
+    return builder.as_markup()
+
+def build_task_priority_keyboard(task_internal_id: int):
+    builder = InlineKeyboardBuilder()
+    for priority, (icon, name) in TASK_PRIORITIES.items():
+        builder.add(types.InlineKeyboardButton(
+            text=f"{icon} {name}",
+            callback_data=SetTaskPriorityCallback(task_internal_id=task_internal_id, priority=priority).pack()
+        ))
+    return builder.as_markup()
+
+# tags — [(id, name, active_count), ...] (см. get_user_tags)
+def build_tags_keyboard(tags, page: int = 0):
+    builder = InlineKeyboardBuilder()
+    start = page * PAGE_SIZE * 2
+    end = start + PAGE_SIZE * 2
+    for tag_id, name, active_count in tags[start:end]:
+        builder.add(types.InlineKeyboardButton(
+            text=f"#{name} ({active_count})",
+            callback_data=TaskTagFilterCallback(tag_id=tag_id).pack()
+        ))
+    builder.adjust(2)
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=TagsMenuCallback(page=page - 1).pack()
+        ))
+    if end < len(tags):
+        nav_buttons.append(types.InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=TagsMenuCallback(page=page + 1).pack()
+        ))
+    if nav_buttons:
+        builder.row(*nav_buttons)
+    builder.row(types.InlineKeyboardButton(
+        text="🏠 Главное меню",
+        callback_data=MainMenuCallback().pack()
+    ))
+    return builder.as_markup()
+
+# Клавиатура напоминания: «выполнено» по каждой задаче из текста, «отложить» и переход к списку задач.
+# Строится при планировании и хранится в очереди отправки, поэтому отправка не обращается к задачам.
+def build_reminder_keyboard(tasks, button_filter: str):
+    builder = InlineKeyboardBuilder()
+    for task_internal_id, task_number, description, overdue in tasks:
+        builder.add(types.InlineKeyboardButton(
+            text=f"✅ №{task_number}",
+            callback_data=ReminderDoneCallback(task_internal_id=task_internal_id).pack()
+        ))
+    builder.adjust(3)
+    builder.row(*(types.InlineKeyboardButton(text=label, callback_data=ReminderSnoozeCallback(period=period).pack())
+                  for period, label in REMINDER_SNOOZE_PERIODS.items()))
+    builder.row(types.InlineKeyboardButton(
+        text="Посмотреть задачи",
+        callback_data=TaskListFilterCallback(filter_type=button_filter).pack()
+    ))
+    return builder.as_markup()
+
+# Календарь выбора срока со строкой быстрого выбора (сегодня/завтра/на выходных) над ним
+async def build_deadline_keyboard():
+    markup = await get_simple_calendar().start_calendar()
+    quick_row = [types.InlineKeyboardButton(text=label, callback_data=QuickDeadlineCallback(choice=choice).pack())
+                 for choice, label in QUICK_DEADLINES.items()]
+    return types.InlineKeyboardMarkup(inline_keyboard=[quick_row, *markup.inline_keyboard])
+
+def build_dashboard_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.add(types.InlineKeyboardButton(text="🔄 Обновить", callback_data=DashboardCallback(action="refresh").pack()))
+    builder.add(types.InlineKeyboardButton(text="✖️ Отключить", callback_data=DashboardCallback(action="off").pack()))
+    return builder.as_markup()
+
+# Подтверждение срока, найденного в описании задачи неуверенно ("купить 1.5 кг" — 1 мая?)
+def build_deadline_confirm_keyboard(deadline_display: str):
+    builder = InlineKeyboardBuilder()
+    builder.add(types.InlineKeyboardButton(text=f"✅ Да, срок {deadline_display}",
+                                           callback_data=DeadlineConfirmCallback(confirm=True).pack()))
+    builder.add(types.InlineKeyboardButton(text="📅 Другой срок",
+                                           callback_data=DeadlineConfirmCallback(confirm=False).pack()))
+    builder.adjust(1)
+    return builder.as_markup()
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+from config import DRAIN_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+# Управление жизненным циклом процесса бота.
+# Хранит ссылки на фоновые задачи (иначе asyncio может собрать их сборщиком мусора, а ошибки теряются),
+# отслеживает обрабатываемые в данный момент апдейты и при остановке (SIGTERM/SIGINT → остановка polling →
+# shutdown диспетчера) даёт им завершиться до дедлайна, пока сессия бота ещё открыта.
+# Фоновые задачи останавливаются кооперативно: проверяют `stopping` между отправками и спят через `sleep()`.
+class Lifecycle:
+    def __init__(self, drain_timeout: float = DRAIN_TIMEOUT_SECONDS):
+        self.drain_timeout = drain_timeout
+        self._stopping = asyncio.Event()
+        self._background_tasks = set()
+        self._in_flight = set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def start_background(self, coro, name: str) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return task
+
+    def _on_background_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background task %s crashed: %r", task.get_name(), task.exception())
+
+    # Пауза между проходами фоновой задачи. Возвращает False, если началась остановка — пора выходить.
+    async def sleep(self, seconds: float) -> bool:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    # Outer-middleware диспетчера: учитывает апдейты, которые сейчас обрабатываются
+    async def track_update(self, handler, event, data):
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(task)
+
+    def request_stop(self):
+        self._stopping.set()
+
+    # Регистрируется в dp.shutdown: вызывается после остановки polling, до закрытия сессии бота
+    async def shutdown(self):
+        self.request_stop()
+        current = asyncio.current_task()
+        pending = {task for task in self._in_flight | self._background_tasks if task is not current and not task.done()}
+        if not pending:
+            return
+
+        logger.info("Draining %s in-flight updates and %s background tasks (timeout %.0fs)...",
+                    len(self._in_flight), len(self._background_tasks), self.drain_timeout)
+        done, pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+        if pending:
+            logger.warning("Drain timeout: cancelling %s unfinished tasks.", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending, timeout=1)
+        else:
+            logger.info("Drain finished.")
+
+
+lifecycle = Lifecycle()
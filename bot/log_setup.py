@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE
+
+# Логирование без затрат времени event loop.
+# Обработчик корневого логгера только кладёт запись в очередь; форматирование (в том числе подстановка
+# аргументов "%s" — поэтому в коде пишем logger.info("... %s", value), а не f-строки) и запись в поток
+# выполняются в отдельном потоке QueueListener. Записи выводятся в JSON с дополнительными полями
+# из extra (user_id, handler, duration_ms и т.д.), частые DEBUG-записи прореживаются,
+# уровни отдельных модулей задаются в LOG_LEVELS.
+
+# Атрибуты, которые есть у любой LogRecord; всё остальное пришло из extra
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Логгер обработки апдейтов: длительность каждого обработчика пишется на уровне DEBUG (LOG_LEVELS=updates=DEBUG)
+updates_logger = logging.getLogger("updates")
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Пропускает первую и далее каждую N-ю DEBUG-запись с одним и тем же шаблоном сообщения
+class DebugSamplingFilter(logging.Filter):
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self._counts = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        key = (record.name, record.msg)
+        count = self._counts[key]
+        self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Стандартный QueueHandler форматирует запись ещё в вызывающем потоке; очередь здесь внутри процесса,
+    # поэтому запись передаётся как есть и форматируется в потоке QueueListener.
+    # Аргументы сообщения должны быть неизменяемыми (числа, строки) — они читаются позже.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+    stream_handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # Дописываем записи, оставшиеся в очереди, при выходе из процесса
+    atexit.register(_listener.stop)
+    return _listener
+
+
+# Inner-middleware диспетчера: время работы обработчика с user_id и именем обработчика
+async def log_handler_duration(handler, event, data):
+    if not updates_logger.isEnabledFor(logging.DEBUG):
+        return await handler(event, data)
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        user = data.get("event_from_user")
+        handler_object = data.get("handler")
+        updates_logger.debug("Handled %s", type(event).__name__, extra={
+            "user_id": user.id if user else None,
+            "handler": handler_object.callback.__name__ if handler_object else None,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
@@ -1,108 +1,166 @@
+import time
+
+_process_started = time.perf_counter()
+
 import asyncio
 import logging
-import sqlite3  # Keep for send_hourly_reminders direct DB access
-from aiogram import Bot, Dispatcher, types
-import aiogram.exceptions
-from datetime import datetime, timedelta
-
-from config import TOKEN, welcome_text
-from db_utils import init_db, get_tasks_for_user
-from handlers.users import welcome_router, task_router
-from keyboards.inline import TaskListFilterCallback
-
-# Инициализация бота и диспетчера
-bot = Bot(TOKEN)
-dp = Dispatcher()
-
-# Включаем логирование
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-
-
-# Фоновая задача для отправки напоминаний
-async def send_hourly_reminders(bot: Bot):
-    while True:
-        await asyncio.sleep(3600)  # Ждем 1 час (3600 секунд)
-        logging.info("Running hourly reminders check...")
-        conn = sqlite3.connect('todo.db')  # Directly use 'todo.db' as it's a known constant
-        cursor = conn.cursor()
-
-        # Получаем user_id всех пользователей, у которых есть хоть одна задача с remind_me = 1
-        # И где время последнего напоминания (или его отсутствие) указывает, что пора напомнить
-        cursor.execute("""
-            SELECT DISTINCT t.user_id, urs.last_reminded_at, COALESCE(urs.interval_hours, 1) as interval_hours
-            FROM tasks t
-            JOIN user_reminder_status urs ON t.user_id = urs.user_id
-            WHERE t.remind_me = 1 AND t.status = 'active'
-        """)
-        users_to_check = cursor.fetchall()
-
-        current_time = datetime.now()
-
-        for user_id, last_reminded_str, interval_hours in users_to_check:
-            should_remind = False
-            if not last_reminded_str:
-                should_remind = True  # Если никогда не напоминали, то напоминаем
-            else:
-                last_reminded_dt = datetime.strptime(last_reminded_str, '%Y-%m-%d %H:%M:%S')
-                # Если с последнего напоминания прошел указанный интервал или более
-                if (current_time - last_reminded_dt) >= timedelta(hours=interval_hours or 1):
-                    should_remind = True
-
-            if should_remind:
-                # Получаем количество активных задач на СЕГОДНЯ, для которых включено напоминание
-                today_date_str = current_time.strftime('%Y-%m-%d')
-
-                # Re-fetch tasks using get_tasks_for_user from db_utils
-                # We need to filter for tasks with remind_me = 1 explicitly here
-                conn_inner = sqlite3.connect('todo.db')  # Separate connection for this specific query
-                cursor_inner = conn_inner.cursor()
-                cursor_inner.execute("""
-                    SELECT COUNT(*) FROM tasks
-                    WHERE user_id = ? AND status = 'active' AND deadline = ? AND remind_me = 1
-                """, (user_id, today_date_str))
-                active_today_remindable_task_count = cursor_inner.fetchone()[0]
-                conn_inner.close()
-
-                if active_today_remindable_task_count > 0:
-                    reminder_message = f"Привет! На сегодня у тебя {active_today_remindable_task_count} незавершенных задач, по которым я должен напомнить!"
-                    builder = types.InlineKeyboardBuilder()
-                    builder.add(types.InlineKeyboardButton(
-                        text="Посмотреть задачи",
-                        callback_data=TaskListFilterCallback(filter_type="today").pack()
-                        # Кнопка для просмотра задач на сегодня
-                    ))
-                    try:
-                        await bot.send_message(chat_id=user_id, text=reminder_message, reply_markup=builder.as_markup())
-                        # Обновляем время последнего напоминания в user_reminder_status
-                        cursor.execute("UPDATE user_reminder_status SET last_reminded_at = ? WHERE user_id = ?",
-                                       (current_time.strftime('%Y-%m-%d %H:%M:%S'), user_id))
-                        conn.commit()
-                        logging.info(
-                            f"Reminder sent to user {user_id} for {active_today_remindable_task_count} today's remindable tasks.")
-                    except aiogram.exceptions.TelegramForbiddenError:
-                        logging.warning(
-                            f"Bot blocked by user {user_id}. Removing from user_reminder_status and setting remind_me=0 for their tasks.")
-                        # Удаляем пользователя из таблицы user_reminder_status, если он заблокировал бота
-                        cursor.execute("DELETE FROM user_reminder_status WHERE user_id = ?", (user_id,))
-                        # Отключаем все напоминания для этого пользователя
-                        cursor.execute("UPDATE tasks SET remind_me = 0 WHERE user_id = ?", (user_id,))
-                        conn.commit()
-                    except Exception as e:
-                        logging.error(f"Error sending reminder to user {user_id}: {e}")
-        conn.close()
+import re
+import sqlite3
+import sys
+from contextlib import contextmanager
 
+from config import TOKEN, DATABASE_NAME, STARTUP_BUDGET_SECONDS, WORKER_PROCESSES
+from log_setup import setup_logging, log_handler_duration
 
-# Главная функция запуска бота
-async def main():
-    init_db()
+# Включаем логирование: записи уходят в очередь и пишутся отдельным потоком (см. log_setup.py)
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Длительность фаз запуска (в секундах) — выводится в лог при старте и в отчёте --check
+startup_timings = {}
+
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+def format_startup_report() -> str:
+    phases = ", ".join(f"{name}: {duration * 1000:.0f} ms" for name, duration in startup_timings.items())
+    return f"{(time.perf_counter() - _process_started) * 1000:.0f} ms ({phases})"
+
+
+# Быстрая проверка конфигурации и схемы БД без импорта aiogram и создания диспетчера.
+# Возвращает код выхода: 0 — всё в порядке, 1 — найдены проблемы.
+def run_check() -> int:
+    problems = []
+
+    with startup_phase("config"):
+        if not TOKEN:
+            problems.append("TOKEN is not set (.env or environment)")
+        elif not re.fullmatch(r"\d+:[\w-]+", TOKEN):
+            problems.append("TOKEN does not look like a Telegram bot token")
+
+    with startup_phase("schema"):
+        from migrations import LATEST_VERSION, get_schema_version
+        try:
+            conn = sqlite3.connect(f"file:{DATABASE_NAME}?mode=ro", uri=True)
+            try:
+                schema_version = get_schema_version(conn)
+            finally:
+                conn.close()
+            if schema_version < LATEST_VERSION:
+                problems.append(f"database schema version {schema_version} is behind {LATEST_VERSION}; "
+                                f"pending migrations will be applied on the next start")
+        except sqlite3.OperationalError as e:
+            problems.append(f"cannot open database {DATABASE_NAME}: {e}")
+
+    elapsed = time.perf_counter() - _process_started
+    if elapsed > STARTUP_BUDGET_SECONDS:
+        problems.append(f"check took {elapsed:.3f}s, budget is {STARTUP_BUDGET_SECONDS:.3f}s")
+
+    print(f"Check finished in {format_startup_report()}")
+    for problem in problems:
+        print(f"  - {problem}")
+    print("OK" if not problems else "FAILED")
+    return 0 if not problems else 1
+
+
+# Диспетчер со всеми роутерами и middleware — обрабатывает апдейты в однопроцессном режиме и в каждом воркере
+def build_dispatcher():
+    from aiogram import Dispatcher
+    from handlers.users import welcome_router, task_router
+    from handlers.inline_mode import inline_router
+    from handlers.chat_member import chat_member_router
+    from handlers.admin import admin_router
+    from handlers.shared_lists import shared_list_router
+    from handlers.dashboard import dashboard_router
+    from shared_lists import resolve_task_scope
+    from analytics import track_activity
+    from lifecycle import lifecycle
+
+    dp = Dispatcher()
+    dp.include_router(admin_router)
+    dp.include_router(shared_list_router)
     dp.include_router(welcome_router)
     dp.include_router(task_router)
-    # Запускаем фоновую задачу напоминаний
-    asyncio.create_task(send_hourly_reminders(bot))
-    await dp.start_polling(bot)
+    dp.include_router(dashboard_router)
+    dp.include_router(inline_router)
+    dp.include_router(chat_member_router)
+    # Учёт обрабатываемых апдейтов и их дренаж при остановке (SIGTERM/SIGINT)
+    dp.update.outer_middleware(lifecycle.track_update)
+    dp.shutdown.register(lifecycle.shutdown)
+    # Активность пользователей для аналитики администратора
+    dp.update.outer_middleware(track_activity)
+    # Владелец задач апдейта (scope_id): пользователь или общий список группы
+    dp.update.outer_middleware(resolve_task_scope)
+    # Длительность обработчиков в структурированном логе (уровень DEBUG логгера updates)
+    dp.message.middleware(log_handler_duration)
+    dp.callback_query.middleware(log_handler_duration)
+    dp.inline_query.middleware(log_handler_duration)
+    return dp
+
+
+# Главная функция запуска бота
+async def main():
+    # Тяжёлые модули (aiogram, роутеры, callback-схемы) импортируются только при реальном запуске
+    with startup_phase("imports"):
+        from aiogram import Bot
+        from jobs import (send_hourly_reminders, deliver_reminders, send_daily_digests, detect_overdue_tasks,
+                          purge_old_tasks, cleanup_blocked_users_job, run_broadcasts, backup_database,
+                          update_dashboards)
+        from db_utils import init_db
+        from lifecycle import lifecycle
+        from profiler import loop_monitor
+        from workers import WorkerPool
+
+    with startup_phase("init_db"):
+        init_db()
+
+    with startup_phase("dispatcher"):
+        # Инициализация бота и диспетчера
+        bot = Bot(TOKEN)
+        dp = build_dispatcher()
+        if WORKER_PROCESSES:
+            # Этот процесс только получает апдейты и раздаёт их воркерам по user_id (см. workers.py)
+            pool = WorkerPool(WORKER_PROCESSES, build_dispatcher)
+            pool.start()
+            allowed_updates = dp.resolve_used_update_types()
+            dp = pool.build_front_dispatcher()
+
+    logger.info("Startup finished in %s", format_startup_report())
+
+    # Запускаем фоновые задачи; при остановке они завершают текущую отправку и выходят
+    lifecycle.start_background(send_hourly_reminders(), "hourly_reminders")
+    lifecycle.start_background(deliver_reminders(bot), "reminder_delivery")
+    lifecycle.start_background(send_daily_digests(bot), "daily_digests")
+    lifecycle.start_background(detect_overdue_tasks(), "overdue_detector")
+    lifecycle.start_background(purge_old_tasks(), "archive_purge")
+    lifecycle.start_background(cleanup_blocked_users_job(), "blocked_users_cleanup")
+    lifecycle.start_background(run_broadcasts(bot), "broadcasts")
+    lifecycle.start_background(backup_database(), "database_backup")
+    lifecycle.start_background(update_dashboards(bot), "dashboards")
+    lifecycle.start_background(loop_monitor.run(lifecycle), "loop_lag_monitor")
+    if not WORKER_PROCESSES:
+        await dp.start_polling(bot)
+        return
+
+    lifecycle.start_background(pool.supervise(lifecycle), "worker_supervisor")
+    try:
+        # Апдейты раздаются по порядку получения, чтобы сохранить порядок сообщений каждого пользователя
+        await dp.start_polling(bot, allowed_updates=allowed_updates, handle_as_tasks=False)
+    finally:
+        await pool.stop()
 
 
 if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        sys.exit(run_check())
+
     print("Бот запускается... Нажмите Ctrl+C для остановки.")
     try:
         asyncio.run(main())
@@ -110,4 +168,3 @@ if __name__ == "__main__":
         print("Бот остановлен.")
     except Exception as e:
         print(f"Произошла ошибка: {e}")
-
@@ -0,0 +1,671 @@
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Версионированные миграции схемы БД.
+# Каждая миграция — (номер, название, функция(cursor)); номера строго возрастают, новые добавляются в конец.
+# Миграция выполняется в одной транзакции вместе с записью в schema_version, поэтому после падения
+# незавершённый шаг откатывается и повторяется при следующем запуске. Миграции должны быть
+# идемпотентны к БД, созданным до появления schema_version (столбцы/таблицы могут уже существовать).
+
+
+def _columns(cursor, table: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {col[1] for col in cursor.fetchall()}
+
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str) -> bool:
+    if column in _columns(cursor, table):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return True
+
+
+def _migration_0001_baseline(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            task_number INTEGER,
+            description TEXT NOT NULL,
+            deadline TEXT,
+            status TEXT DEFAULT 'active',
+            remind_me INTEGER DEFAULT 0 -- 0: не напоминать, 1: напоминать
+        )
+    ''')
+
+    if _add_column_if_missing(cursor, "tasks", "task_number", "INTEGER"):
+        # Нумеруем задачи каждого пользователя одним запросом вместо цикла по пользователям
+        cursor.execute('''
+            WITH numbered AS (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM tasks
+            )
+            UPDATE tasks SET task_number = numbered.rn FROM numbered WHERE numbered.id = tasks.id
+        ''')
+    if _add_column_if_missing(cursor, "tasks", "status", "TEXT DEFAULT 'active'"):
+        cursor.execute("UPDATE tasks SET status = 'active' WHERE status IS NULL;")
+    if _add_column_if_missing(cursor, "tasks", "remind_me", "INTEGER DEFAULT 0"):
+        cursor.execute("UPDATE tasks SET remind_me = 0 WHERE remind_me IS NULL;")
+
+    try:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_task_number ON tasks (user_id, task_number);")
+    except (sqlite3.IntegrityError, sqlite3.OperationalError) as e:
+        logger.warning(
+            "Could not create unique index 'idx_user_task_number': %s. Please check your database for duplicate (user_id, task_number) pairs if this warning persists.",
+            e)
+
+    # Статус напоминаний пользователя (для контроля частоты)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_reminder_status (
+            user_id INTEGER PRIMARY KEY,
+            last_reminded_at TEXT -- Время последнего напоминания в формате YYYY-MM-DD HH:MM:SS
+        )
+    ''')
+    _add_column_if_missing(cursor, "user_reminder_status", "interval_hours", "INTEGER DEFAULT 1")
+
+    # Статистика пользователя (счетчик завершенных задач)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            completed_tasks_count INTEGER DEFAULT 0
+        )
+    ''')
+
+
+def _migration_0002_daily_digest(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_digest (
+            user_id INTEGER PRIMARY KEY,
+            digest_hour INTEGER NOT NULL, -- Час отправки сводки (0-23)
+            last_sent_date TEXT -- Дата последней отправленной сводки в формате YYYY-MM-DD
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_digest_hour ON user_digest (digest_hour, last_sent_date);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_deadline ON tasks (user_id, status, deadline);")
+
+
+def _migration_0003_overdue(cursor):
+    _add_column_if_missing(cursor, "tasks", "overdue", "INTEGER DEFAULT 0")  # 1: срок прошёл, задача не завершена
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline ON tasks (status, deadline);")
+    # Состояние фоновых задач (high-water mark и т.п.)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+def _migration_0004_recurrences(cursor):
+    _add_column_if_missing(cursor, "tasks", "recurrence_id", "INTEGER")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_recurrences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            rule TEXT NOT NULL, -- подмножество RRULE, см. recurrence.py
+            start_date TEXT NOT NULL, -- YYYY-MM-DD, первое повторение
+            remind_me INTEGER DEFAULT 0,
+            materialized_until TEXT NOT NULL, -- экземпляры созданы по эту дату включительно
+            active INTEGER DEFAULT 1
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recurrences_user ON task_recurrences (user_id, active, materialized_until);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recurrences_pending ON task_recurrences (active, materialized_until);")
+
+
+# Полнотекстовый индекс по описаниям задач (FTS5).
+# Таблица contentless: тексты хранятся только в tasks, а в индексе — токены описания и токен
+# владельца "u<user_id>", поэтому фильтр по пользователю выполняется внутри индекса, а не после MATCH.
+# Индекс поддерживается триггерами; при создании заполняется из существующих задач.
+def _migration_0005_search_index(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'")
+    if cursor.fetchone():
+        return
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE tasks_fts USING fts5(
+                description, owner, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning("FTS5 is not available, task search will fall back to LIKE: %s", e)
+        return
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, description, owner) VALUES (new.id, new.description, 'u' || new.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, description, owner) VALUES ('delete', old.id, old.description, 'u' || old.user_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF description, user_id ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, description, owner) VALUES ('delete', old.id, old.description, 'u' || old.user_id);
+            INSERT INTO tasks_fts (rowid, description, owner) VALUES (new.id, new.description, 'u' || new.user_id);
+        END
+    """)
+    cursor.execute("INSERT INTO tasks_fts (rowid, description, owner) SELECT id, description, 'u' || user_id FROM tasks")
+
+
+def _migration_0006_soft_delete_archive(cursor):
+    if _add_column_if_missing(cursor, "tasks", "completed_at", "TEXT"):
+        # Время завершения старых задач неизвестно — отсчитываем срок хранения от момента обновления
+        cursor.execute("UPDATE tasks SET completed_at = ? WHERE status = 'completed'",
+                       (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    _add_column_if_missing(cursor, "tasks", "deleted_at", "TEXT")  # задача удалена мягко (status = 'deleted')
+
+    # Индексы для фоновой архивации завершённых и удалённых задач
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_completed_at ON tasks (completed_at) WHERE status = 'completed';")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_deleted_at ON tasks (deleted_at) WHERE status = 'deleted';")
+
+    # Холодный архив: старые завершённые и удалённые задачи переносятся сюда из tasks
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            task_number INTEGER,
+            description TEXT NOT NULL,
+            deadline TEXT,
+            status TEXT,
+            completed_at TEXT,
+            deleted_at TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+
+
+# Исходящие напоминания (outbox): планировщик ставит сообщение в очередь в одной транзакции с отметкой
+# last_reminded_at, отправитель разбирает очередь пачками. dedup_key не даёт поставить одно и то же
+# напоминание дважды; сообщения, исчерпавшие попытки, остаются со статусом 'failed' (dead letter).
+def _migration_0007_reminder_outbox(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            dedup_key TEXT NOT NULL UNIQUE, -- например "reminder:<user_id>:<YYYY-MM-DD HH>"
+            text TEXT NOT NULL,
+            button_filter TEXT, -- фильтр списка задач для кнопки "Посмотреть задачи"
+            status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'sent', 'failed'
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL, -- YYYY-MM-DD HH:MM:SS
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON reminder_outbox (next_attempt_at) WHERE status = 'pending';")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending_user ON reminder_outbox (user_id) WHERE status = 'pending';")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_sent_at ON reminder_outbox (sent_at) WHERE status = 'sent';")
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS reminder_outbox_dead_letters AS
+        SELECT id, user_id, text, attempts, last_error, created_at, next_attempt_at
+        FROM reminder_outbox WHERE status = 'failed'
+    ''')
+
+
+# Пользователи, заблокировавшие бота (по ошибке отправки или обновлению my_chat_member).
+# Планировщики исключают их поиском по первичному ключу, а очистка их напоминаний и сводок
+# выполняется отдельной фоновой задачей пачками (cleaned_at IS NULL — ещё не очищены).
+def _migration_0008_blocked_users(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blocked_users (
+            user_id INTEGER PRIMARY KEY,
+            reason TEXT, -- 'forbidden' (ошибка отправки) или 'kicked' (my_chat_member)
+            blocked_at TEXT NOT NULL,
+            cleaned_at TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blocked_users_pending ON blocked_users (blocked_at) WHERE cleaned_at IS NULL;")
+
+
+# Счётчики задач пользователя в user_stats, поддерживаемые триггерами в той же транзакции, что и изменение задачи.
+# Счётчики "на сегодня" относятся к дате stats_date; строки с устаревшей (или пустой) датой пересчитываются
+# из tasks при чтении и фоновыми задачами (см. refresh_user_stats в db_utils).
+USER_STATS_COUNTERS = {
+    "active_count": "{t}.status = 'active'",
+    "overdue_count": "{t}.status = 'active' AND {t}.overdue = 1",
+    # Совпадает с условием напоминания: задача на сегодня или просроченная
+    "remind_due_count": "{t}.status = 'active' AND {t}.remind_me = 1 AND ({t}.deadline = {date} OR {t}.overdue = 1)",
+    "remind_overdue_count": "{t}.status = 'active' AND {t}.remind_me = 1 AND {t}.overdue = 1",
+    "completed_today_count": "{t}.status = 'completed' AND substr({t}.completed_at, 1, 10) = {date}",
+}
+
+
+def user_stats_counter_expr(column: str, table: str, date_expr: str) -> str:
+    return f"COALESCE({USER_STATS_COUNTERS[column].format(t=table, date=date_expr)}, 0)"
+
+
+def _migration_0009_user_stats_counters(cursor):
+    for column in USER_STATS_COUNTERS:
+        _add_column_if_missing(cursor, "user_stats", column, "INTEGER NOT NULL DEFAULT 0")
+    _add_column_if_missing(cursor, "user_stats", "stats_date", "TEXT")  # NULL — счётчики ещё не посчитаны
+    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) SELECT DISTINCT user_id FROM tasks")
+    cursor.execute("UPDATE user_stats SET stats_date = NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_date ON user_stats (stats_date);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_remind_due ON user_stats (stats_date) WHERE remind_due_count > 0;")
+
+    def delta(sign_rows):
+        return ",\n".join(
+            f"{column} = {column}" + "".join(f" {sign} {user_stats_counter_expr(column, row, 'stats_date')}"
+                                             for sign, row in sign_rows)
+            for column in USER_STATS_COUNTERS
+        )
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_stats_insert AFTER INSERT ON tasks BEGIN
+            INSERT OR IGNORE INTO user_stats (user_id) VALUES (new.user_id);
+            UPDATE user_stats SET {delta([("+", "new")])} WHERE user_id = new.user_id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_stats_delete AFTER DELETE ON tasks BEGIN
+            UPDATE user_stats SET {delta([("-", "old")])} WHERE user_id = old.user_id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_stats_update
+        AFTER UPDATE OF status, remind_me, deadline, overdue, completed_at ON tasks BEGIN
+            INSERT OR IGNORE INTO user_stats (user_id) VALUES (new.user_id);
+            UPDATE user_stats SET {delta([("+", "new"), ("-", "old")])} WHERE user_id = new.user_id;
+        END
+    """)
+
+
+# Дневные агрегаты продуктивности для /stats: одна строка на пользователя и день завершения.
+# Обновляются триггером при завершении задачи, поэтому статистика не требует обхода всей истории задач.
+# Вовремя/с опозданием считаются только задачи со сроком; время выполнения — от created_at до completed_at.
+def _migration_0010_daily_stats(cursor):
+    _add_column_if_missing(cursor, "tasks", "created_at", "TEXT")  # YYYY-MM-DD HH:MM:SS, у старых задач не задано
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL, -- YYYY-MM-DD, дата завершения
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            on_time_count INTEGER NOT NULL DEFAULT 0,
+            late_count INTEGER NOT NULL DEFAULT 0,
+            lead_time_seconds REAL NOT NULL DEFAULT 0, -- сумма времени выполнения задач с известным created_at
+            lead_time_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    rollup_columns = """
+        1,
+        COALESCE(t.deadline IS NOT NULL AND substr(t.completed_at, 1, 10) <= t.deadline, 0),
+        COALESCE(t.deadline IS NOT NULL AND substr(t.completed_at, 1, 10) > t.deadline, 0),
+        COALESCE((julianday(t.completed_at) - julianday(t.created_at)) * 86400, 0),
+        t.created_at IS NOT NULL
+    """
+    upsert = """
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            completed_count = completed_count + excluded.completed_count,
+            on_time_count = on_time_count + excluded.on_time_count,
+            late_count = late_count + excluded.late_count,
+            lead_time_seconds = lead_time_seconds + excluded.lead_time_seconds,
+            lead_time_count = lead_time_count + excluded.lead_time_count
+    """
+    insert = """
+        INSERT INTO user_daily_stats
+            (user_id, day, completed_count, on_time_count, late_count, lead_time_seconds, lead_time_count)
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_daily_stats_complete
+        AFTER UPDATE OF status ON tasks
+        WHEN new.status = 'completed' AND old.status != 'completed' AND new.completed_at IS NOT NULL
+        BEGIN
+            {insert}
+            SELECT t.user_id, substr(t.completed_at, 1, 10), {rollup_columns}
+            FROM (SELECT new.user_id AS user_id, new.deadline AS deadline,
+                         new.completed_at AS completed_at, new.created_at AS created_at) AS t
+            WHERE true
+            {upsert};
+        END
+    """)
+
+    # Заполнение по уже завершённым задачам, включая архив
+    cursor.execute(f"""
+        {insert}
+        SELECT t.user_id, substr(t.completed_at, 1, 10), {rollup_columns}
+        FROM (
+            SELECT user_id, deadline, completed_at, created_at FROM tasks
+            WHERE status = 'completed' AND completed_at IS NOT NULL
+            UNION ALL
+            SELECT user_id, deadline, completed_at, NULL FROM tasks_archive
+            WHERE status = 'completed' AND completed_at IS NOT NULL
+        ) AS t
+        WHERE true
+        {upsert}
+    """)
+
+
+# Пользователи бота, активность по дням и ежедневная аналитика для администраторов.
+# daily_analytics обновляется триггерами (новая активность, новый пользователь, создание и завершение задачи),
+# поэтому /analytics читает несколько строк вместо подсчёта по tasks и user_activity.
+# broadcasts — рассылки администратора; last_user_id — курсор, с которого рассылка продолжается после перезапуска.
+def _migration_0011_admin_analytics(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_users (
+            user_id INTEGER PRIMARY KEY,
+            first_seen_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_activity (
+            day TEXT NOT NULL, -- YYYY-MM-DD
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_analytics (
+            day TEXT PRIMARY KEY, -- YYYY-MM-DD
+            active_users INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            tasks_created INTEGER NOT NULL DEFAULT 0,
+            tasks_completed INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'running', 'done', 'cancelled'
+            last_user_id INTEGER NOT NULL DEFAULT 0, -- рассылка дошла до этого user_id включительно
+            total_count INTEGER NOT NULL DEFAULT 0,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            progress_chat_id INTEGER, -- сообщение администратору с прогрессом рассылки
+            progress_message_id INTEGER,
+            finished_at TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status, id);")
+
+    # Пользователи, известные до появления bot_users, — все, у кого есть задачи или настройки.
+    # Заполняются до создания триггеров; в daily_analytics они попадают по дню первой задачи.
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("""
+        INSERT OR IGNORE INTO bot_users (user_id, first_seen_at)
+        SELECT user_id, COALESCE(MIN(created_at), ?) FROM (
+            SELECT user_id, created_at FROM tasks
+            UNION ALL SELECT user_id, NULL FROM user_stats
+            UNION ALL SELECT user_id, NULL FROM user_reminder_status
+            UNION ALL SELECT user_id, NULL FROM user_digest
+        ) GROUP BY user_id
+    """, (now,))
+    cursor.execute("""
+        INSERT INTO daily_analytics (day, new_users)
+        SELECT substr(first_seen_at, 1, 10), COUNT(*) FROM bot_users GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET new_users = excluded.new_users
+    """)
+
+    for name, table, column in (("user_activity_analytics", "user_activity", "active_users"),
+                                ("bot_users_analytics", "bot_users", "new_users")):
+        day = "new.day" if table == "user_activity" else "substr(new.first_seen_at, 1, 10)"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER INSERT ON {table} BEGIN
+                INSERT INTO daily_analytics (day, {column}) VALUES ({day}, 1)
+                ON CONFLICT (day) DO UPDATE SET {column} = {column} + 1;
+            END
+        """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_created_analytics AFTER INSERT ON tasks
+        WHEN new.created_at IS NOT NULL
+        BEGIN
+            INSERT INTO daily_analytics (day, tasks_created) VALUES (substr(new.created_at, 1, 10), 1)
+            ON CONFLICT (day) DO UPDATE SET tasks_created = tasks_created + 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_completed_analytics
+        AFTER UPDATE OF status ON tasks
+        WHEN new.status = 'completed' AND old.status != 'completed' AND new.completed_at IS NOT NULL
+        BEGIN
+            INSERT INTO daily_analytics (day, tasks_completed) VALUES (substr(new.completed_at, 1, 10), 1)
+            ON CONFLICT (day) DO UPDATE SET tasks_completed = tasks_completed + 1;
+        END
+    """)
+
+    # Создание и завершение задач за прошлые дни (created_at есть только у задач, созданных после миграции 10)
+    cursor.execute("""
+        INSERT INTO daily_analytics (day, tasks_created)
+        SELECT substr(created_at, 1, 10), COUNT(*) FROM tasks WHERE created_at IS NOT NULL GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET tasks_created = excluded.tasks_created
+    """)
+    cursor.execute("""
+        INSERT INTO daily_analytics (day, tasks_completed)
+        SELECT day, SUM(completed_count) FROM user_daily_stats GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET tasks_completed = excluded.tasks_completed
+    """)
+
+
+# Серверное хранилище callback-данных, не помещающихся в 64 байта (см. keyboards/callback_codec.py)
+def _migration_0012_callback_tokens(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS callback_tokens (
+            token TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_callback_tokens_created_at ON callback_tokens (created_at);")
+
+
+# Теги задачи — слова с # в описании ("#работа", "#дом"), в нижнем регистре, без повторов
+TAG_PATTERN = re.compile(r"#([\w-]{1,32})")
+
+
+def parse_tags(text: str) -> list:
+    return list(dict.fromkeys(tag.lower() for tag in TAG_PATTERN.findall(text or "")))
+
+
+# Приоритеты и теги задач.
+# Списки задач упорядочены по (priority, task_number): порядок берётся из индекса, без сортировки.
+# Теги нормализованы: tags — уникальные (user_id, name), task_tags — связь задачи с тегом;
+# фильтр по тегу идёт от тега к задачам по первичному ключу task_tags.
+def _migration_0013_priorities_tags(cursor):
+    _add_column_if_missing(cursor, "tasks", "priority", "INTEGER NOT NULL DEFAULT 2")  # 1 — высокий, 2 — обычный, 3 — низкий
+    _add_column_if_missing(cursor, "task_recurrences", "priority", "INTEGER NOT NULL DEFAULT 2")  # передаётся экземплярам
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_priority ON tasks (user_id, status, priority, task_number);")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (user_id, name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_tags (
+            tag_id INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_id, task_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_tags_task ON task_tags (task_id);")
+    # Связи с тегами удаляются вместе с задачей (архивация, очистка)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_delete_tags AFTER DELETE ON tasks BEGIN
+            DELETE FROM task_tags WHERE task_id = old.id;
+        END
+    ''')
+
+    # Теги из описаний уже существующих задач: разбор в Python (те же правила, что у parse_tags),
+    # запись — пачкой во временную таблицу и двумя INSERT ... SELECT вместо запросов на каждую задачу
+    cursor.execute("CREATE TEMP TABLE tag_backfill (task_id INTEGER NOT NULL, user_id INTEGER NOT NULL, name TEXT NOT NULL)")
+    tasks = cursor.connection.execute(
+        "SELECT id, user_id, description FROM tasks WHERE description LIKE '%#%' AND status != 'deleted'")
+    cursor.executemany("INSERT INTO tag_backfill (task_id, user_id, name) VALUES (?, ?, ?)",
+                       ((task_id, user_id, tag) for task_id, user_id, description in tasks
+                        for tag in parse_tags(description)))
+    cursor.execute("INSERT OR IGNORE INTO tags (user_id, name) SELECT DISTINCT user_id, name FROM tag_backfill")
+    cursor.execute("""
+        INSERT OR IGNORE INTO task_tags (tag_id, task_id)
+        SELECT tags.id, tag_backfill.task_id FROM tag_backfill
+        JOIN tags ON tags.user_id = tag_backfill.user_id AND tags.name = tag_backfill.name
+    """)
+    cursor.execute("DROP TABLE temp.tag_backfill")
+
+
+# Общие списки задач групповых чатов. Задачи общего списка хранятся в tasks с user_id = chat_id группы
+# (id групп в Telegram отрицательные и не пересекаются с id пользователей), поэтому номера задач, индексы,
+# счётчики и фильтры работают для списка так же, как для пользователя. list_members — участники списка:
+# им можно работать со списком в группе и им приходят уведомления об изменениях.
+def _migration_0014_shared_lists(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shared_lists (
+            chat_id INTEGER PRIMARY KEY,
+            title TEXT,
+            created_by INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS list_members (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            joined_at TEXT NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+# Напоминания с кнопками: клавиатура сообщения (JSON) сохраняется в очереди отправки при планировании,
+# отложенное пользователем напоминание не планируется до snoozed_until
+def _migration_0015_actionable_reminders(cursor):
+    _add_column_if_missing(cursor, "reminder_outbox", "reply_markup", "TEXT")
+    _add_column_if_missing(cursor, "user_reminder_status", "snoozed_until", "TEXT")
+
+
+# Закреплённая панель "на сегодня": сообщение, которое бот редактирует при изменении задач.
+# Триггеры отмечают в dashboard_dirty владельцев задач, у которых есть панель (для остальных — одна проверка
+# по первичному ключу); фоновая задача раз в несколько секунд обновляет отмеченные панели, поэтому
+# несколько изменений подряд дают одно редактирование сообщения.
+def _migration_0016_dashboards(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboards (
+            user_id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE TABLE IF NOT EXISTS dashboard_dirty (user_id INTEGER PRIMARY KEY) WITHOUT ROWID")
+    for name, event, row in (("insert", "INSERT", "new"),
+                             ("update", "UPDATE OF status, description, deadline, priority, overdue", "new"),
+                             ("delete", "DELETE", "old")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS tasks_dashboard_{name} AFTER {event} ON tasks
+            WHEN EXISTS (SELECT 1 FROM dashboards WHERE user_id = {row}.user_id) BEGIN
+                INSERT OR IGNORE INTO dashboard_dirty (user_id) VALUES ({row}.user_id);
+            END
+        """)
+
+
+# Версия состава участников общего списка: триггеры увеличивают её при любом вступлении и выходе.
+# Процессы бота кэшируют участников в памяти и сверяют версию не чаще раза в несколько секунд
+# (SHARED_LIST_VERSION_CHECK_SECONDS) — выход из списка учитывается во всех воркерах почти сразу.
+def _migration_0017_list_members_version(cursor):
+    _add_column_if_missing(cursor, "shared_lists", "members_version", "INTEGER NOT NULL DEFAULT 0")
+    for name, event, row in (("insert", "INSERT", "new"), ("delete", "DELETE", "old")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS list_members_version_{name} AFTER {event} ON list_members BEGIN
+                UPDATE shared_lists SET members_version = members_version + 1 WHERE chat_id = {row}.chat_id;
+            END
+        """)
+
+
+MIGRATIONS = [
+    (1, "baseline", _migration_0001_baseline),
+    (2, "daily digest", _migration_0002_daily_digest),
+    (3, "overdue tasks", _migration_0003_overdue),
+    (4, "recurring tasks", _migration_0004_recurrences),
+    (5, "full-text search index", _migration_0005_search_index),
+    (6, "soft delete and archive", _migration_0006_soft_delete_archive),
+    (7, "reminder outbox", _migration_0007_reminder_outbox),
+    (8, "blocked users", _migration_0008_blocked_users),
+    (9, "user stats counters", _migration_0009_user_stats_counters),
+    (10, "daily productivity stats", _migration_0010_daily_stats),
+    (11, "admin analytics and broadcasts", _migration_0011_admin_analytics),
+    (12, "callback tokens", _migration_0012_callback_tokens),
+    (13, "task priorities and tags", _migration_0013_priorities_tags),
+    (14, "shared lists", _migration_0014_shared_lists),
+    (15, "actionable reminders", _migration_0015_actionable_reminders),
+    (16, "dashboards", _migration_0016_dashboards),
+    (17, "shared list members version", _migration_0017_list_members_version),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+# Инкрементальный VACUUM позволяет возвращать место после архивации задач по частям.
+# Для новой БД режим включается до создания таблиц, существующую один раз перестраиваем.
+# Режим меняется без VACUUM, только пока в файл ещё ничего не записано, поэтому проверяется результат.
+# VACUUM нельзя выполнять внутри транзакции, поэтому это отдельный шаг перед миграциями.
+def _ensure_incremental_auto_vacuum(conn):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("VACUUM")
+
+
+# Применяет недостающие миграции. Если схема актуальна, выполняется один SELECT.
+# Возвращает список применённых версий.
+def run_migrations(conn) -> list:
+    current_version = get_schema_version(conn)
+    if current_version >= LATEST_VERSION:
+        return []
+
+    previous_isolation_level = conn.isolation_level
+    conn.isolation_level = None  # транзакциями управляем явно
+    applied = []
+    try:
+        _ensure_incremental_auto_vacuum(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        for version, name, migrate in MIGRATIONS:
+            if version <= current_version:
+                continue
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой процесс мог применить миграцию, пока мы ждали блокировку
+                if get_schema_version(conn) >= version:
+                    cursor.execute("ROLLBACK")
+                    continue
+                started = time.perf_counter()
+                migrate(cursor)
+                cursor.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                               (version, name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            logger.info("Applied migration %s (%s) in %.3fs.", version, name, time.perf_counter() - started)
+    finally:
+        conn.isolation_level = previous_isolation_level
+    return applied
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from config import LOOP_LAG_THRESHOLD_SECONDS, LOOP_LAG_CHECK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Диагностика живого процесса без перезапуска.
+# SamplingProfiler — сэмплирующий профилировщик: отдельный поток с заданной частотой снимает стек потока
+# event loop через sys._current_frames() и считает одинаковые стеки. Код бота не инструментируется,
+# поэтому накладные расходы малы, а блокирующие вызовы (синхронный sqlite3 и т.п.) видны как стеки,
+# на которых поток задерживается. Результат — collapsed stacks ("кадр;кадр;кадр N"), формат flamegraph.pl
+# и speedscope. LoopLagMonitor измеряет задержку event loop и, если цикл заблокирован дольше порога,
+# логирует стек, на котором он завис.
+# При WORKER_PROCESSES профилируется процесс, выполнивший /profile, — основной (см. workers.py).
+
+
+def _frame_label(frame, with_line: bool = False) -> str:
+    code = frame.f_code
+    label = f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+    return f"{label}:{frame.f_lineno}" if with_line else label
+
+
+def _collapse_stack(frame) -> str:
+    labels = [_frame_label(frame, with_line=True)]  # для верхнего кадра указываем строку — видно, какой вызов блокирует
+    frame = frame.f_back
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.max_lag = 0.0  # Макс. задержка event loop за время профилирования
+        self.process_label = f"{multiprocessing.current_process().name}, pid {os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_collapse_stack(frame)] += 1
+            del frame
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    # Самые частые верхние кадры (где поток проводит время): [(кадр, доля), ...]
+    def top_frames(self, limit: int = 10):
+        total = sum(self.samples.values()) or 1
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [(frame, count / total) for frame, count in leaves.most_common(limit)]
+
+
+_profile_lock = asyncio.Lock()
+
+
+# Профилирует поток event loop в течение seconds секунд; одновременно выполняется только один профиль
+async def profile_event_loop(seconds: float, interval: float) -> SamplingProfiler:
+    async with _profile_lock:
+        profiler = SamplingProfiler(threading.get_ident(), interval)
+        loop_monitor.take_max_lag()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+        profiler.max_lag = loop_monitor.take_max_lag()
+        return profiler
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD_SECONDS, check_interval: float = LOOP_LAG_CHECK_SECONDS):
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+
+    # Сторожевой поток: если event loop давно не отмечался, снимает стек его потока — это блокирующий вызов
+    def _watchdog(self, stopped: threading.Event):
+        reported_heartbeat = None
+        while not stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat
+            if stalled_for < self.check_interval + self.threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stack = "".join(traceback.format_stack(frame, limit=15))
+                logger.warning("Event loop blocked for %.3fs, current stack:\n%s", stalled_for - self.check_interval, stack)
+            del frame
+
+    # Макс. задержка с прошлого вызова; счётчик начинается заново
+    def take_max_lag(self) -> float:
+        max_lag, self.max_lag = self.max_lag, 0.0
+        return max_lag
+
+    async def run(self, lifecycle):
+        self._loop_thread_id = threading.get_ident()
+        stopped = threading.Event()
+        threading.Thread(target=self._watchdog, args=(stopped,), name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                self._heartbeat = started = time.monotonic()
+                if not await lifecycle.sleep(self.check_interval):
+                    return
+                lag = time.monotonic() - started - self.check_interval
+                self.max_lag = max(self.max_lag, lag)
+                if lag > self.threshold:
+                    logger.warning("Event loop lag %.3fs (threshold %.3fs)", lag, self.threshold)
+        finally:
+            stopped.set()
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,108 @@
+import calendar
+from datetime import date, timedelta
+
+# Правила повторения хранятся в виде подмножества RRULE (RFC 5545):
+#   FREQ=DAILY|WEEKLY|MONTHLY; INTERVAL=n; BYDAY=MO,TU,... (для WEEKLY); BYMONTHDAY=d|-1 (для MONTHLY)
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# Короткие коды для callback-данных -> правило и подпись для пользователя
+PRESET_RULES = {
+    "d": ("FREQ=DAILY", "Каждый день"),
+    "wd": ("FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR", "По будням"),
+    "w": ("FREQ=WEEKLY", "Каждую неделю"),
+    "2w": ("FREQ=WEEKLY;INTERVAL=2", "Раз в две недели"),
+    "m": ("FREQ=MONTHLY", "Каждый месяц"),
+}
+
+
+def parse_rule(rule: str) -> dict:
+    parts = {}
+    for item in rule.upper().split(";"):
+        if not item:
+            continue
+        key, _, value = item.partition("=")
+        parts[key.strip()] = value.strip()
+
+    freq = parts.get("FREQ")
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY"):
+        raise ValueError(f"Unsupported recurrence frequency: {freq}")
+
+    interval = int(parts.get("INTERVAL", 1))
+    if interval < 1:
+        raise ValueError(f"Invalid recurrence interval: {interval}")
+
+    byday = None
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is supported only for FREQ=WEEKLY")
+        byday = sorted({WEEKDAY_CODES.index(code) for code in parts["BYDAY"].split(",")})
+
+    bymonthday = None
+    if "BYMONTHDAY" in parts:
+        if freq != "MONTHLY":
+            raise ValueError("BYMONTHDAY is supported only for FREQ=MONTHLY")
+        bymonthday = int(parts["BYMONTHDAY"])
+        if bymonthday == 0 or not -1 <= bymonthday <= 31:
+            raise ValueError(f"Invalid BYMONTHDAY: {bymonthday}")
+
+    unknown = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "BYMONTHDAY"}
+    if unknown:
+        raise ValueError(f"Unsupported recurrence parts: {', '.join(sorted(unknown))}")
+
+    return {"freq": freq, "interval": interval, "byday": byday, "bymonthday": bymonthday}
+
+
+# Даты повторений d, для которых start <= d, after < d <= until (по возрастанию)
+def iter_occurrences(rule: str, start: date, after: date, until: date):
+    parsed = parse_rule(rule)
+    interval = parsed["interval"]
+    first = max(start, after + timedelta(days=1))
+    if first > until:
+        return
+
+    if parsed["freq"] == "DAILY":
+        offset = (first - start).days
+        current = start + timedelta(days=-(-offset // interval) * interval)
+        while current <= until:
+            yield current
+            current += timedelta(days=interval)
+
+    elif parsed["freq"] == "WEEKLY":
+        byday = parsed["byday"] or [start.weekday()]
+        anchor = start - timedelta(days=start.weekday())  # понедельник недели начала
+        week_index = (first - anchor).days // 7
+        week_index -= week_index % interval
+        while True:
+            week_start = anchor + timedelta(weeks=week_index)
+            if week_start > until:
+                return
+            for weekday in byday:
+                current = week_start + timedelta(days=weekday)
+                if first <= current <= until:
+                    yield current
+            week_index += interval
+
+    else:  # MONTHLY
+        monthday = parsed["bymonthday"] or start.day
+        month_index = (first.year - start.year) * 12 + first.month - start.month
+        month_index -= month_index % interval
+        while True:
+            year, month = divmod(start.month - 1 + month_index, 12)
+            year += start.year
+            month += 1
+            days_in_month = calendar.monthrange(year, month)[1]
+            if date(year, month, 1) > until:
+                return
+            # Для коротких месяцев и BYMONTHDAY=-1 берём последний день месяца
+            day = days_in_month if monthday == -1 else min(monthday, days_in_month)
+            current = date(year, month, day)
+            if first <= current <= until:
+                yield current
+            month_index += interval
+
+
+def describe_rule(rule: str) -> str:
+    for preset_rule, label in PRESET_RULES.values():
+        if preset_rule == rule:
+            return label.lower()
+    return rule
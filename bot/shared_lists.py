@@ -0,0 +1,79 @@
+import logging
+import time
+
+from aiogram import types
+
+from config import SHARED_LIST_VERSION_CHECK_SECONDS
+from db_utils import get_shared_list_version, get_shared_list_members, enqueue_list_notification
+
+logger = logging.getLogger(__name__)
+
+# Общие списки задач групповых чатов.
+# Задачи общего списка принадлежат чату: в tasks.user_id хранится id группы (отрицательный), поэтому
+# обработчики задач работают с "владельцем" scope_id — это id группы для участника её общего списка
+# и id пользователя во всех остальных случаях. Состав участников кэшируется в памяти процесса вместе
+# с его версией (shared_lists.members_version, её увеличивают триггеры list_members). Версия перечитывается
+# не чаще раза в SHARED_LIST_VERSION_CHECK_SECONDS, поэтому оживлённая группа не обращается к БД на каждый
+# апдейт, а вступление и выход в другом процессе (WORKER_PROCESSES) учитываются через несколько секунд;
+# процесс, выполнивший /share_list, /join_list или /leave_list, сбрасывает свой кэш сразу.
+
+# Команды, доступные в группе с общим списком тем, кто ещё не участник
+OPEN_COMMANDS = {"share_list", "join_list"}
+
+_members_cache = {}  # chat_id -> (перепроверить версию после, версия состава или None, если списка нет, участники)
+
+
+def get_list_members(chat_id: int):
+    cached = _members_cache.get(chat_id)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        return cached[2]
+    version = get_shared_list_version(chat_id)
+    if version is None:
+        members = None
+    elif cached is not None and cached[1] == version:
+        members = cached[2]
+    else:
+        loaded = get_shared_list_members(chat_id)
+        version, members = loaded if loaded is not None else (None, None)
+    _members_cache[chat_id] = (now + SHARED_LIST_VERSION_CHECK_SECONDS, version, members)
+    return members
+
+
+def invalidate(chat_id: int):
+    _members_cache.pop(chat_id, None)
+
+
+def _command_name(message: types.Message):
+    if not message.text or not message.text.startswith("/"):
+        return None
+    return message.text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+
+
+# Outer-middleware диспетчера: определяет, чьи задачи обрабатывает апдейт (data["scope_id"]).
+# Не участникам общего списка группы отвечает подсказкой вместо выполнения команд и нажатий кнопок.
+async def resolve_task_scope(handler, event: types.Update, data):
+    user = data.get("event_from_user")
+    chat = data.get("event_chat")
+    scope_id = user.id if user else None
+    if user is not None and chat is not None and chat.type in ("group", "supergroup") and event.inline_query is None:
+        members = get_list_members(chat.id)
+        if members is not None:
+            if user.id in members:
+                scope_id = chat.id
+            elif event.message is not None and _command_name(event.message) not in (None, *OPEN_COMMANDS):
+                await event.message.reply("Чтобы работать с общим списком задач этого чата, присоединитесь: /join_list")
+                return None
+            elif event.callback_query is not None:
+                await event.callback_query.answer("Сначала присоединитесь к общему списку: /join_list", show_alert=True)
+                return None
+    data["scope_id"] = scope_id
+    return await handler(event, data)
+
+
+# Уведомление остальным участникам об изменении в общем списке; для личных задач ничего не делает
+def notify_list_members(scope_id: int, chat: types.Chat, actor: types.User, text: str):
+    if scope_id >= 0:
+        return
+    queued_count = enqueue_list_notification(scope_id, actor.id, f"👥 {chat.title} — {actor.full_name}: {text}")
+    logger.debug("Shared list %s: %s notifications queued.", scope_id, queued_count)
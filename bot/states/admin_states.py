@@ -13,3 +13,11 @@ class EditTask(StatesGroup):
 class DeleteTask(StatesGroup):
     waiting_for_confirmation = State()
 
+
+class SearchTasks(StatesGroup):
+    waiting_for_query = State()
+
+
+class Broadcast(StatesGroup):
+    waiting_for_text = State()
+    waiting_for_confirmation = State()
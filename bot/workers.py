@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+
+from config import TOKEN, ADMIN_IDS, DRAIN_TIMEOUT_SECONDS, WORKER_RESTART_CHECK_SECONDS
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Обработка апдейтов в нескольких процессах.
+# Основной процесс получает апдейты (polling) и выполняет фоновые задачи, а каждый апдейт передаёт
+# в очередь одного из воркеров: номер воркера — user_id % N. Все апдейты пользователя попадают в один
+# процесс, поэтому FSM в памяти, кэши inline-режима и учёт активности остаются согласованными.
+# Внутри воркера апдейты разных пользователей обрабатываются параллельно, а одного пользователя — строго
+# по очереди (блокировка на пользователя), в порядке получения.
+# Команды диагностики администратора (FRONT_COMMANDS) основной процесс выполняет сам: /profile должен
+# профилировать процесс, где работают polling и фоновые задачи, а не случайного воркера.
+
+FRONT_COMMANDS = {"profile"}
+
+
+def _is_front_command(event) -> bool:
+    message = event.message
+    if message is None or not message.text or not message.text.startswith("/") or message.from_user is None:
+        return False
+    command = message.text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+    return command in FRONT_COMMANDS and message.from_user.id in ADMIN_IDS
+
+
+class WorkerPool:
+    def __init__(self, count: int, build_dispatcher):
+        self.count = count
+        self.build_dispatcher = build_dispatcher
+        # spawn: воркер не наследует event loop, потоки и соединения основного процесса
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(count)]
+        self._processes = [None] * count
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(target=_worker_main, args=(index, self._queues[index], self.build_dispatcher),
+                                        name=f"bot-worker-{index}", daemon=True)
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._start_worker(index)
+        logger.info("Started %s worker processes.", self.count)
+
+    # Outer-middleware диспетчера основного процесса: вместо обработки передаёт апдейт воркеру
+    async def dispatch(self, handler, event, data):
+        if _is_front_command(event):
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        user_id = user.id if user else None
+        index = user_id % self.count if user_id is not None else 0
+        self._queues[index].put((user_id, event.model_dump(mode="json", by_alias=True, exclude_none=True)))
+
+    def build_front_dispatcher(self):
+        from aiogram import Dispatcher, F
+        from aiogram.filters import Command
+        from handlers.admin import cmd_profile
+        from lifecycle import lifecycle
+
+        dp = Dispatcher()
+        dp.message.register(cmd_profile, Command("profile"), F.from_user.id.in_(ADMIN_IDS))
+        dp.update.outer_middleware(self.dispatch)
+        dp.shutdown.register(lifecycle.shutdown)
+        return dp
+
+    # Фоновая задача основного процесса: перезапускает упавших воркеров (их очередь сохраняется)
+    async def supervise(self, lifecycle):
+        while await lifecycle.sleep(WORKER_RESTART_CHECK_SECONDS):
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error("Worker %s exited with code %s, restarting.", index, process.exitcode)
+                    self._start_worker(index)
+
+    def _join(self):
+        for process in self._processes:
+            process.join(DRAIN_TIMEOUT_SECONDS + 5)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating.", process.name)
+                process.terminate()
+
+    # Останавливает воркеров: каждый дообрабатывает уже полученные апдейты и выходит
+    async def stop(self):
+        for updates in self._queues:
+            updates.put(None)
+        await asyncio.to_thread(self._join)
+
+
+def _worker_main(index: int, updates, build_dispatcher):
+    # Сигналы остановки получает основной процесс; воркер выходит, когда очередь закрыта
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_logging()
+    asyncio.run(_serve(index, updates, build_dispatcher))
+
+
+def _next_update(updates):
+    # Ждём апдейт, но периодически проверяем, что основной процесс жив
+    while True:
+        try:
+            return updates.get(timeout=1)
+        except queue.Empty:
+            if not multiprocessing.parent_process().is_alive():
+                return None
+
+
+async def _serve(index: int, updates, build_dispatcher):
+    from aiogram import Bot
+    from lifecycle import lifecycle
+    from profiler import loop_monitor
+
+    bot = Bot(TOKEN)
+    dp = build_dispatcher()
+    lifecycle.start_background(loop_monitor.run(lifecycle), "loop_lag_monitor")
+    user_locks = {}  # user_id -> [блокировка, кол-во апдейтов пользователя в обработке или в ожидании]
+    tasks = set()
+
+    async def feed(user_id, update):
+        entry = user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await dp.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception("Worker %s failed to process update %s", index, update.get("update_id"))
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del user_locks[user_id]
+
+    logger.info("Worker %s started.", index)
+    while (item := await asyncio.to_thread(_next_update, updates)) is not None:
+        # Задачи начинают выполняться в порядке создания, поэтому блокировку пользователя
+        # они захватывают в порядке получения апдейтов
+        task = asyncio.create_task(feed(*item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT_SECONDS)
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()
+    logger.info("Worker %s stopped.", index)
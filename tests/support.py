@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Тесты запускаются из корня репозитория: python -m unittest discover -s tests
+# Модули бота импортируются как в main.py — из каталога bot.
+BOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot")
+if BOT_DIR not in sys.path:
+    sys.path.insert(0, BOT_DIR)
+
+
+# Каждый тест работает с новой БД: DATABASE_NAME — относительный путь, поэтому тест переходит во временный каталог
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self._previous_cwd = os.getcwd()
+        self._directory = tempfile.TemporaryDirectory()
+        os.chdir(self._directory.name)
+        from db_utils import init_db
+        init_db()
+
+    def tearDown(self):
+        os.chdir(self._previous_cwd)
+        self._directory.cleanup()
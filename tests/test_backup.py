@@ -0,0 +1,65 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+import support
+import jobs
+from backup import create_snapshot, list_snapshots, newest_snapshot_age, rotate_snapshots, verify_snapshot
+from db_utils import add_task
+
+BACKUP_DIR = "snapshots"
+
+
+class SnapshotTest(support.DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        add_task(1001, "задача для снимка")
+
+    def test_snapshots_taken_in_a_row_get_distinct_names(self):
+        paths = [create_snapshot(BACKUP_DIR) for _ in range(3)]
+        self.assertEqual(len(set(paths)), 3)
+        self.assertEqual(list_snapshots(BACKUP_DIR), paths)
+        for path in paths:
+            self.assertTrue(verify_snapshot(path)[0])
+        # Промежуточные файлы не остаются
+        self.assertEqual(sorted(os.listdir(BACKUP_DIR)), sorted(os.path.basename(path) for path in paths))
+
+    def test_rotation_keeps_newest_snapshots(self):
+        paths = [create_snapshot(BACKUP_DIR) for _ in range(3)]
+        self.assertEqual(rotate_snapshots(BACKUP_DIR, keep=2), 1)
+        self.assertEqual(list_snapshots(BACKUP_DIR), paths[1:])
+
+    def test_newest_snapshot_age(self):
+        self.assertIsNone(newest_snapshot_age(BACKUP_DIR))
+        path = create_snapshot(BACKUP_DIR)
+        self.assertLess(newest_snapshot_age(BACKUP_DIR), 60)
+        os.utime(path, (0, 0))
+        self.assertGreater(newest_snapshot_age(BACKUP_DIR), 3600)
+
+
+# Фоновая задача: первый проход отрабатывает сразу (пауза 0), если снимков нет или последний устарел
+class BackupJobTest(support.DatabaseTestCase):
+    def _first_delay(self):
+        delays = []
+
+        async def sleep(seconds):
+            delays.append(seconds)
+            return False  # остановка: задача выходит, не снимая копию
+
+        with mock.patch.object(jobs.lifecycle, "sleep", sleep), mock.patch.object(jobs, "BACKUP_INTERVAL_HOURS", 24):
+            asyncio.run(jobs.backup_database())
+        return delays[0]
+
+    def test_first_snapshot_is_taken_at_startup_without_snapshots(self):
+        self.assertEqual(self._first_delay(), 0)
+
+    def test_first_snapshot_waits_for_the_rest_of_the_interval(self):
+        path = create_snapshot()
+        self.assertGreater(self._first_delay(), 23 * 3600)
+        os.utime(path, (0, 0))
+        self.assertEqual(self._first_delay(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
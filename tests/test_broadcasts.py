@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import aiogram.exceptions
+import support
+import jobs
+from db_utils import cancel_broadcast, create_broadcast, get_broadcast, record_blocked_user, record_user_activity
+from lifecycle import Lifecycle
+
+
+# Рассылка, прерванная остановкой бота, продолжается с сохранённого курсора: каждый получатель
+# получает сообщение ровно один раз, а счётчики сходятся с числом получателей
+class BroadcastResumeTest(support.DatabaseTestCase):
+    # Один запуск фоновой задачи: работает, пока есть незавершённые рассылки (или до остановки бота),
+    # и выходит вместо ожидания новых
+    def run_broadcasts(self, bot):
+        async def stop_when_idle(seconds):
+            return False
+
+        async def run():
+            with mock.patch.object(jobs, "lifecycle", Lifecycle()) as lifecycle, \
+                    mock.patch.object(lifecycle, "sleep", stop_when_idle):
+                bot.lifecycle = lifecycle
+                await jobs.run_broadcasts(bot)
+
+        asyncio.run(run())
+
+    def test_resume_after_stop(self):
+        for user_id in range(1, 9):
+            record_user_activity(user_id, "2026-01-01")
+        record_blocked_user(4, "kicked")
+        broadcast_id = create_broadcast("Новости", created_by=1)
+        delivered = []
+
+        async def send_message(chat_id, text):
+            delivered.append(chat_id)
+            if chat_id == 6:
+                raise aiogram.exceptions.TelegramForbiddenError(mock.Mock(), "bot was blocked by the user")
+            if len(delivered) == 4:
+                bot.lifecycle.request_stop()  # остановка бота посреди пачки
+
+        bot = mock.Mock(send_message=send_message)
+        with mock.patch.object(jobs, "BROADCAST_BATCH_SIZE", 3), \
+                mock.patch.object(jobs, "BROADCAST_MESSAGES_PER_SECOND", 1000):
+            self.run_broadcasts(bot)
+            self.assertEqual(get_broadcast(broadcast_id)[2:6], ("running", 5, 7, 4))
+
+            self.run_broadcasts(bot)  # перезапуск
+
+        self.assertEqual(delivered, [1, 2, 3, 5, 6, 7, 8])
+        status, last_user_id, total_count, sent_count, failed_count = get_broadcast(broadcast_id)[2:7]
+        self.assertEqual((status, last_user_id), ("done", 8))
+        self.assertEqual(sent_count + failed_count, total_count)
+        self.assertEqual(failed_count, 1)
+
+    def test_cancel_keeps_progress_of_current_batch(self):
+        for user_id in range(1, 6):
+            record_user_activity(user_id, "2026-01-01")
+        broadcast_id = create_broadcast("Новости", created_by=1)
+        delivered = []
+
+        async def send_message(chat_id, text):
+            delivered.append(chat_id)
+            if chat_id == 2:
+                cancel_broadcast(broadcast_id)  # администратор нажал «Остановить» во время пачки
+
+        with mock.patch.object(jobs, "BROADCAST_BATCH_SIZE", 3), \
+                mock.patch.object(jobs, "BROADCAST_MESSAGES_PER_SECOND", 1000):
+            self.run_broadcasts(mock.Mock(send_message=send_message))
+
+        # Пачка досылается, после неё рассылка остаётся отменённой, а счётчики учитывают отправленное
+        self.assertEqual(delivered, [1, 2, 3])
+        self.assertEqual(get_broadcast(broadcast_id)[2:6], ("cancelled", 3, 5, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
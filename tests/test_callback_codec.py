@@ -0,0 +1,80 @@
+import unittest
+
+import support  # noqa: F401 — путь к модулям бота
+from aiogram.filters.callback_data import CallbackData
+
+from keyboards import inline
+from keyboards import callback_codec
+from keyboards.callback_codec import CompactCallbackData, to_base36
+
+
+class CompactCallbackDataTest(unittest.TestCase):
+    def test_pack_and_unpack_round_trip(self):
+        samples = [
+            inline.CompleteTaskCallback(filter_type="today", page=3, task_number=1234),
+            inline.EditTaskCallback(page=0, task_number=None, action="select"),
+            inline.SetReminderIntervalCallback(task_internal_id=987654, hours=12),
+            inline.MainMenuCallback(),
+            inline.DeadlineConfirmCallback(confirm=True),
+        ]
+        for sample in samples:
+            packed = sample.pack()
+            self.assertLessEqual(len(packed.encode()), 64)
+            self.assertEqual(type(sample).unpack(packed), sample)
+
+    def test_base36(self):
+        for number in (0, 5, 35, 36, 1295, 1296, 46655, 46656, 987654, 10 ** 12, -7):
+            self.assertEqual(int(to_base36(number), 36), number)
+        self.assertEqual(to_base36(36), "10")
+        self.assertEqual(to_base36(1296), "100")
+
+    def test_trailing_defaults_are_omitted(self):
+        self.assertEqual(inline.EditTaskCallback(page=2).pack(), "4:2")
+        self.assertEqual(inline.MainMenuCallback().pack(), "6")
+
+    def test_other_class_code_is_rejected(self):
+        packed = inline.ReminderDoneCallback(task_internal_id=5).pack()
+        with self.assertRaises(ValueError):
+            inline.ReminderSnoozeCallback.unpack(packed)
+
+    def test_legacy_aiogram_format_is_accepted(self):
+        class LegacyEditTaskCallback(CallbackData, prefix="edit_task"):
+            page: int
+            task_number: int | None = None
+            action: str = "view"
+
+        packed = LegacyEditTaskCallback(page=1, task_number=7, action="select").pack()
+        self.assertEqual(inline.EditTaskCallback.unpack(packed),
+                         inline.EditTaskCallback(page=1, task_number=7, action="select"))
+
+    def test_too_long_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            inline.EditTaskCallback(page=0, task_number=1, action="x" * 70).pack()
+
+    def test_duplicate_code_is_rejected(self):
+        with self.assertRaises(ValueError):
+            class DuplicateCallback(CompactCallbackData, prefix="duplicate", code=1):
+                pass
+
+
+class StoredCallbackDataTest(support.DatabaseTestCase):
+    def test_short_query_is_packed_inline(self):
+        packed = inline.SearchPageCallback(page=1, query="молоко").pack()
+        self.assertEqual(packed, "g:1:молоко")
+
+    def test_overflow_and_separator_are_stored_by_token(self):
+        for query in ("длинный запрос " * 5, "время 10:30"):
+            sample = inline.SearchPageCallback(page=2, query=query)
+            packed = sample.pack()
+            self.assertTrue(packed.startswith("g:~"))
+            self.assertLessEqual(len(packed.encode()), 64)
+            callback_codec._token_cache.clear()  # данные читаются из БД, как в другом процессе
+            self.assertEqual(inline.SearchPageCallback.unpack(packed), sample)
+
+    def test_unknown_token_is_rejected(self):
+        with self.assertRaises(ValueError):
+            inline.SearchPageCallback.unpack("g:~missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+
+import support
+from config import DATABASE_NAME
+from db_utils import (add_task, archive_old_tasks, complete_task_by_number, delete_dashboard, mark_dashboards_dirty,
+                      mark_overdue_tasks, save_dashboard, set_task_priority, set_task_reminder_interval,
+                      soft_delete_task, take_dirty_dashboards, update_task_deadline, update_task_description)
+
+
+# Триггеры на tasks отмечают в dashboard_dirty владельцев панелей, у которых изменились показываемые задачи:
+# после каждого изменения набор отмеченных панелей должен совпадать с ожидаемым, а серия изменений — давать
+# одно обновление панели
+class DashboardDirtyTest(support.DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        save_dashboard(7, chat_id=70, message_id=700)
+        save_dashboard(9, chat_id=90, message_id=900)
+
+    def assert_dirty(self, user_ids):
+        self.assertEqual(sorted(take_dirty_dashboards(100)),
+                         [(user_id, user_id * 10, user_id * 100) for user_id in sorted(user_ids)])
+
+    def test_every_task_change_marks_owner_once(self):
+        task_id, _ = add_task(7, "купить хлеб")
+        other_id, _ = add_task(8, "без панели")
+        self.assert_dirty({7})
+
+        update_task_description(task_id, 7, "купить хлеб и молоко")
+        set_task_priority(task_id, 7, 1)
+        update_task_deadline(task_id, 7, (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
+        update_task_description(other_id, 8, "по-прежнему без панели")
+        self.assert_dirty({7})
+        self.assert_dirty(set())
+
+        # Напоминание на панели не показывается
+        set_task_reminder_interval(task_id, 7, 2)
+        self.assert_dirty(set())
+
+        add_task(9, "позвонить")
+        complete_task_by_number(7, 1)
+        self.assert_dirty({7, 9})
+
+        archive_old_tasks(completed_before="2999-01-01 00:00:00", deleted_before="2999-01-01 00:00:00")
+        self.assert_dirty({7})
+
+    def test_overdue_and_soft_delete_mark_owner(self):
+        task_id, _ = add_task(7, "сдать отчёт", (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d'))
+        self.assert_dirty({7})
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.execute("UPDATE tasks SET overdue = 0 WHERE id = ?", (task_id,))
+        conn.commit()
+        conn.close()
+        self.assert_dirty({7})
+
+        mark_overdue_tasks()
+        self.assert_dirty({7})
+        soft_delete_task(task_id, 7)
+        self.assert_dirty({7})
+
+    def test_manual_marks_and_disabled_dashboard(self):
+        mark_dashboards_dirty()
+        self.assert_dirty({7, 9})
+        mark_dashboards_dirty([9])
+        self.assert_dirty({9})
+
+        add_task(7, "купить хлеб")
+        self.assertEqual(delete_dashboard(7), (70, 700))
+        self.assert_dirty(set())
+        add_task(7, "позвонить")
+        self.assert_dirty(set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from datetime import date
+
+import support  # noqa: F401 — путь к модулям бота
+from dateparse import extract_deadline, parse_deadline
+
+MONDAY = date(2026, 10, 19)
+
+
+class ExtractDeadlineTest(unittest.TestCase):
+    def test_words_and_full_dates_are_certain(self):
+        self.assertEqual(extract_deadline("Купить молоко завтра", MONDAY), ("Купить молоко", date(2026, 10, 20), True))
+        self.assertEqual(extract_deadline("позвонить маме в пятницу", MONDAY), ("позвонить маме", date(2026, 10, 23), True))
+        self.assertEqual(extract_deadline("отчёт через 3 дня", MONDAY), ("отчёт", date(2026, 10, 22), True))
+        self.assertEqual(extract_deadline("сдать до 25.10", MONDAY), ("сдать", date(2026, 10, 25), True))
+        self.assertEqual(extract_deadline("сдать 03.12", MONDAY), ("сдать", date(2026, 12, 3), True))
+        self.assertEqual(extract_deadline("сдать 3.12.2026", MONDAY), ("сдать", date(2026, 12, 3), True))
+        self.assertEqual(extract_deadline("отпуск 5 января", MONDAY), ("отпуск", date(2027, 1, 5), True))
+
+    def test_decimal_numbers_are_not_certain_dates(self):
+        for text in ("купить 1.5 кг мяса", "пробежать 5.5 км", "обновить python до 3.12"):
+            with self.subTest(text=text):
+                rest, deadline, certain = extract_deadline(text, MONDAY)
+                self.assertFalse(certain)
+
+    def test_certain_deadline_wins_over_decimal(self):
+        self.assertEqual(extract_deadline("купить 1.5 кг мяса завтра", MONDAY),
+                         ("купить 1.5 кг мяса", date(2026, 10, 20), True))
+
+    def test_versions_and_text_without_deadline(self):
+        self.assertEqual(extract_deadline("версия 1.2.3 релиз", MONDAY), ("версия 1.2.3 релиз", None, False))
+        self.assertEqual(extract_deadline("31.02 проверить", MONDAY), ("31.02 проверить", None, False))
+
+    def test_parse_deadline_accepts_short_date_as_answer(self):
+        self.assertEqual(parse_deadline("3.12", MONDAY), date(2026, 12, 3))
+        self.assertEqual(parse_deadline("на выходных", MONDAY), date(2026, 10, 24))
+        self.assertIsNone(parse_deadline("купить хлеб", MONDAY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import sqlite3
+import unittest
+
+import support
+from config import DATABASE_NAME
+from migrations import LATEST_VERSION, MIGRATIONS, get_schema_version, run_migrations
+
+
+class InitDbTest(support.DatabaseTestCase):
+    def test_new_database_uses_incremental_auto_vacuum_and_wal(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(get_schema_version(conn), LATEST_VERSION)
+            self.assertIsNotNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'callback_tokens'").fetchone())
+        finally:
+            conn.close()
+
+    def test_existing_database_is_rebuilt_with_incremental_auto_vacuum(self):
+        conn = sqlite3.connect("old.db")
+        try:
+            # База, созданная до миграций: WAL включён, таблица есть, auto_vacuum выключен
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE legacy (id INTEGER PRIMARY KEY)")
+            conn.commit()
+            run_migrations(conn)
+            self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        finally:
+            conn.close()
+
+
+# Миграция 13 заполняет теги по описаниям задач, созданных до её появления
+class TagBackfillTest(support.DatabaseTestCase):
+    def test_tags_are_backfilled_from_existing_descriptions(self):
+        conn = sqlite3.connect("old.db")
+        conn.isolation_level = None
+        try:
+            for version, name, migrate in MIGRATIONS[:12]:
+                migrate(conn.cursor())
+            conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)")
+            conn.execute("INSERT INTO schema_version VALUES (12, 'callback tokens', '2026-01-01 00:00:00')")
+            tasks = [(1, 10, "отчёт #Работа #срочно"), (2, 10, "звонок #работа #работа"), (3, 20, "#дом уборка"),
+                     (4, 20, "без тегов")]
+            for task_id, user_id, description in tasks:
+                conn.execute("""
+                    INSERT INTO tasks (id, user_id, task_number, description, status, remind_me, created_at)
+                    VALUES (?, ?, ?, ?, 'active', 0, '2026-01-01 00:00:00')
+                """, (task_id, user_id, task_id, description))
+            conn.execute("INSERT INTO tasks (id, user_id, task_number, description, status, remind_me, created_at) "
+                         "VALUES (5, 20, 5, '#удалено', 'deleted', 0, '2026-01-01 00:00:00')")
+
+            run_migrations(conn)
+
+            tags = conn.execute("""
+                SELECT task_tags.task_id, tags.user_id, tags.name FROM task_tags JOIN tags ON tags.id = task_tags.tag_id
+                ORDER BY task_tags.task_id, tags.name
+            """).fetchall()
+            self.assertEqual(tags, [(1, 10, "работа"), (1, 10, "срочно"), (2, 10, "работа"), (3, 20, "дом")])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0], 3)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import sqlite3
+import unittest
+from datetime import datetime
+
+import support
+import jobs
+from config import DATABASE_NAME
+from db_utils import (add_task, enqueue_reminders, get_pending_outbox, mark_outbox_failed, mark_outbox_sent,
+                      purge_sent_outbox, set_task_reminder_interval)
+
+NOW = "2026-01-01 10:00:00"
+LATER = "2026-01-01 11:00:00"
+
+
+# Очередь напоминаний: дубли по dedup_key не ставятся, attempts считает только ошибки доставки,
+# исчерпавшие попытки сообщения остаются в dead letter
+class OutboxTest(support.DatabaseTestCase):
+    def rows(self, query: str, params=()):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            rows = conn.execute(query, params).fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    def test_dedup_key_keeps_one_message(self):
+        reminder = (7, "reminder:7:2026-01-01 10", "Привет!", "today", None)
+        self.assertEqual(enqueue_reminders([reminder], NOW), 1)
+        self.assertEqual(enqueue_reminders([reminder, (8, "reminder:8:2026-01-01 10", "Привет!", "today", None)], NOW), 1)
+        self.assertEqual(self.rows("SELECT user_id, COUNT(*) FROM reminder_outbox GROUP BY user_id"), [(7, 1), (8, 1)])
+
+    def test_planner_skips_users_with_pending_reminder(self):
+        task_id, _ = add_task(7, "полить цветы", datetime.now().strftime('%Y-%m-%d'))
+        set_task_reminder_interval(task_id, 7, 1)
+        self.rows("UPDATE user_reminder_status SET last_reminded_at = NULL")
+
+        jobs._queue_hourly_reminders()
+        self.rows("UPDATE user_reminder_status SET last_reminded_at = NULL")
+        jobs._queue_hourly_reminders()
+        self.assertEqual(self.rows("SELECT user_id, status FROM reminder_outbox"), [(7, "pending")])
+
+    def test_attempts_and_dead_letter_match_recount(self):
+        enqueue_reminders([(7, "a", "первое", None, None), (8, "b", "второе", None, None)], NOW)
+        (first_id, *_), (second_id, *_) = get_pending_outbox(NOW, 10)
+
+        # Ограничение частоты откладывает сообщение, но не тратит попытку
+        self.assertFalse(mark_outbox_failed(first_id, "retry after 5s", LATER, 3, count_attempt=False))
+        self.assertEqual(get_pending_outbox(NOW, 10)[0][0], second_id)
+        self.assertFalse(mark_outbox_failed(first_id, "timeout", LATER, 3))
+        self.assertFalse(mark_outbox_failed(first_id, "timeout", LATER, 3))
+        self.assertTrue(mark_outbox_failed(first_id, "timeout", LATER, 3))
+        mark_outbox_sent(second_id, NOW)
+
+        self.assertEqual(self.rows("SELECT id, status, attempts, last_error FROM reminder_outbox ORDER BY id"),
+                         [(first_id, "failed", 3, "timeout"), (second_id, "sent", 1, None)])
+        self.assertEqual(self.rows("SELECT id, attempts FROM reminder_outbox_dead_letters"), [(first_id, 3)])
+        self.assertEqual(get_pending_outbox(LATER, 10), [])
+
+        # Удаляются только отправленные сообщения, dead letter остаётся для разбора
+        self.assertEqual(purge_sent_outbox(LATER), 1)
+        self.assertEqual(self.rows("SELECT id FROM reminder_outbox"), [(first_id,)])
+
+    def test_error_without_retry_goes_to_dead_letter(self):
+        enqueue_reminders([(7, "a", "первое", None, None)], NOW)
+        message_id = get_pending_outbox(NOW, 10)[0][0]
+        self.assertTrue(mark_outbox_failed(message_id, "forbidden: bot was blocked by the user"))
+        self.assertEqual(self.rows("SELECT attempts FROM reminder_outbox_dead_letters"), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
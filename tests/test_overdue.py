@@ -0,0 +1,77 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import support
+import db_utils
+from config import DATABASE_NAME
+from db_utils import add_task, get_job_state, mark_overdue_tasks, set_task_reminder_interval
+
+
+def _day(offset: int) -> str:
+    return (datetime.now() + timedelta(days=offset)).strftime('%Y-%m-%d')
+
+
+# Пометка просрочки идёт от отметки (deadline, id) и не возвращается к уже пройденным задачам;
+# итоговые флаги overdue должны совпадать с пересчётом "активна и срок раньше сегодняшнего дня"
+class MarkOverdueTest(support.DatabaseTestCase):
+    def add_unmarked_task(self, user_id: int, deadline: str) -> int:
+        task_id, _ = add_task(user_id, f"срок {deadline}", deadline)
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.execute("UPDATE tasks SET overdue = 0 WHERE id = ?", (task_id,))  # как если бы день ещё не сменился
+        conn.commit()
+        conn.close()
+        return task_id
+
+    def assert_matches_recount(self, today: str):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            mismatched = conn.execute("""
+                SELECT id FROM tasks
+                WHERE status = 'active' AND overdue != (deadline IS NOT NULL AND deadline < ?)
+            """, (today,)).fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(mismatched, [])
+
+    def test_marks_in_batches_and_advances_high_water_mark(self):
+        reminded_id = self.add_unmarked_task(7, _day(-3))
+        for offset in (-2, -2, -1, 0, 1):
+            self.add_unmarked_task(8, _day(offset))
+        last_id = self.add_unmarked_task(9, _day(-1))
+        set_task_reminder_interval(reminded_id, 7, 1)
+
+        self.assertEqual(mark_overdue_tasks(batch_size=2), (5, {7}))
+        self.assert_matches_recount(_day(0))
+        self.assertEqual(get_job_state("overdue_hwm"), f"{_day(-1)}|{last_id}")
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            self.assertEqual(conn.execute("SELECT last_reminded_at FROM user_reminder_status WHERE user_id = 7").fetchone(),
+                             (None,))
+        finally:
+            conn.close()
+
+        # Повторный проход в тот же день ничего не обходит заново
+        self.assertEqual(mark_overdue_tasks(batch_size=2), (0, set()))
+
+    def test_next_day_continues_from_mark(self):
+        self.add_unmarked_task(8, _day(-1))
+        self.add_unmarked_task(8, _day(0))
+        self.add_unmarked_task(8, _day(1))
+        self.assertEqual(mark_overdue_tasks()[0], 1)
+
+        tomorrow = datetime.now() + timedelta(days=1)
+
+        class NextDay(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return tomorrow
+
+        with mock.patch.object(db_utils, "datetime", NextDay):
+            self.assertEqual(mark_overdue_tasks()[0], 1)
+        self.assert_matches_recount(_day(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
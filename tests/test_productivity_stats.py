@@ -0,0 +1,122 @@
+import sqlite3
+import unittest
+from datetime import date, timedelta
+
+import support
+from config import DATABASE_NAME
+from db_utils import archive_old_tasks, get_productivity_stats
+from migrations import MIGRATIONS, run_migrations
+
+TODAY = date(2026, 3, 20)
+
+RECOUNT = """
+    SELECT user_id, substr(completed_at, 1, 10), COUNT(*),
+           SUM(deadline IS NOT NULL AND substr(completed_at, 1, 10) <= deadline),
+           SUM(deadline IS NOT NULL AND substr(completed_at, 1, 10) > deadline),
+           SUM(created_at IS NOT NULL)
+    FROM ({source}) WHERE status = 'completed'
+    GROUP BY 1, 2 ORDER BY 1, 2
+"""
+ROLLUP = """
+    SELECT user_id, day, completed_count, on_time_count, late_count, lead_time_count
+    FROM user_daily_stats ORDER BY user_id, day
+"""
+
+
+def _day(offset: int) -> str:
+    return (TODAY + timedelta(days=offset)).isoformat()
+
+
+# Дневные агрегаты user_daily_stats обновляются триггером при завершении задачи;
+# они должны совпадать с пересчётом по завершённым задачам, а серии — с днями, в которые что-то завершено
+class DailyRollupTest(support.DatabaseTestCase):
+    # (день завершения, срок) задач пользователя 7; у пользователя 8 одна задача, завершённая сегодня
+    COMPLETIONS = [(-10, -11), (-9, None), (-5, -5), (-4, None), (-4, -6), (-3, -2), (-1, None), (0, 0)]
+
+    def complete_tasks(self, conn):
+        for number, (completed, deadline) in enumerate(self.COMPLETIONS, start=1):
+            conn.execute("""
+                INSERT INTO tasks (user_id, task_number, description, deadline, status, remind_me, created_at)
+                VALUES (7, ?, 'задача', ?, 'active', 0, ?)
+            """, (number, _day(deadline) if deadline is not None else None, f"{_day(completed - 1)} 12:00:00"))
+        conn.execute("INSERT INTO tasks (user_id, task_number, description, status, remind_me) "
+                     "VALUES (8, 1, 'чужая', 'active', 0)")
+        for number, (completed, _) in enumerate(self.COMPLETIONS, start=1):
+            conn.execute("UPDATE tasks SET status = 'completed', completed_at = ? WHERE user_id = 7 AND task_number = ?",
+                         (f"{_day(completed)} 18:00:00", number))
+        conn.execute("UPDATE tasks SET status = 'completed', completed_at = ? WHERE user_id = 8",
+                     (f"{_day(0)} 09:00:00",))
+        conn.commit()
+
+    def test_trigger_rollup_matches_recount_and_survives_archive(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            self.complete_tasks(conn)
+            expected = conn.execute(RECOUNT.format(source="SELECT * FROM tasks")).fetchall()
+            self.assertEqual(conn.execute(ROLLUP).fetchall(), expected)
+            self.assertEqual(conn.execute("SELECT lead_time_seconds FROM user_daily_stats WHERE user_id = 7 AND day = ?",
+                                          (_day(-4),)).fetchone(), (2 * 30 * 3600,))
+
+            # Архивация удаляет задачи из tasks, но не агрегаты
+            archive_old_tasks(completed_before=f"{_day(1)} 00:00:00", deleted_before=f"{_day(1)} 00:00:00")
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM tasks").fetchone(), (0,))
+            self.assertEqual(conn.execute(ROLLUP).fetchall(), expected)
+        finally:
+            conn.close()
+
+    def test_streaks_and_totals(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            self.complete_tasks(conn)
+        finally:
+            conn.close()
+
+        stats = get_productivity_stats(7, TODAY)
+        # Дни с завершениями: -10, -9 | -5, -4, -3 | -1, 0
+        self.assertEqual((stats["current_streak"], stats["best_streak"]), (2, 3))
+        self.assertEqual((stats["today"], stats["last_7_days"], stats["total"]), (1, 6, len(self.COMPLETIONS)))
+        self.assertEqual((stats["on_time"], stats["late"]), (3, 2))
+        self.assertEqual([count for _, count in stats["week"]], [0, 1, 2, 1, 0, 1, 1])
+
+        # Без завершений вчера и сегодня текущая серия прерывается, лучшая остаётся
+        stats = get_productivity_stats(7, TODAY + timedelta(days=2))
+        self.assertEqual((stats["current_streak"], stats["best_streak"]), (0, 3))
+        self.assertEqual(get_productivity_stats(8, TODAY)["current_streak"], 1)
+
+
+# Миграция 10 заполняет агрегаты по задачам, завершённым до её появления, включая архив
+class DailyRollupBackfillTest(support.DatabaseTestCase):
+    def test_backfill_matches_recount(self):
+        conn = sqlite3.connect("old.db")
+        conn.isolation_level = None
+        try:
+            for version, name, migrate in MIGRATIONS[:9]:
+                migrate(conn.cursor())
+            conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)")
+            conn.execute("INSERT INTO schema_version VALUES (9, 'user stats counters', '2026-01-01 00:00:00')")
+            for task_id, (user_id, deadline, completed_at) in enumerate([
+                    (7, _day(-2), f"{_day(-2)} 10:00:00"), (7, _day(-3), f"{_day(-2)} 11:00:00"),
+                    (8, None, f"{_day(-1)} 10:00:00")], start=1):
+                conn.execute("""
+                    INSERT INTO tasks (id, user_id, task_number, description, deadline, status, remind_me, completed_at)
+                    VALUES (?, ?, ?, 'задача', ?, 'completed', 0, ?)
+                """, (task_id, user_id, task_id, deadline, completed_at))
+            conn.execute("""
+                INSERT INTO tasks_archive (id, user_id, task_number, description, deadline, status, completed_at, archived_at)
+                VALUES (10, 7, 10, 'из архива', NULL, 'completed', ?, ?)
+            """, (f"{_day(-2)} 09:00:00", f"{_day(0)} 00:00:00"))
+
+            run_migrations(conn)
+
+            expected = conn.execute(RECOUNT.format(source="""
+                SELECT user_id, deadline, status, completed_at, created_at FROM tasks
+                UNION ALL SELECT user_id, deadline, status, completed_at, NULL FROM tasks_archive
+            """)).fetchall()
+            self.assertEqual(conn.execute(ROLLUP).fetchall(), expected)
+            self.assertEqual(expected[0][:3], (7, _day(-2), 3))
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
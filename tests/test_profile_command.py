@@ -0,0 +1,40 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import support  # noqa: F401 — путь к модулям бота
+from aiogram.filters import CommandObject
+
+from handlers import admin
+
+
+# /profile не должен ждать окончания профиля: основной процесс в это время раздаёт апдейты воркерам
+class ProfileCommandTest(unittest.TestCase):
+    def setUp(self):
+        admin._profile_task = None
+
+    def test_handler_returns_before_profiling_finishes(self):
+        message = mock.Mock(answer=mock.AsyncMock(), answer_document=mock.AsyncMock())
+
+        async def run():
+            started = time.monotonic()
+            await admin.cmd_profile(message, CommandObject(command="profile", args="1"))
+            handler_seconds = time.monotonic() - started
+            message.answer_document.assert_not_awaited()
+
+            # Повторная команда во время профиля отклоняется
+            await admin.cmd_profile(message, CommandObject(command="profile", args="1"))
+            self.assertIn("уже выполняется", message.answer.await_args.args[0])
+
+            await admin._profile_task
+            return handler_seconds
+
+        handler_seconds = asyncio.run(run())
+        self.assertLess(handler_seconds, 0.5)
+        message.answer_document.assert_awaited_once()
+        self.assertIn("Процесс:", message.answer_document.await_args.kwargs["caption"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import unittest
+from datetime import date, timedelta
+
+import support
+from config import DATABASE_NAME
+from db_utils import (
+    add_task,
+    create_recurrence_from_task,
+    materialize_recurring_tasks,
+    disable_task_reminder,
+    disable_all_reminders
+)
+
+USER_ID = 1001
+
+
+# Ежедневная задача, начиная с сегодняшнего дня
+class RecurrenceTestCase(support.DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.until = (today + timedelta(days=7)).strftime('%Y-%m-%d')
+        self.task_id, _ = add_task(USER_ID, "зарядка", today.strftime('%Y-%m-%d'))
+        self.recurrence_id = create_recurrence_from_task(self.task_id, USER_ID, "FREQ=DAILY")
+
+    def _tasks(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            return conn.execute("SELECT task_number, deadline FROM tasks WHERE user_id = ? ORDER BY task_number",
+                                (USER_ID,)).fetchall()
+        finally:
+            conn.close()
+
+
+class MaterializeRecurringTasksTest(RecurrenceTestCase):
+    def test_instances_are_numbered_after_existing_tasks(self):
+        add_task(USER_ID, "обычная задача")
+        self.assertEqual(materialize_recurring_tasks(self.until), 7)
+        tasks = self._tasks()
+        self.assertEqual([number for number, _ in tasks], list(range(1, 10)))
+        self.assertEqual(materialize_recurring_tasks(self.until), 0)
+
+    def test_concurrent_runs_create_each_instance_once(self):
+        errors = []
+
+        def run():
+            try:
+                materialize_recurring_tasks(self.until)
+            except sqlite3.Error as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        deadlines = [deadline for _, deadline in self._tasks()]
+        self.assertEqual(len(deadlines), 8)
+        self.assertEqual(len(set(deadlines)), 8)
+
+
+class DisableRecurringRemindersTest(RecurrenceTestCase):
+    def setUp(self):
+        super().setUp()
+        # Напоминание включено, как это делает выбор интервала: для задачи и для правила повторения
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.execute("UPDATE tasks SET remind_me = 1 WHERE id = ?", (self.task_id,))
+        conn.execute("UPDATE task_recurrences SET remind_me = 1 WHERE id = ?", (self.recurrence_id,))
+        conn.commit()
+        conn.close()
+
+    def _reminders(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            return [row[0] for row in conn.execute("SELECT remind_me FROM tasks WHERE user_id = ? ORDER BY task_number",
+                                                   (USER_ID,))]
+        finally:
+            conn.close()
+
+    def test_reminders_stay_on_for_new_instances(self):
+        materialize_recurring_tasks(self.until)
+        self.assertEqual(self._reminders(), [1] * 8)
+
+    def test_disabled_task_reminder_is_not_copied_to_new_instances(self):
+        self.assertTrue(disable_task_reminder(self.task_id, USER_ID))
+        materialize_recurring_tasks(self.until)
+        self.assertEqual(self._reminders(), [0] * 8)
+
+    def test_disabled_reminders_are_not_copied_to_new_instances(self):
+        disable_all_reminders(USER_ID)
+        materialize_recurring_tasks(self.until)
+        self.assertEqual(self._reminders(), [0] * 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
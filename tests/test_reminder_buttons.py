@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import support  # noqa: F401 — путь к модулям бота
+
+from handlers import users
+from keyboards.inline import ReminderDoneCallback, ReminderSnoozeCallback, build_reminder_keyboard
+
+
+def _callback_query(reply_markup):
+    message = mock.Mock(text="🔔 Напоминание", reply_markup=reply_markup,
+                        edit_text=mock.AsyncMock(), edit_reply_markup=mock.AsyncMock())
+    return mock.Mock(message=message, answer=mock.AsyncMock())
+
+
+# Отсрочка напоминания убирает только ряд отсрочки: задачи из напоминания можно завершить и после неё
+class ReminderSnoozeTest(unittest.TestCase):
+    def test_done_buttons_survive_snooze(self):
+        keyboard = build_reminder_keyboard([(11, 1, "купить хлеб", 0), (12, 2, "позвонить", 1)], "today")
+        callback_query = _callback_query(keyboard)
+
+        with mock.patch.object(users, "snooze_reminders", return_value=True):
+            asyncio.run(users.process_reminder_snooze_callback(
+                callback_query, ReminderSnoozeCallback(period="tomorrow"), scope_id=5))
+
+        rows = callback_query.message.edit_text.await_args.kwargs["reply_markup"].inline_keyboard
+        buttons = [button for row in rows for button in row]
+        self.assertEqual([ReminderDoneCallback.unpack(button.callback_data).task_internal_id
+                          for button in buttons if users._is_button_of(button, ReminderDoneCallback)], [11, 12])
+        self.assertFalse(any(users._is_button_of(button, ReminderSnoozeCallback) for button in buttons))
+        self.assertEqual(rows[-1][0].text, "Посмотреть задачи")
+
+
+if __name__ == "__main__":
+    unittest.main()
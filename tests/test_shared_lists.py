@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+
+import support
+import shared_lists
+from db_utils import create_shared_list, add_list_member, remove_list_member, add_task, search_tasks
+
+CHAT_ID = -100500
+OWNER_ID = 1001
+MEMBER_ID = 1002
+
+
+# Состав участников кэшируется в процессе, но изменения из других процессов видны после перепроверки
+# версии: здесь они делаются напрямую через db_utils, мимо кэша этого процесса
+class ListMembersCacheTest(support.DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        shared_lists._members_cache.clear()
+        self.addCleanup(shared_lists._members_cache.clear)
+
+    def _expire_checks(self):
+        for chat_id, (check_after, version, members) in list(shared_lists._members_cache.items()):
+            shared_lists._members_cache[chat_id] = (0, version, members)
+
+    def test_chat_without_shared_list(self):
+        self.assertIsNone(shared_lists.get_list_members(CHAT_ID))
+        create_shared_list(CHAT_ID, "Группа", OWNER_ID)
+        self._expire_checks()
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID})
+
+    def test_membership_changes_are_seen_after_version_check(self):
+        create_shared_list(CHAT_ID, "Группа", OWNER_ID)
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID})
+        add_list_member(CHAT_ID, MEMBER_ID)
+        self._expire_checks()
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID, MEMBER_ID})
+        remove_list_member(CHAT_ID, MEMBER_ID)
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID, MEMBER_ID})  # до перепроверки
+        self._expire_checks()
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID})
+
+    def test_invalidate_applies_local_changes_immediately(self):
+        create_shared_list(CHAT_ID, "Группа", OWNER_ID)
+        shared_lists.get_list_members(CHAT_ID)
+        add_list_member(CHAT_ID, MEMBER_ID)
+        shared_lists.invalidate(CHAT_ID)
+        self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID, MEMBER_ID})
+
+    def test_lookups_between_checks_do_not_query_the_database(self):
+        shared_lists.get_list_members(CHAT_ID)  # группа без списка тоже кэшируется
+        create_shared_list(CHAT_ID, "Группа", OWNER_ID)
+        self._expire_checks()
+        shared_lists.get_list_members(CHAT_ID)
+        with mock.patch.object(shared_lists, "get_shared_list_version") as load_version, \
+                mock.patch.object(shared_lists, "get_shared_list_members") as load_members:
+            for _ in range(3):
+                self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID})
+        load_version.assert_not_called()
+        load_members.assert_not_called()
+
+    def test_unchanged_version_does_not_reload_members(self):
+        create_shared_list(CHAT_ID, "Группа", OWNER_ID)
+        shared_lists.get_list_members(CHAT_ID)
+        self._expire_checks()
+        with mock.patch.object(shared_lists, "get_shared_list_members") as load_members:
+            self.assertEqual(shared_lists.get_list_members(CHAT_ID), {OWNER_ID})
+        load_members.assert_not_called()
+
+
+# Задачи общего списка хранятся с отрицательным user_id (id группы)
+class SharedListSearchTest(support.DatabaseTestCase):
+    def test_search_in_group_list(self):
+        add_task(CHAT_ID, "купить молоко")
+        add_task(-CHAT_ID, "купить хлеб")  # пользователь с тем же модулем id не должен попасть в выдачу
+        add_task(OWNER_ID, "купить сыр")
+        tasks, has_next = search_tasks(CHAT_ID, "куп")
+        self.assertEqual([task[2] for task in tasks], ["купить молоко"])
+        self.assertFalse(has_next)
+        tasks, _ = search_tasks(-CHAT_ID, "куп")
+        self.assertEqual([task[2] for task in tasks], ["купить хлеб"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import support
+from config import DATABASE_NAME
+
+MAIN_PATH = os.path.join(support.BOT_DIR, "main.py")
+
+
+# `main.py --check` в отдельном процессе: холодный старт интерпретатора, как при запуске из systemd/Docker
+class StartupCheckTest(support.DatabaseTestCase):
+    def _run_check(self, *python_options, **env):
+        environment = dict(os.environ, TOKEN="123456:test-token",
+                           STARTUP_BUDGET_SECONDS=os.environ.get("STARTUP_BUDGET_SECONDS", "1.0"))
+        environment.update(env)
+        return subprocess.run([sys.executable, *python_options, MAIN_PATH, "--check"], env=environment,
+                              capture_output=True, text=True, timeout=60)
+
+    def test_check_passes_within_startup_budget(self):
+        result = self._run_check()
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("OK", result.stdout)
+
+    def test_check_does_not_import_aiogram(self):
+        # -X importtime выводит в stderr каждый импортированный модуль
+        result = self._run_check("-X", "importtime")
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertNotIn("aiogram", result.stderr)
+
+    def test_check_fails_without_token(self):
+        result = self._run_check(TOKEN="")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("TOKEN is not set", result.stdout)
+
+    def test_check_reports_missing_database(self):
+        os.remove(DATABASE_NAME)
+        result = self._run_check()
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("cannot open database", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
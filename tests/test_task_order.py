@@ -0,0 +1,38 @@
+import sqlite3
+import unittest
+
+import support
+from config import DATABASE_NAME
+from db_utils import add_task, get_selection_page, get_tasks_for_user, set_task_priority
+
+
+# Меню выбора задачи показывает задачи в том же порядке, что и список задач, и без сортировки во временном B-дереве
+class SelectionOrderTest(support.DatabaseTestCase):
+    def test_selection_page_matches_task_list(self):
+        for number, priority in enumerate((3, 1, 2, 1, 3), start=1):
+            task_id, _ = add_task(7, f"задача {number}")
+            set_task_priority(task_id, 7, priority)
+
+        listed = [task[1] for task in get_tasks_for_user(7, filter_type="all", status_filter="active")]
+        first_page, _, has_next = get_selection_page(7, page=0, page_size=3)
+        second_page, _, _ = get_selection_page(7, page=1, page_size=3)
+
+        self.assertEqual(listed, [2, 4, 3, 1, 5])
+        self.assertTrue(has_next)
+        self.assertEqual([task[1] for task in first_page + second_page], listed)
+
+    def test_selection_page_uses_priority_index(self):
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            plan = " ".join(row[3] for row in conn.execute("""
+                EXPLAIN QUERY PLAN SELECT id, task_number, description, deadline FROM tasks
+                WHERE user_id = 7 AND status = 'active' ORDER BY priority, task_number LIMIT 4 OFFSET 0
+            """))
+        finally:
+            conn.close()
+        self.assertIn("idx_tasks_user_status_priority", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
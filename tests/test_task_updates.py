@@ -0,0 +1,45 @@
+import sqlite3
+import unittest
+from datetime import datetime
+
+import support
+from config import DATABASE_NAME
+from db_utils import (add_task, complete_task_by_number, get_reminder_candidates, refresh_user_stats,
+                      set_task_reminder_interval, update_task_deadline)
+
+
+# Запись из обработчиков кнопок, вынесенная в db_utils
+class TaskUpdatesTest(support.DatabaseTestCase):
+    def test_complete_task_by_number_counts_once(self):
+        add_task(7, "купить хлеб")
+        add_task(7, "позвонить")
+
+        self.assertEqual(complete_task_by_number(7, 2), ("позвонить", 1))
+        self.assertIsNone(complete_task_by_number(7, 2))
+        self.assertEqual(complete_task_by_number(7, 1), ("купить хлеб", 2))
+
+    def test_update_task_deadline_recomputes_overdue(self):
+        task_id, _ = add_task(7, "сдать отчёт", "2099-01-01")
+
+        self.assertTrue(update_task_deadline(task_id, 7, "2000-01-01"))
+        self.assertFalse(update_task_deadline(task_id, 8, "2000-01-01"))
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            self.assertEqual(conn.execute("SELECT deadline, overdue FROM tasks WHERE id = ?", (task_id,)).fetchone(),
+                             ("2000-01-01", 1))
+        finally:
+            conn.close()
+
+    def test_reminder_interval_makes_user_a_candidate(self):
+        today = datetime.now().strftime('%Y-%m-%d')
+        task_id, _ = add_task(7, "полить цветы", today)
+        refresh_user_stats(today)
+        self.assertEqual(get_reminder_candidates(today, "2999-01-01 00:00:00"), [])
+
+        set_task_reminder_interval(task_id, 7, 3)
+        candidates = get_reminder_candidates(today, "2999-01-01 00:00:00")
+        self.assertEqual([(user_id, interval_hours) for user_id, _, interval_hours, *_ in candidates], [(7, 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
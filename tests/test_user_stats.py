@@ -0,0 +1,101 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+
+import support
+from config import DATABASE_NAME
+from db_utils import (add_task, archive_old_tasks, check_user_stats, complete_task_by_number, get_user_counters,
+                      refresh_user_stats, restore_deleted_task, set_task_reminder_interval, soft_delete_task,
+                      update_task_deadline)
+from migrations import USER_STATS_COUNTERS
+
+
+# Счётчики user_stats поддерживаются триггерами; после любой последовательности изменений
+# они должны совпадать с пересчётом по таблице tasks
+class UserStatsTest(support.DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        self.tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def recount(self, user_id: int) -> dict:
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            return dict(zip(USER_STATS_COUNTERS, conn.execute("""
+                SELECT COUNT(*) FILTER (WHERE status = 'active'),
+                       COUNT(*) FILTER (WHERE status = 'active' AND overdue = 1),
+                       COUNT(*) FILTER (WHERE status = 'active' AND remind_me = 1 AND (deadline = :today OR overdue = 1)),
+                       COUNT(*) FILTER (WHERE status = 'active' AND remind_me = 1 AND overdue = 1),
+                       COUNT(*) FILTER (WHERE status = 'completed' AND completed_at LIKE :today || '%')
+                FROM tasks WHERE user_id = :user_id
+            """, {"today": self.today, "user_id": user_id}).fetchone()))
+        finally:
+            conn.close()
+
+    def stored(self, user_id: int) -> dict:
+        conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            row = conn.execute(f"SELECT stats_date, {', '.join(USER_STATS_COUNTERS)} FROM user_stats WHERE user_id = ?",
+                               (user_id,)).fetchone()
+        finally:
+            conn.close()
+        self.assertEqual(row[0], self.today)
+        return dict(zip(USER_STATS_COUNTERS, row[1:]))
+
+    def test_triggers_match_recount(self):
+        add_task(7, "завести счётчики")
+        refresh_user_stats(self.today)
+
+        due_id, _ = add_task(7, "сдать отчёт", self.today)
+        overdue_id, _ = add_task(7, "оплатить счёт", self.yesterday)
+        later_id, _ = add_task(7, "позвонить", self.tomorrow)
+        other_id, _ = add_task(8, "чужая задача", self.today)
+        for task_id, user_id in ((due_id, 7), (overdue_id, 7), (later_id, 7), (other_id, 8)):
+            set_task_reminder_interval(task_id, user_id, 2)
+        self.assertEqual(self.stored(7), self.recount(7))
+
+        update_task_deadline(later_id, 7, self.yesterday)
+        complete_task_by_number(7, 2)
+        soft_delete_task(overdue_id, 7)
+        self.assertEqual(self.stored(7), self.recount(7))
+
+        restore_deleted_task(overdue_id, 7, 5)
+        soft_delete_task(later_id, 7)
+        archive_old_tasks(completed_before=self.tomorrow, deleted_before=self.tomorrow)
+        self.assertEqual(self.stored(7), self.recount(7))
+        # Восстановленная задача возвращается без напоминания (удаление сбрасывает remind_me)
+        self.assertEqual(self.recount(7), {"active_count": 2, "overdue_count": 1, "remind_due_count": 0,
+                                           "remind_overdue_count": 0, "completed_today_count": 0})
+        self.assertEqual(check_user_stats(self.today), [])
+
+    def test_check_user_stats_repairs_drift(self):
+        add_task(7, "сдать отчёт", self.today)
+        add_task(8, "позвонить")
+        refresh_user_stats(self.today)
+        expected = self.recount(7)
+
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.execute("UPDATE user_stats SET active_count = active_count + 5 WHERE user_id = 7")
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(check_user_stats(self.today, repair=False), [7])
+        self.assertEqual(check_user_stats(self.today), [7])
+        self.assertEqual(self.stored(7), expected)
+        self.assertEqual(check_user_stats(self.today), [])
+
+    def test_get_user_counters_recounts_stale_row(self):
+        add_task(7, "сдать отчёт", self.today)
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.execute("UPDATE user_stats SET stats_date = ?, active_count = 40 WHERE user_id = 7", (self.yesterday,))
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(get_user_counters(7), self.recount(7))
+        self.assertEqual(self.stored(7), self.recount(7))
+        self.assertEqual(get_user_counters(9), dict.fromkeys(USER_STATS_COUNTERS, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
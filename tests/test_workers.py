@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import support  # noqa: F401 — путь к модулям бота
+from aiogram import types
+
+import workers
+
+ADMIN_ID = 42
+USER_ID = 1001
+
+
+def make_update(user_id: int, text: str) -> types.Update:
+    user = types.User(id=user_id, is_bot=False, first_name="Test")
+    chat = types.Chat(id=user_id, type="private")
+    return types.Update(update_id=1, message=types.Message(message_id=1, date=datetime.now(), chat=chat,
+                                                           from_user=user, text=text))
+
+
+# Основной процесс сам выполняет /profile администратора, остальные апдейты уходят воркерам
+class FrontDispatchTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = workers.WorkerPool(2, build_dispatcher=None)
+        self.pool._queues = [mock.Mock(), mock.Mock()]
+        patcher = mock.patch.object(workers, "ADMIN_IDS", {ADMIN_ID})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _dispatch(self, update: types.Update):
+        handler = mock.AsyncMock(return_value="handled")
+        data = {"event_from_user": update.message.from_user}
+        return asyncio.run(self.pool.dispatch(handler, update, data)), handler
+
+    def test_admin_profile_command_runs_in_front_process(self):
+        result, handler = self._dispatch(make_update(ADMIN_ID, "/profile@todo_bot 5"))
+        self.assertEqual(result, "handled")
+        handler.assert_awaited_once()
+        for updates in self.pool._queues:
+            updates.put.assert_not_called()
+
+    def test_other_updates_go_to_worker_by_user_id(self):
+        for user_id, text in ((USER_ID, "/profile"), (ADMIN_ID, "/list_tasks"), (ADMIN_ID, "profile")):
+            result, handler = self._dispatch(make_update(user_id, text))
+            handler.assert_not_awaited()
+            self.pool._queues[user_id % 2].put.assert_called()
+
+
+if __name__ == "__main__":
+    unittest.main()